@@ -17,55 +17,135 @@ product type names to their corresponding classes. Without this registration,
 the orchestrator would not be able to recognise or manage these product types and
 thus would not be able to handle subscriptions related to them. No registration
 means no building a workflow for them.
+
+Product types are registered lazily: the registry only knows the dotted path of
+each product type, and its module (with all of its product blocks) is imported
+the first time the product is looked up. A worker or CLI tool that handles one
+product therefore does not pay for importing and building every other model.
+Processes that need all of them, such as the API (GraphQL schema, fixed input
+endpoints) and the domain model migrations, call `register_all()` at startup.
 """
 
-from orchestrator.domain import SUBSCRIPTION_MODEL_REGISTRY
-
-from products.product_types.core_link import CoreLink
-from products.product_types.core_port import CorePort
-from products.product_types.ip_prefix import IpPrefix
-from products.product_types.ipt_static import IPTStatic
-from products.product_types.ipt_ebgp import IPTeBGP
-from products.product_types.ipt_vrrp import IPTVRRP
-from products.product_types.commodity_ip import CommodityIP
-from products.product_types.l2vpn_pp import L2vpnPP
-from products.product_types.l2vpn_vv import L2vpnVV
-from products.product_types.l2vpn_pv import L2vpnPV
-from products.product_types.l2vpn_vv_translation import L2vpnVVTranslation
-from products.product_types.l3vpn import L3vpn
-from products.product_types.node import Node
-from products.product_types.port import Port
-from products.product_types.lag_port import LAGPort
-from products.product_types.core_lag_port import CoreLAGPort
-
-
-SUBSCRIPTION_MODEL_REGISTRY.update(
-    {
-        "node Juniper": Node,
-        "node Arista": Node,
-        "port 1G": Port,
-        "port 10G": Port,
-        "port 40G": Port,
-        "port 100G": Port,
-        "port 400G": Port,
-        "LAG Port": LAGPort,
-        "core port 1G": CorePort,
-        "core port 10G": CorePort,
-        "core port 40G": CorePort,
-        "core port 100G": CorePort,
-        "core port 400G": CorePort,
-        "core link": CoreLink,
-        "core LAG port": CoreLAGPort,
-        "IPT static": IPTStatic,
-        "IPT eBGP": IPTeBGP,
-        "IPT VRRP": IPTVRRP,
-        "Commodity IP": CommodityIP,
-        "L2VPN Port-to-Port": L2vpnPP,
-        "L2VPN VLAN-to-VLAN": L2vpnVV,
-        "L2VPN Port-to-VLAN": L2vpnPV,
-        "L2VPN with VLAN translation": L2vpnVVTranslation,
-        "L3 VPN": L3vpn,
-        "IPv4 Prefix (LIR Allocation)": IpPrefix,
-        "IPv6 Prefix (LIR Allocation)": IpPrefix,
-    }
-)
+from importlib import import_module
+from typing import Any, Dict, Iterator, Optional, Type
+
+import orchestrator.domain
+from orchestrator.domain import SUBSCRIPTION_MODEL_REGISTRY, SubscriptionModel
+
+PRODUCT_TYPE_PATHS: Dict[str, str] = {
+    "node Juniper": "products.product_types.node:Node",
+    "node Arista": "products.product_types.node:Node",
+    "port 1G": "products.product_types.port:Port",
+    "port 10G": "products.product_types.port:Port",
+    "port 40G": "products.product_types.port:Port",
+    "port 100G": "products.product_types.port:Port",
+    "port 400G": "products.product_types.port:Port",
+    "LAG Port": "products.product_types.lag_port:LAGPort",
+    "core port 1G": "products.product_types.core_port:CorePort",
+    "core port 10G": "products.product_types.core_port:CorePort",
+    "core port 40G": "products.product_types.core_port:CorePort",
+    "core port 100G": "products.product_types.core_port:CorePort",
+    "core port 400G": "products.product_types.core_port:CorePort",
+    "core link": "products.product_types.core_link:CoreLink",
+    "core LAG port": "products.product_types.core_lag_port:CoreLAGPort",
+    "IPT static": "products.product_types.ipt_static:IPTStatic",
+    "IPT eBGP": "products.product_types.ipt_ebgp:IPTeBGP",
+    "IPT VRRP": "products.product_types.ipt_vrrp:IPTVRRP",
+    "Commodity IP": "products.product_types.commodity_ip:CommodityIP",
+    "L2VPN Port-to-Port": "products.product_types.l2vpn_pp:L2vpnPP",
+    "L2VPN VLAN-to-VLAN": "products.product_types.l2vpn_vv:L2vpnVV",
+    "L2VPN Port-to-VLAN": "products.product_types.l2vpn_pv:L2vpnPV",
+    "L2VPN with VLAN translation": "products.product_types.l2vpn_vv_translation:L2vpnVVTranslation",
+    "L3 VPN": "products.product_types.l3vpn:L3vpn",
+    "IPv4 Prefix (LIR Allocation)": "products.product_types.ip_prefix:IpPrefix",
+    "IPv6 Prefix (LIR Allocation)": "products.product_types.ip_prefix:IpPrefix",
+}
+
+
+class LazySubscriptionModelRegistry(dict):
+    """Subscription model registry that imports product types on first lookup.
+
+    Resolved product types are also written to the orchestrator's own registry
+    dict, so code that imported that dict directly sees them as well.
+    """
+
+    def __init__(self, registry: Dict[str, Type[SubscriptionModel]], paths: Dict[str, str]) -> None:
+        super().__init__(registry)
+        self._registry = registry
+        self._paths = dict(paths)
+
+    def _resolve(self, name: str) -> Type[SubscriptionModel]:
+        module_name, _, class_name = self._paths[name].partition(":")
+        model = getattr(import_module(module_name), class_name)
+        super().__setitem__(name, model)
+        self._registry[name] = model
+        return model
+
+    def __missing__(self, name: str) -> Type[SubscriptionModel]:
+        if name in self._paths:
+            return self._resolve(name)
+        # Registered on the orchestrator's registry after this one was installed
+        return self._registry[name]
+
+    def __setitem__(self, name: str, model: Type[SubscriptionModel]) -> None:
+        super().__setitem__(name, model)
+        self._registry[name] = model
+
+    def __contains__(self, name: object) -> bool:
+        return super().__contains__(name) or name in self._paths or name in self._registry
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def get(self, name: str, default: Any = None) -> Optional[Type[SubscriptionModel]]:  # type: ignore[override]
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):  # type: ignore[no-untyped-def]
+        return (dict.fromkeys(super().keys()) | dict.fromkeys(self._paths) | dict.fromkeys(self._registry)).keys()
+
+    def values(self):  # type: ignore[no-untyped-def]
+        self.resolve_all()
+        return super().values()
+
+    def items(self):  # type: ignore[no-untyped-def]
+        self.resolve_all()
+        return super().items()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for name, model in dict(*args, **kwargs).items():
+            self[name] = model
+
+    def is_resolved(self, name: str) -> bool:
+        return super().__contains__(name)
+
+    def resolve_all(self) -> None:
+        """Import every product type and copy models registered elsewhere."""
+        for name in self._paths:
+            if not super().__contains__(name):
+                self._resolve(name)
+        for name, model in self._registry.items():
+            if not super().__contains__(name):
+                super().__setitem__(name, model)
+
+
+if not isinstance(SUBSCRIPTION_MODEL_REGISTRY, LazySubscriptionModelRegistry):
+    orchestrator.domain.SUBSCRIPTION_MODEL_REGISTRY = LazySubscriptionModelRegistry(  # type: ignore[misc]
+        SUBSCRIPTION_MODEL_REGISTRY, PRODUCT_TYPE_PATHS
+    )
+
+
+def register_all() -> None:
+    """Import all product types and register them in the orchestrator's registry.
+
+    Needed in processes that iterate over the registry, as parts of the
+    orchestrator hold on to the original registry dict.
+    """
+    registry = orchestrator.domain.SUBSCRIPTION_MODEL_REGISTRY
+    if isinstance(registry, LazySubscriptionModelRegistry):
+        registry.resolve_all()
@@ -16,7 +16,7 @@
 from orchestrator.domain.base import ProductBlockModel
 from orchestrator.types import SubscriptionLifecycle
 from pydantic import computed_field
-from services.netbox import get_ip_address
+from products.services.external_calls import netbox
 
 
 class IPTVRRPConfigInactive(ProductBlockModel, product_block_name="IPTVRRPConfig"):
@@ -64,7 +64,7 @@ class IPTVRRPConfigProvisioning(
                 return "v6 VIP not set yet"
 
             v6_addr = str(
-                get_ip_address(id=self.vrrp_vip_ipv6_addr_id).address.split("/")[0]
+                netbox.get_ip_address(id=self.vrrp_vip_ipv6_addr_id).address.split("/")[0]
             )
             return (v6_addr.replace("::", ":")).replace("2001:", "fe80::")
         else:
@@ -89,11 +89,11 @@ class IPTVRRPConfig(
         """
         generate link local v6 address from vrrp_vip_ipv6_addr
         """
-        if self.vrrp_vip_ipv6_addr_id and get_ip_address(id=self.vrrp_vip_ipv6_addr_id):
+        if self.vrrp_vip_ipv6_addr_id and netbox.get_ip_address(id=self.vrrp_vip_ipv6_addr_id):
             # example if v6 addr is 2001:770:50::1
             # should return fe80::770:50:1
             v6_addr = str(
-                get_ip_address(id=self.vrrp_vip_ipv6_addr_id).address.split("/")[0]
+                netbox.get_ip_address(id=self.vrrp_vip_ipv6_addr_id).address.split("/")[0]
             )
             return (v6_addr.replace("::", ":")).replace("2001:", "fe80::")
         else:
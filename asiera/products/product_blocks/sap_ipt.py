@@ -16,7 +16,6 @@
 from orchestrator.domain.base import ProductBlockModel
 from orchestrator.types import SubscriptionLifecycle
 from pydantic import computed_field
-from services.netbox import get_ip_address
 
 from products.product_blocks.port import (
     PortBlock,
@@ -28,6 +27,7 @@ from products.product_blocks.lag_port import (
     LAGPortBlockInactive,
     LAGPortBlockProvisioning,
 )
+from products.services.external_calls import netbox
 
 
 class SAPIPTBlockInactive(ProductBlockModel, product_block_name="SAPIPT"):
@@ -73,7 +73,7 @@ class SAPIPTBlockProvisioning(SAPIPTBlockInactive, lifecycle=[SubscriptionLifecy
         # example if v6 addr is 2001:770:50::4/64
         # should return fe80::770:50:4/64
         if self.ipv6_ipam_id:
-            v6_addr = str(get_ip_address(id=self.ipv6_ipam_id))
+            v6_addr = str(netbox.get_ip_address(id=self.ipv6_ipam_id))
             return (v6_addr.replace("::", ":")).replace("2001:", "fe80::")
         return None
 
@@ -99,6 +99,6 @@ class SAPIPTBlock(SAPIPTBlockProvisioning, lifecycle=[SubscriptionLifecycle.ACTI
         # example if v6 addr is 2001:770:50::4/64
         # should return fe80::770:50:4/64
         if self.ipv6_ipam_id:
-            v6_addr = str(get_ip_address(id=self.ipv6_ipam_id))
+            v6_addr = str(netbox.get_ip_address(id=self.ipv6_ipam_id))
             return (v6_addr.replace("::", ":")).replace("2001:", "fe80::")
         return None
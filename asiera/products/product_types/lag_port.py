@@ -17,7 +17,7 @@ from typing import Annotated
 from annotated_types import Len
 from orchestrator.domain.base import SubscriptionModel
 from orchestrator.types import SI, SubscriptionLifecycle
-from services import netbox
+from products.services.external_calls import netbox
 
 from products.product_blocks.port import (
     PortBlock,
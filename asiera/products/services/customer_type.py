@@ -12,7 +12,7 @@ from orchestrator.graphql.schemas.subscription import (
     SubscriptionInterface,
 )
 from orchestrator.graphql.utils.override_class import override_class
-from services import netbox
+from products.services.external_calls import netbox
 
 
 async def resolve_customer(root: CustomerType) -> CustomerType:
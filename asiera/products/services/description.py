@@ -40,7 +40,7 @@ from products.product_types.node import NodeProvisioning
 from products.product_types.port import PortProvisioning
 from products.product_types.lag_port import LAGPortInactive
 from products.services.title import title
-from services import netbox
+from products.services.external_calls import netbox
 from utils.singledispatch import single_dispatch_base
 
 # for debug logging
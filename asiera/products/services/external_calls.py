@@ -0,0 +1,221 @@
+# Copyright 2019-2023 SURF.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Instrumentation of the NetBox lookups made by the product models and services.
+
+Product types, product blocks and services use `netbox` from this module instead of `services.netbox`::
+
+    from products.services.external_calls import netbox
+
+    netbox.get_device(name=node_name)
+
+Every `get_*` call is timed and recorded in `REGISTRY` by function and calling function, and logged with structlog at
+debug level. `REGISTRY.render()` returns the metrics in the Prometheus text format. Everything else (the payload
+classes) is passed through unchanged.
+
+Tests can limit the number of lookups a code path makes, so that an N+1 regression fails::
+
+    with call_budget(2):
+        title(subscription)
+"""
+
+import sys
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from importlib import import_module
+from threading import Lock
+from types import FrameType
+from typing import Any
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CallBudgetExceeded(RuntimeError):
+    """A code path made more external calls than its `call_budget` allows."""
+
+
+@dataclass
+class CallStats:
+    count: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def observe(self, seconds: float, error: bool) -> None:
+        self.count += 1
+        self.errors += error
+        self.seconds += seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+class MetricsRegistry:
+    """Count, errors and latency histogram of external calls, by system, function and calling function."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._stats: dict[tuple[str, str, str], CallStats] = {}
+
+    def observe(self, system: str, function: str, caller: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._stats.setdefault((system, function, caller), CallStats()).observe(seconds, error)
+
+    def snapshot(self) -> dict[tuple[str, str, str], CallStats]:
+        with self._lock:
+            return {key: CallStats(s.count, s.errors, s.seconds, list(s.buckets)) for key, s in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP external_calls_total External calls made by the product models and services.",
+            "# TYPE external_calls_total counter",
+        ]
+        snapshot = self.snapshot()
+        for (system, function, caller), stats in sorted(snapshot.items()):
+            labels = f'system="{system}",function="{function}",caller="{caller}"'
+            lines.append(f"external_calls_total{{{labels}}} {stats.count}")
+        lines += [
+            "# HELP external_call_errors_total External calls that raised an exception.",
+            "# TYPE external_call_errors_total counter",
+        ]
+        for (system, function, caller), stats in sorted(snapshot.items()):
+            labels = f'system="{system}",function="{function}",caller="{caller}"'
+            lines.append(f"external_call_errors_total{{{labels}}} {stats.errors}")
+        lines += [
+            "# HELP external_call_duration_seconds Duration of external calls.",
+            "# TYPE external_call_duration_seconds histogram",
+        ]
+        for (system, function, caller), stats in sorted(snapshot.items()):
+            labels = f'system="{system}",function="{function}",caller="{caller}"'
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), "+Inf"], stats.buckets):
+                cumulative += count
+                lines.append(f'external_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"external_call_duration_seconds_sum{{{labels}}} {stats.seconds}")
+            lines.append(f"external_call_duration_seconds_count{{{labels}}} {stats.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@dataclass
+class CallBudget:
+    limit: int
+    system: str | None = None
+    calls: list[tuple[str, str, str]] = field(default_factory=list)
+
+    @property
+    def exceeded(self) -> bool:
+        return len(self.calls) > self.limit
+
+    def record(self, system: str, function: str, caller: str) -> None:
+        if self.system is None or self.system == system:
+            self.calls.append((system, function, caller))
+            if self.exceeded:
+                raise CallBudgetExceeded(self.message())
+
+    def message(self) -> str:
+        calls = "\n".join(f"  {system}.{function} from {caller}" for system, function, caller in self.calls)
+        return f"{len(self.calls)} external calls, the budget is {self.limit}:\n{calls}"
+
+
+_budgets: ContextVar[tuple[CallBudget, ...]] = ContextVar("external_call_budgets", default=())
+
+
+@contextmanager
+def call_budget(limit: int, system: str | None = None) -> Iterator[CallBudget]:
+    """Raise `CallBudgetExceeded` when the block makes more than `limit` external calls (to `system`, or any).
+
+    The call that exceeds the budget raises, and so does the end of the block, in case the code path caught the
+    exception itself.
+    """
+    budget = CallBudget(limit, system)
+    token = _budgets.set((*_budgets.get(), budget))
+    try:
+        yield budget
+    finally:
+        _budgets.reset(token)
+    if budget.exceeded:
+        raise CallBudgetExceeded(budget.message())
+
+
+def _caller(frame: FrameType | None) -> str:
+    if frame is None:
+        return "unknown"
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def instrumented(system: str, function: str, call: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap `call` to record every call in `REGISTRY`, the active call budgets and the log."""
+
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        caller = _caller(sys._getframe(1))
+        for budget in _budgets.get():
+            budget.record(system, function, caller)
+        start = time.perf_counter()
+        error = False
+        try:
+            return call(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            REGISTRY.observe(system, function, caller, seconds, error)
+            logger.debug(
+                "External call", system=system, function=function, caller=caller, seconds=seconds, error=error
+            )
+
+    wrapper.__name__ = function
+    wrapper.__wrapped__ = call  # type: ignore[attr-defined]
+    return wrapper
+
+
+class InstrumentedClient:
+    """The functions of a client module, with the lookups (`get_*`) instrumented.
+
+    The module is imported on first use and its attributes are looked up on every access, so replacing a function of
+    the module (in tests) also replaces it here.
+    """
+
+    def __init__(self, system: str, module_name: str, prefix: str = "get_") -> None:
+        self._system = system
+        self._module_name = module_name
+        self._prefix = prefix
+        self._wrappers: dict[str, tuple[Any, Callable[..., Any]]] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(import_module(self._module_name), name)
+        if not name.startswith(self._prefix) or isinstance(value, type) or not callable(value):
+            return value
+        cached = self._wrappers.get(name)
+        if cached is None or cached[0] is not value:
+            cached = self._wrappers[name] = (value, instrumented(self._system, name, value))
+        return cached[1]
+
+
+netbox: Any = InstrumentedClient("netbox", "services.netbox")
@@ -40,7 +40,7 @@ from products.services.netbox.payload.l2vpn_pp import build_l2vpn_payload
 from products.services.netbox.payload.node import build_node_payload
 from products.services.netbox.payload.port import build_port_payload
 from products.services.netbox.payload.sap import build_sap_payload
-from services import netbox
+from products.services.external_calls import netbox
 from utils.singledispatch import single_dispatch_base
 
 
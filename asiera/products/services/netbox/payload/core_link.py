@@ -15,7 +15,7 @@
 from orchestrator.domain import SubscriptionModel
 
 from products.product_blocks.core_virtual_circuit import CoreVirtualCircuitBlockProvisioning
-from services import netbox
+from products.services.external_calls import netbox
 
 
 def build_core_link_payload(
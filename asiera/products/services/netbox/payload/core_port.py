@@ -15,7 +15,7 @@
 from orchestrator.domain import SubscriptionModel
 
 from products.product_blocks.core_port import CorePortBlockProvisioning
-from services import netbox
+from products.services.external_calls import netbox
 
 import structlog
 
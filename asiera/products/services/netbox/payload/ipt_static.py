@@ -16,7 +16,7 @@ from orchestrator.domain import SubscriptionModel
 
 from products.product_types.ipt_static import IPTStaticProvisioning
 from products.services.description import description
-from services import netbox
+from products.services.external_calls import netbox
 
 
 def build_ipt_static_payload(
@@ -18,7 +18,7 @@ from products.product_blocks.l2vpn_pp_virtual_circuit import (
     L2vpnPPVirtualCircuitBlockProvisioning,
 )
 from products.services.description import description
-from services import netbox
+from products.services.external_calls import netbox
 
 
 def build_l2vpn_payload(
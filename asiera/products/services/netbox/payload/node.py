@@ -15,7 +15,7 @@
 from orchestrator.domain import SubscriptionModel
 
 from products.product_blocks.node import NodeBlockProvisioning
-from services import netbox
+from products.services.external_calls import netbox
 
 
 def build_node_payload(
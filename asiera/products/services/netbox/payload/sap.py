@@ -15,7 +15,7 @@
 from orchestrator.domain import SubscriptionModel
 
 from products.product_blocks.sap import SAPBlockProvisioning
-from services import netbox
+from products.services.external_calls import netbox
 from products.services.title import title
 
 
@@ -0,0 +1,405 @@
+# Copyright 2019-2023 SURF.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory allocation of LIR prefixes from the NetBox aggregates.
+
+An IP Prefix subscription takes a prefix of `prefix_length` from the aggregate `aggregate_block` and stores it as
+`assigned_ip_prefix`. Asking NetBox for the next free prefix takes a request per prefix, and NetBox only offers the
+first free one. `PrefixAllocator` keeps a binary trie per aggregate with the prefixes of all IP Prefix subscriptions,
+built with one query, and allocates from it:
+
+    allocator = PrefixAllocator.from_db()
+    prefix = allocator.allocate(aggregate_id, 29)  # best fit: the smallest free block the /29 fits in
+    prefixes = allocator.allocate_many([(aggregate_id, 29), (aggregate_id, 24)])  # all or none
+    allocator.fragmentation(aggregate_id)
+
+Every trie node keeps a bitmask of the sizes (prefix lengths) of the free blocks below it, so finding the first or
+the best fitting free block is one walk down the trie. The prefixes of the aggregates come from NetBox, or from a
+mapping of aggregate id to prefix (for example a local stand-in of NetBox).
+
+Allocations only live in the memory of the process. `allocate`, `reserve` and `release` do not write to the database
+and are not part of its transaction: a workflow step that allocates a prefix and then fails must `release` it, a prefix
+released in memory stays in its subscription until that is changed, and other processes only see the allocation once
+the subscription is stored and they build their allocator again.
+"""
+
+import threading
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from ipaddress import IPv4Network, IPv6Network, ip_network
+from typing import NamedTuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import (
+    ProductBlockTable,
+    ResourceTypeTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from products.product_blocks.ip_prefix import IpPrefixBlockInactive
+from products.services.external_calls import netbox
+
+logger = structlog.get_logger(__name__)
+
+Network = IPv4Network | IPv6Network
+
+FIRST_FIT = "first_fit"
+BEST_FIT = "best_fit"
+STRATEGIES = (FIRST_FIT, BEST_FIT)
+
+
+class Allocation(NamedTuple):
+    aggregate_id: int
+    prefix: Network
+    # None for prefixes allocated in this process that are not in a subscription yet
+    subscription_id: UUID | None
+
+
+class Fragmentation(NamedTuple):
+    aggregate: Network
+    allocated: int
+    used_addresses: int
+    free_addresses: int
+    free_blocks: int
+    # Prefix length of the largest free block, None when the aggregate is full
+    largest_free: int | None
+    # 1 - (largest free block / free addresses): 0 when all free addresses are in one block
+    fragmentation: float
+
+
+class _Node:
+    __slots__ = ("allocation", "children", "sizes")
+
+    def __init__(self) -> None:
+        self.allocation: Allocation | None = None
+        self.children: list[_Node | None] = [None, None]
+        # Bit n set when a free block of prefix length n is below this node
+        self.sizes = 0
+
+
+class AggregateTrie:
+    """The allocated prefixes of one aggregate, as a binary trie.
+
+    A node exists for every allocated prefix and for every prefix with allocations inside it; a missing child is a
+    free block.
+    """
+
+    def __init__(self, aggregate_id: int, aggregate: Network) -> None:
+        self.aggregate_id = aggregate_id
+        self.aggregate = aggregate
+        self.bits = aggregate.max_prefixlen
+        self.root = _Node()
+        self.count = 0
+        self._update(self.root, aggregate.prefixlen)
+
+    def _bit(self, value: int, position: int) -> int:
+        return (value >> (self.bits - position - 1)) & 1
+
+    def _update(self, node: _Node, length: int) -> None:
+        if node.allocation is not None:
+            node.sizes = 0
+        elif node is self.root and node.children == [None, None]:
+            node.sizes = 1 << length
+        else:
+            node.sizes = 0
+            for child in node.children:
+                node.sizes |= 1 << (length + 1) if child is None else child.sizes
+
+    def _check(self, prefix: Network) -> None:
+        if prefix.version != self.aggregate.version or not prefix.subnet_of(self.aggregate):  # type: ignore[arg-type]
+            raise ValueError(f"{prefix} is not part of aggregate {self.aggregate}")
+
+    def _fits(self, length: int) -> int:
+        """The mask of the free block sizes a prefix of `length` fits in."""
+        return (1 << (length + 1)) - 1
+
+    def allocated(self, prefix: Network) -> Allocation | None:
+        """The allocation of exactly `prefix`."""
+        self._check(prefix)
+        node: _Node | None = self.root
+        value = int(prefix.network_address)
+        for position in range(self.aggregate.prefixlen, prefix.prefixlen):
+            if node is None:
+                return None
+            node = node.children[self._bit(value, position)]
+        return node.allocation if node is not None else None
+
+    def reserve(self, prefix: Network, subscription_id: UUID | None = None) -> Allocation:
+        """Mark `prefix` as allocated.
+
+        Raises:
+            ValueError: when `prefix` is not in the aggregate or overlaps an allocated prefix.
+
+        """
+        self._check(prefix)
+        value = int(prefix.network_address)
+        path = [self.root]
+        for position in range(self.aggregate.prefixlen, prefix.prefixlen):
+            node = path[-1]
+            if node.allocation is not None:
+                raise ValueError(f"{prefix} overlaps allocated prefix {node.allocation.prefix}")
+            bit = self._bit(value, position)
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = _Node()
+            path.append(child)
+        node = path[-1]
+        if node.allocation is not None or node.children != [None, None]:
+            self._prune(path, prefix.prefixlen)
+            raise ValueError(f"{prefix} overlaps an allocated prefix")
+        node.allocation = Allocation(self.aggregate_id, prefix, subscription_id)
+        self.count += 1
+        self._prune(path, prefix.prefixlen)
+        return node.allocation
+
+    def release(self, prefix: Network) -> Allocation | None:
+        """Free an allocated prefix, returns its allocation."""
+        self._check(prefix)
+        value = int(prefix.network_address)
+        path = [self.root]
+        for position in range(self.aggregate.prefixlen, prefix.prefixlen):
+            child = path[-1].children[self._bit(value, position)]
+            if child is None:
+                return None
+            path.append(child)
+        allocation, path[-1].allocation = path[-1].allocation, None
+        if allocation is not None:
+            self.count -= 1
+        self._prune(path, prefix.prefixlen)
+        return allocation
+
+    def _prune(self, path: list[_Node], length: int) -> None:
+        """Drop the nodes of `path` (ending at prefix length `length`) without allocations, and update the sizes."""
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and node.allocation is None and node.children == [None, None]:
+                parent = path[depth - 1]
+                parent.children[parent.children.index(node)] = None
+            self._update(node, length - (len(path) - 1 - depth))
+
+    def find(self, length: int, strategy: str = BEST_FIT) -> Network | None:
+        """The free prefix of `length` to allocate, None when none is free.
+
+        First fit takes the lowest free prefix. Best fit takes the lowest prefix from the smallest free block it fits
+        in, which keeps the large free blocks whole.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Allocation strategy must be one of {', '.join(STRATEGIES)}, not {strategy!r}")
+        if not self.aggregate.prefixlen <= length <= self.bits:
+            raise ValueError(f"A /{length} does not fit in aggregate {self.aggregate}")
+        wanted = self.root.sizes & self._fits(length)
+        if not wanted:
+            return None
+        if strategy == BEST_FIT:
+            wanted = 1 << (wanted.bit_length() - 1)
+        node: _Node | None = self.root
+        value = int(self.aggregate.network_address)
+        position = self.aggregate.prefixlen
+        # Follow the lowest child with a wanted free block, down to the free block (a missing child)
+        while node is not None and not (node is self.root and node.children == [None, None]):
+            for bit, child in enumerate(node.children):
+                sizes = 1 << (position + 1) if child is None else child.sizes
+                if sizes & wanted:
+                    value |= bit << (self.bits - position - 1)
+                    node = child
+                    break
+            position += 1
+        return ip_network((value, length))
+
+    def free_blocks(self) -> Iterator[Network]:
+        """The free blocks, in address order."""
+        if self.root.children == [None, None] and self.root.allocation is None:
+            yield self.aggregate
+            return
+        stack: list[tuple[_Node | None, int, int]] = [
+            (self.root, int(self.aggregate.network_address), self.aggregate.prefixlen)
+        ]
+        while stack:
+            node, value, length = stack.pop()
+            if node is None:
+                yield ip_network((value, length))
+                continue
+            if node.allocation is not None:
+                continue
+            stack.append((node.children[1], value | 1 << (self.bits - length - 1), length + 1))
+            stack.append((node.children[0], value, length + 1))
+
+    def allocations(self) -> Iterator[Allocation]:
+        """The allocated prefixes, in address order."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.allocation is not None:
+                yield node.allocation
+            stack.extend(child for child in reversed(node.children) if child is not None)
+
+    def fragmentation(self) -> Fragmentation:
+        free = list(self.free_blocks())
+        free_addresses = sum(block.num_addresses for block in free)
+        largest = min((block.prefixlen for block in free), default=None)
+        return Fragmentation(
+            aggregate=self.aggregate,
+            allocated=self.count,
+            used_addresses=self.aggregate.num_addresses - free_addresses,
+            free_addresses=free_addresses,
+            free_blocks=len(free),
+            largest_free=largest,
+            fragmentation=1 - (2 ** (self.bits - largest)) / free_addresses if largest is not None else 0.0,
+        )
+
+
+class PrefixAllocator:
+    """Free and allocated prefixes per NetBox aggregate, in memory (see the module docstring).
+
+    Example:
+    ```python
+    allocator = PrefixAllocator.from_db()
+    prefix = allocator.allocate(ip_prefix.aggregate_block, ip_prefix.prefix_length)
+    ```
+    """
+
+    def __init__(self, aggregates: Mapping[int, str | Network]) -> None:
+        self._lock = threading.Lock()
+        self._tries = {
+            aggregate_id: AggregateTrie(aggregate_id, ip_network(prefix)) for aggregate_id, prefix in aggregates.items()
+        }
+
+    def trie(self, aggregate_id: int) -> AggregateTrie:
+        try:
+            return self._tries[aggregate_id]
+        except KeyError:
+            raise ValueError(f"Unknown aggregate {aggregate_id}") from None
+
+    def reserve(self, aggregate_id: int, prefix: str | Network, subscription_id: UUID | None = None) -> Allocation:
+        """Mark a prefix (of a subscription) as allocated."""
+        with self._lock:
+            return self.trie(aggregate_id).reserve(ip_network(prefix), subscription_id)
+
+    def release(self, aggregate_id: int, prefix: str | Network) -> Allocation | None:
+        with self._lock:
+            return self.trie(aggregate_id).release(ip_network(prefix))
+
+    def allocate(self, aggregate_id: int, prefix_length: int, strategy: str = BEST_FIT) -> Network:
+        """Take a free prefix of `prefix_length` from an aggregate.
+
+        Raises:
+            ValueError: when no prefix of that length is free.
+
+        """
+        return self.allocate_many([(aggregate_id, prefix_length)], strategy)[0]
+
+    def allocate_many(self, requests: Iterable[tuple[int, int]], strategy: str = BEST_FIT) -> list[Network]:
+        """Take a free prefix for each (aggregate id, prefix length), all of them or none.
+
+        Raises:
+            ValueError: when one of the prefixes can not be allocated; the others are released again.
+
+        """
+        allocated: list[tuple[AggregateTrie, Network]] = []
+        with self._lock:
+            try:
+                for aggregate_id, prefix_length in requests:
+                    trie = self.trie(aggregate_id)
+                    prefix = trie.find(prefix_length, strategy)
+                    if prefix is None:
+                        raise ValueError(f"No free /{prefix_length} left in aggregate {trie.aggregate}")
+                    trie.reserve(prefix)
+                    allocated.append((trie, prefix))
+            except ValueError:
+                for trie, prefix in allocated:
+                    trie.release(prefix)
+                raise
+        return [prefix for _, prefix in allocated]
+
+    def fragmentation(self, aggregate_id: int | None = None) -> list[Fragmentation]:
+        """Fragmentation of one or all aggregates."""
+        with self._lock:
+            tries = [self.trie(aggregate_id)] if aggregate_id is not None else list(self._tries.values())
+            return [trie.fragmentation() for trie in tries]
+
+    @classmethod
+    def from_db(
+        cls, aggregates: Mapping[int, str | Network] | Callable[[int], str] | None = None
+    ) -> "PrefixAllocator":
+        """Build the allocator from the prefixes of all IP Prefix subscriptions that are not terminated.
+
+        Args:
+            aggregates: The prefix of each aggregate by NetBox id, or a function returning it. When None, the
+                aggregates the subscriptions use are looked up in NetBox.
+
+        """
+        prefixes = load_allocations()
+        if aggregates is None or callable(aggregates):
+            resolve = aggregates or netbox_aggregate
+            aggregates = {aggregate_id: resolve(aggregate_id) for aggregate_id in sorted({a for a, _, _ in prefixes})}
+        allocator = cls(aggregates)
+        with allocator._lock:
+            for aggregate_id, prefix, subscription_id in prefixes:
+                try:
+                    allocator.trie(aggregate_id).reserve(prefix, subscription_id)
+                except ValueError as exc:
+                    logger.warning("Conflicting IP prefix in database", subscription_id=subscription_id, error=str(exc))
+        logger.debug("Built prefix allocator", aggregates=len(allocator._tries), prefixes=len(prefixes))
+        return allocator
+
+
+def netbox_aggregate(aggregate_id: int) -> str:
+    return str(netbox.get_aggregate(id=aggregate_id).prefix)
+
+
+def load_allocations() -> list[Allocation]:
+    """Read aggregate_block and assigned_ip_prefix of all IP Prefix subscriptions that are not terminated.
+
+    Blocks without an assigned prefix yet are left out. Host bits in an assigned prefix are ignored, and blocks whose
+    values can not be read are logged and left out.
+    """
+    resource_types = ("aggregate_block", "assigned_ip_prefix")
+    stmt = (
+        select(
+            SubscriptionInstanceTable.subscription_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(SubscriptionTable, SubscriptionTable.subscription_id == SubscriptionInstanceTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .join(
+            SubscriptionInstanceValueTable,
+            SubscriptionInstanceValueTable.subscription_instance_id
+            == SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(ProductBlockTable.name == IpPrefixBlockInactive.name)
+        .where(ResourceTypeTable.resource_type.in_(resource_types))
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    values: dict[tuple[UUID, UUID], dict[str, str]] = {}
+    for subscription_id, subscription_instance_id, resource_type, value in db.session.execute(stmt):
+        values.setdefault((subscription_id, subscription_instance_id), {})[resource_type] = value
+    allocations = []
+    for (subscription_id, _), block in values.items():
+        if len(block) != len(resource_types):
+            continue
+        try:
+            aggregate_id = int(block["aggregate_block"])
+            prefix = ip_network(block["assigned_ip_prefix"], strict=False)
+        except ValueError as exc:
+            logger.warning("Invalid IP prefix in database", subscription_id=subscription_id, error=str(exc))
+            continue
+        allocations.append(Allocation(aggregate_id, prefix, subscription_id))
+    return allocations
@@ -36,7 +36,7 @@ from products.product_types.commodity_ip import CommodityIPProvisioning
 from utils.singledispatch import single_dispatch_base
 
 # for fetching site names for L2VPN title
-from services import netbox
+from products.services.external_calls import netbox
 
 
 @singledispatch
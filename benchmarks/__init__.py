@@ -0,0 +1,5 @@
+"""Benchmarks for the product trees in this repository.
+
+Every measurement runs in a fresh interpreter per tree (see `trees.py`), as the trees need different versions of
+orchestrator-core and pydantic. Only the standard library is imported here.
+"""
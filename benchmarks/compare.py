@@ -0,0 +1,83 @@
+"""Compare two benchmark results and report regressions.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json --threshold 0.1
+
+Exits with status 1 when any metric got slower by more than the threshold (a fraction, 0.1 is 10%).
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Metrics where higher is worse, with the minimum absolute change (in seconds) that is not noise
+IMPORT_METRICS = {"import_seconds": 0.002, "class_build_seconds": 0.002}
+THROUGHPUT_OPERATIONS = ("validate", "dump", "dump_json")
+
+
+def _metrics(result: Dict[str, Any]) -> Iterator[Tuple[str, float, float]]:
+    """(name, seconds, noise floor) of every metric in a result file."""
+    for tree, modules in result.get("imports", {}).items():
+        for module, measurement in modules.items():
+            if "error" in measurement:
+                continue
+            for metric, noise in IMPORT_METRICS.items():
+                yield f"imports/{tree}/{module}/{metric}", measurement[metric], noise
+    for tree, scenarios in result.get("throughput", {}).items():
+        for scenario, measurement in scenarios.items():
+            if "error" in measurement:
+                continue
+            for operation in THROUGHPUT_OPERATIONS:
+                yield f"throughput/{tree}/{scenario}/{operation}", measurement[operation]["seconds_per_op"], 0.0
+
+
+def compare(
+    before: Dict[str, Any], after: Dict[str, Any], threshold: float
+) -> List[Tuple[str, float, Optional[float], Optional[float]]]:
+    """All metrics as (name, before, after, relative change); after and change are None for removed metrics."""
+    after_metrics = {name: seconds for name, seconds, _ in _metrics(after)}
+    rows = []
+    for name, seconds, noise in _metrics(before):
+        if name not in after_metrics:
+            rows.append((name, seconds, None, None))
+            continue
+        change = (after_metrics[name] - seconds) / seconds if seconds else 0.0
+        if abs(after_metrics[name] - seconds) < noise:
+            change = 0.0
+        rows.append((name, seconds, after_metrics[name], change))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--all", action="store_true", help="Also list metrics that did not change significantly")
+    args = parser.parse_args(argv)
+
+    rows = compare(json.loads(args.before.read_text()), json.loads(args.after.read_text()), args.threshold)
+    regressions = [row for row in rows if row[3] is not None and row[3] > args.threshold]
+    improvements = [row for row in rows if row[3] is not None and row[3] < -args.threshold]
+
+    for title, selection in (("Regressions", regressions), ("Improvements", improvements)):
+        if selection:
+            print(f"{title}:")  # noqa: T201
+            for name, before, after, change in sorted(selection, key=lambda row: row[3] or 0, reverse=True):
+                print(f"  {name:<100} {before * 1000:10.3f} ms -> {after * 1000:10.3f} ms  {change:+7.1%}")  # noqa: T201
+    if args.all:
+        for name, before, after, change in rows:
+            if after is None:
+                print(f"  {name:<100} missing in {args.after}")  # noqa: T201
+            elif abs(change or 0) <= args.threshold:
+                print(f"  {name:<100} {before * 1000:10.3f} ms -> {after * 1000:10.3f} ms  {change:+7.1%}")  # noqa: T201
+    print(  # noqa: T201
+        f"{len(rows)} metrics, {len(regressions)} regressions, {len(improvements)} improvements "
+        f"(threshold {args.threshold:.0%})"
+    )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Time the shortest path and metric change simulations of `CorelinkMatrix` (surf) on a synthetic backbone.
+
+    python -m benchmarks.corelink_matrix
+    python -m benchmarks.corelink_matrix --nodes 400 --corelinks 900 --json
+
+Makes a connected backbone of `--nodes` nodes and `--corelinks` corelinks with random metrics, port pairs and a few
+corelinks in maintenance mode, and measures building the matrix (all shortest paths, equal cost path counts and ECMP
+load) and simulating a metric change and taking a corelink out of service, for `--simulations` random corelinks.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--corelinks", type=int, default=450)
+    parser.add_argument("--simulations", type=int, default=10, help="Corelinks to simulate changes on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    if args.corelinks < args.nodes - 1:
+        parser.error("--corelinks must be at least --nodes - 1 to connect all nodes")
+
+    for path in reversed(TREES["surf"].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    from surf.products.services.corelink_matrix import Corelink, CorelinkMatrix
+
+    rnd = random.Random(args.seed)
+    nodes = [uuid.UUID(int=rnd.getrandbits(128)) for _ in range(args.nodes)]
+    pairs = [(nodes[index], nodes[rnd.randrange(index)]) for index in range(1, args.nodes)]
+    while len(pairs) < args.corelinks:
+        pairs.append(tuple(rnd.sample(nodes, 2)))
+    corelinks = [
+        Corelink(
+            subscription_id=uuid.UUID(int=rnd.getrandbits(128)),
+            description=f"Corelink {index}",
+            status="active",
+            node_a=node_a,
+            node_b=node_b,
+            isis_metric=rnd.choice((10, 10, 20, 50, 100)),
+            maintenance_mode=rnd.random() < 0.02,
+            port_pairs=rnd.randint(1, 8),
+            port_speed=100000,
+        )
+        for index, (node_a, node_b) in enumerate(pairs)
+    ]
+
+    start = time.perf_counter()
+    matrix = CorelinkMatrix(corelinks)
+    build_seconds = time.perf_counter() - start
+
+    results: Dict[str, List[float]] = {"metric_ms": [], "out_of_service_ms": []}
+    changed_pairs = 0
+    for corelink in rnd.sample(corelinks, min(args.simulations, len(corelinks))):
+        start = time.perf_counter()
+        impact = matrix.simulate_metric(corelink.subscription_id, corelink.isis_metric * 10)
+        results["metric_ms"].append((time.perf_counter() - start) * 1000)
+        changed_pairs += len(impact.changed_pairs)
+        start = time.perf_counter()
+        matrix.simulate_metric(corelink.subscription_id, None)
+        results["out_of_service_ms"].append((time.perf_counter() - start) * 1000)
+
+    summary = {
+        "nodes": len(matrix.nodes),
+        "corelinks": len(matrix),
+        "build_ms": build_seconds * 1000,
+        **{f"{name}_max": max(times) for name, times in results.items()},
+        **{f"{name}_mean": sum(times) / len(times) for name, times in results.items()},
+        "changed_pairs_mean": changed_pairs / len(results["metric_ms"]),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))  # noqa: T201
+        return
+    built = f"{summary['nodes']} nodes, {summary['corelinks']} corelinks: built in {summary['build_ms']:.1f} ms"
+    print(built)  # noqa: T201
+    for name in results:
+        print(f"{name:<18} mean {summary[f'{name}_mean']:>8.1f} max {summary[f'{name}_max']:>8.1f}")  # noqa: T201
+    print(f"Node pairs changed per metric change: {summary['changed_pairs_mean']:.0f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
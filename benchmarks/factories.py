@@ -0,0 +1,326 @@
+"""Build fully populated domain models from their type annotations, without a database.
+
+`ModelFactory` walks the fields of a SubscriptionModel or ProductBlockModel and fills every one of them (also the
+optional ones) with a value of the annotated type, recursing into product blocks. Values come from a seeded random
+generator, so the same seed builds the same models. Works with orchestrator-core on pydantic 1 and pydantic 2.
+"""
+
+import enum
+import functools
+import ipaddress
+import random
+import sys
+import types
+import typing
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type, TypeVar, Union
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from orchestrator.domain.base import DomainModel, ProductBlockModel, ProductModel, SubscriptionModel
+from orchestrator.domain.lifecycle import ProductLifecycle, lookup_specialized_type
+from orchestrator.types import SubscriptionLifecycle
+
+M = TypeVar("M", bound=DomainModel)
+
+_UNION_TYPES = (Union, types.UnionType) if sys.version_info >= (3, 10) else (Union,)
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Values for fields that have a meaning a plain random value does not respect
+_FIELD_RANGES = {"vlan": (2, 4094), "vlanrange": (2, 4094), "asn": (64512, 65534), "speed": (1000, 400000)}
+
+
+def is_pydantic_v2() -> bool:
+    return hasattr(DomainModel, "model_fields")
+
+
+@functools.lru_cache(maxsize=None)
+def model_fields(cls: Type[Any]) -> Dict[str, Any]:
+    """Field names of a pydantic model with their annotated types (Annotated metadata included)."""
+    hints = typing.get_type_hints(cls, localns={cls.__name__: cls}, include_extras=True)
+    names = cls.model_fields if is_pydantic_v2() else cls.__fields__
+    return {name: hints[name] for name in names if name in hints}
+
+
+def field_alias(cls: Type[Any], name: str) -> str:
+    """The name a field is populated by, such as `port_speed` for `aliased_port_speed = Field(alias="port_speed")`."""
+    field = cls.model_fields[name] if is_pydantic_v2() else cls.__fields__[name]
+    return field.alias or name
+
+
+def dump(model: DomainModel) -> Dict[str, Any]:
+    return model.model_dump(exclude=_computed_fields_exclude(model)) if is_pydantic_v2() else model.dict()
+
+
+def dump_json(model: DomainModel) -> str:
+    return model.model_dump_json(exclude=_computed_fields_exclude(model)) if is_pydantic_v2() else model.json()
+
+
+def validate(cls: Type[M], data: Dict[str, Any]) -> M:
+    return cls.model_validate(data) if is_pydantic_v2() else cls.parse_obj(data)
+
+
+# The computed fields to leave out of `dump()` per model (by id) while `without_serializable_properties()` is active;
+# built once per model, so it does not count in the timings
+_excluded_computed_fields: Optional[Dict[int, Any]] = None
+
+
+def _computed_fields_of(value: Any) -> Any:
+    """The nested `exclude` argument of `model_dump()` that leaves out all computed fields of `value`."""
+    if hasattr(type(value), "model_computed_fields"):
+        exclude: Dict[Any, Any] = {name: True for name in type(value).model_computed_fields}
+        for name in type(value).model_fields:
+            if nested := _computed_fields_of(getattr(value, name)):
+                exclude[name] = nested
+        return exclude
+    if isinstance(value, (list, tuple)):
+        return {index: nested for index, item in enumerate(value) if (nested := _computed_fields_of(item))}
+    return {}
+
+
+def _computed_fields_exclude(model: DomainModel) -> Any:
+    if _excluded_computed_fields is None:
+        return None
+    if id(model) not in _excluded_computed_fields:
+        _excluded_computed_fields[id(model)] = _computed_fields_of(model) or None
+    return _excluded_computed_fields[id(model)]
+
+
+@contextmanager
+def without_serializable_properties() -> Iterator[None]:
+    """Leave serializable properties out of `dump()` and `dump_json()`.
+
+    Several of them load other subscriptions or call an IMS, which can not be benchmarked without those. On pydantic 1
+    `get_properties` returns none; on pydantic 2 they are computed fields, which are excluded (and so not evaluated).
+    """
+    global _excluded_computed_fields
+    if is_pydantic_v2():
+        _excluded_computed_fields = {}
+        try:
+            yield
+        finally:
+            _excluded_computed_fields = None
+        return
+    original = DomainModel.__dict__["get_properties"]
+    DomainModel.get_properties = classmethod(lambda cls: [])  # type: ignore[assignment]
+    try:
+        yield
+    finally:
+        DomainModel.get_properties = original  # type: ignore[assignment]
+
+
+def specialized_status(cls: Type[SubscriptionModel]) -> SubscriptionLifecycle:
+    """A lifecycle state that the subscription model class is valid for."""
+    for status in SubscriptionLifecycle:
+        try:
+            if lookup_specialized_type(cls, status) is cls:
+                return status
+        except ValueError:
+            continue
+    return SubscriptionLifecycle.INITIAL
+
+
+def _bounds(tp: Any, metadata: Tuple[Any, ...]) -> Tuple[Optional[int], Optional[int]]:
+    """Lower and upper bound of a constrained int, from pydantic 1 constrained types or annotated_types metadata."""
+    low: Optional[int] = None
+    high: Optional[int] = None
+    for source in (tp, *metadata):
+        if (ge := getattr(source, "ge", None)) is not None:
+            low = ge
+        if (gt := getattr(source, "gt", None)) is not None:
+            low = gt + 1
+        if (le := getattr(source, "le", None)) is not None:
+            high = le
+        if (lt := getattr(source, "lt", None)) is not None:
+            high = lt - 1
+    return low, high
+
+
+def _length_bounds(tp: Any, metadata: Tuple[Any, ...]) -> Tuple[int, Optional[int]]:
+    low = getattr(tp, "min_items", None) or 0
+    high = getattr(tp, "max_items", None)
+    for source in metadata:
+        low = getattr(source, "min_length", None) or low
+        high = getattr(source, "max_length", None) or high
+    return low, high
+
+
+class ModelFactory:
+    """Seeded builder of fully populated domain models.
+
+    Example:
+    ```python
+    factory = ModelFactory(seed=42, list_sizes={"saps": 2})
+    subscription = factory.subscription(L2vpnPP, product_name="L2VPN Port-to-Port")
+    ```
+
+    Args:
+        seed: Seed of the random generator.
+        list_sizes: Number of items to create for list fields, by field name. Other lists get their minimum length,
+            or one item when they have none.
+        overrides: Functions that produce the value of a field, by field name. They get the factory and the model
+            class the field belongs to. `current_values` holds the fields of that model that were built before it.
+        shared: Functions that return an existing product block instead of building a new one, by product block
+            name. Used to refer to product blocks of other subscriptions, such as the node of a port. Only applies
+            to nested product blocks, not to the product blocks that are fields of the subscription.
+
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        list_sizes: Optional[Dict[str, int]] = None,
+        overrides: Optional[Dict[str, Callable[["ModelFactory", Type[Any]], Any]]] = None,
+        shared: Optional[Dict[str, Callable[["ModelFactory"], ProductBlockModel]]] = None,
+    ) -> None:
+        self.random = random.Random(seed)
+        self.list_sizes = list_sizes or {}
+        self.overrides = overrides or {}
+        self.shared = shared or {}
+        self.blocks_built = 0
+        self._owner_subscription_id: Optional[UUID] = None
+        self._building: List[Dict[str, Any]] = []
+
+    @property
+    def current_values(self) -> Dict[str, Any]:
+        """Fields built so far of the model that is being built."""
+        return self._building[-1] if self._building else {}
+
+    def uuid(self) -> UUID:
+        return UUID(int=self.random.getrandbits(128), version=4)
+
+    def new_subscription_id(self) -> UUID:
+        """Start a subscription: product blocks built from now on are owned by the returned subscription id.
+
+        Pass it as `subscription_id` to `subscription()` when building its product blocks up front.
+        """
+        self._owner_subscription_id = self.uuid()
+        return self._owner_subscription_id
+
+    def subscription(
+        self,
+        cls: Type[M],
+        product_name: Optional[str] = None,
+        customer_id: Optional[str] = None,
+        **values: Any,
+    ) -> M:
+        """Build a subscription model with all of its product blocks."""
+        subscription_id = values.pop("subscription_id", None) or self.uuid()
+        self._owner_subscription_id = subscription_id
+        product_name = product_name or cls.__name__
+        product = ProductModel(
+            product_id=uuid5(NAMESPACE_URL, f"product/{product_name}"),
+            name=product_name,
+            description=product_name,
+            product_type=cls.__name__,
+            tag=product_name.upper().replace(" ", "_")[:20],
+            status=ProductLifecycle.ACTIVE,
+        )
+        self._build_fields(cls, set(model_fields(SubscriptionModel)), values)
+        fields = model_fields(cls)
+        values = {field_alias(cls, name) if name in fields else name: value for name, value in values.items()}
+        status = specialized_status(cls)  # type: ignore[arg-type]
+        return cls(
+            product=product,
+            customer_id=customer_id or str(self.uuid()),
+            subscription_id=subscription_id,
+            description=values.pop("description", f"{product_name} {subscription_id}"),
+            status=status,
+            insync=True,
+            start_date=_EPOCH,
+            **values,
+        )
+
+    def block(self, cls: Type[M], **values: Any) -> M:
+        """Build a product block with all of its nested product blocks."""
+        if not hasattr(cls, "product_block_id"):
+            # Normally read from the database on first instantiation (ProductBlockModelMeta._fix_pb_data)
+            cls.product_block_id = uuid5(NAMESPACE_URL, f"product_block/{cls.name}")  # type: ignore[attr-defined]
+            cls.description = cls.name  # type: ignore[attr-defined]
+            cls.tag = (cls.name or "").upper().replace(" ", "_")[:20]  # type: ignore[attr-defined]
+        self._build_fields(cls, set(model_fields(ProductBlockModel)), values)
+        self.blocks_built += 1
+        values.setdefault("subscription_instance_id", self.uuid())
+        values.setdefault("owner_subscription_id", self._owner_subscription_id or self.uuid())
+        return cls(**values)
+
+    def _build_fields(self, cls: Type[Any], base_fields: Set[str], values: Dict[str, Any]) -> None:
+        self._building.append(values)
+        try:
+            for name, tp in model_fields(cls).items():
+                if name not in base_fields and name not in values:
+                    values[name] = self.value(name, tp, cls)
+        finally:
+            self._building.pop()
+
+    def value(self, name: str, tp: Any, owner: Type[Any]) -> Any:  # noqa: C901
+        """A value for field `name` of type `tp`."""
+        if name in self.overrides:
+            return self.overrides[name](self, owner)
+
+        metadata: Tuple[Any, ...] = ()
+        if typing.get_origin(tp) is typing.Annotated:
+            tp, *extra = typing.get_args(tp)
+            metadata = tuple(extra)
+        origin = typing.get_origin(tp)
+
+        if origin in _UNION_TYPES:
+            options = [arg for arg in typing.get_args(tp) if arg is not type(None)]
+            return self.value(name, options[0], owner)
+        if origin is typing.Literal:
+            return typing.get_args(tp)[0]
+        list_type = origin if isinstance(origin, type) else tp
+        if isinstance(list_type, type) and issubclass(list_type, list):
+            return self._list(name, tp, metadata, owner)
+        if origin is dict:
+            return {}
+        if not isinstance(tp, type):
+            raise TypeError(f"Can not build a value for {owner.__name__}.{name}: {tp!r}")
+
+        if issubclass(tp, ProductBlockModel):
+            # Product blocks of the subscription itself are always built, only nested blocks are shared
+            if tp.name in self.shared and len(self._building) > 1:
+                return self.shared[tp.name](self)
+            return self.block(tp)
+        if issubclass(tp, enum.Enum):
+            return self.random.choice(list(tp))
+        if issubclass(tp, bool):
+            return self.random.random() < 0.5
+        if issubclass(tp, int):
+            low, high = _bounds(tp, metadata)
+            default_low, default_high = _FIELD_RANGES.get(name.lower(), (1, 100_000))
+            low = low if low is not None else default_low
+            return self.random.randint(low, high if high is not None else default_high)
+        if issubclass(tp, float):
+            return round(self.random.uniform(0, 1000), 3)
+        if issubclass(tp, UUID):
+            return self.uuid()
+        if issubclass(tp, datetime):
+            return _EPOCH + timedelta(seconds=self.random.randrange(365 * 24 * 3600))
+        if issubclass(tp, ipaddress.IPv4Address):
+            return ipaddress.IPv4Address(self.random.randrange(0x0A000000, 0x0AFFFFFF))
+        if issubclass(tp, ipaddress.IPv6Address):
+            return ipaddress.IPv6Address((0x20010DB8 << 96) | self.random.getrandbits(64))
+        if issubclass(tp, ipaddress.IPv4Network):
+            return ipaddress.IPv4Network((self.random.randrange(0x0A000000, 0x0AFFFFFF) & ~0xFF, 24))
+        if issubclass(tp, ipaddress.IPv6Network):
+            return ipaddress.IPv6Network(((0x20010DB8 << 96) | (self.random.getrandbits(16) << 80), 48))
+        if issubclass(tp, str):
+            return f"{name}-{self.random.randrange(100_000)}"
+        # Custom types that parse a string, such as VlanRanges
+        for candidate in (str(self.random.randint(*_FIELD_RANGES["vlan"])), "1"):
+            try:
+                return tp(candidate)
+            except Exception:  # noqa: S112
+                continue
+        raise TypeError(f"Can not build a value for {owner.__name__}.{name}: {tp!r}")
+
+    def _list(self, name: str, tp: Any, metadata: Tuple[Any, ...], owner: Type[Any]) -> List[Any]:
+        args = typing.get_args(tp)
+        item_type = args[0] if args else getattr(tp, "item_type", Any)
+        origin = typing.get_origin(tp)
+        low, high = _length_bounds(origin if isinstance(origin, type) else tp, metadata)
+        size = self.list_sizes.get(name, max(low, 1))
+        if high is not None:
+            size = min(size, high)
+        return [self.value(name, item_type, owner) for _ in range(size)]
@@ -0,0 +1,194 @@
+"""In-process stand-in for the NetBox lookups of the asiera `services.netbox` module.
+
+    netbox = FakeNetbox(latency=0.02, error_rate=0.01)
+    with netbox.installed(), netbox.counting() as calls:
+        title(subscription)
+    print(calls)  # Counter({"get_device": 2})
+
+`installed()` replaces `get_device`, `get_interface`, `get_tenant`, `get_ip_address` and `get_circuit_type` on
+`services.netbox`, and on every module that imported them by name (`from services.netbox import get_ip_address`), with
+the fake versions. The payload classes of `services.netbox` stay as they are.
+
+Every lookup sleeps `latency` seconds, fails with `FakeNetboxError` with probability `error_rate`, and is counted.
+Lookups of unknown ids or names return a record made up from the id or name, so any subscription can be used; the same
+id or name always gives the same record.
+"""
+
+import random
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+FUNCTIONS = ("get_device", "get_interface", "get_tenant", "get_ip_address", "get_circuit_type")
+
+# Interface speed in kbit/s, as NetBox stores it
+_SPEEDS = (1_000_000, 10_000_000, 40_000_000, 100_000_000, 400_000_000)
+_INTERFACE_TYPES = {
+    1_000_000: "1000base-t",
+    10_000_000: "10gbase-x-sfpp",
+    40_000_000: "40gbase-x-qsfpp",
+    100_000_000: "100gbase-x-qsfp28",
+    400_000_000: "400gbase-x-qsfpdd",
+}
+
+
+class FakeNetboxError(ConnectionError):
+    """Error injected by `FakeNetbox` (the `error_rate`)."""
+
+
+class Record:
+    """Attribute access to the fields of a NetBox object, like a pynetbox record."""
+
+    def __init__(self, display: str, **fields: Any) -> None:
+        self._display = display
+        self.__dict__.update(fields)
+
+    def __str__(self) -> str:
+        return self._display
+
+    def __repr__(self) -> str:
+        return f"<Record {self._display}>"
+
+
+class FakeNetbox:
+    """NetBox lookups served from memory, with injected latency and errors, that counts every call.
+
+    Args:
+        latency: Seconds every lookup takes.
+        error_rate: Probability that a lookup raises `FakeNetboxError`.
+        seed: Seed of the random generator that decides which lookups fail.
+
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.log: List[Tuple[str, Dict[str, Any], str]] = []
+        self._lock = Lock()
+        self._counters: List[Counter] = []
+        self._records: Dict[Tuple[str, str], Record] = {}
+
+    # Lookups with the signatures of services.netbox
+
+    def get_device(self, **kwargs: Any) -> Record:
+        return self._lookup("get_device", kwargs, self._device)
+
+    def get_interface(self, **kwargs: Any) -> Record:
+        return self._lookup("get_interface", kwargs, self._interface)
+
+    def get_tenant(self, **kwargs: Any) -> Record:
+        return self._lookup("get_tenant", kwargs, self._tenant)
+
+    def get_ip_address(self, **kwargs: Any) -> Record:
+        return self._lookup("get_ip_address", kwargs, self._ip_address)
+
+    def get_circuit_type(self, **kwargs: Any) -> Record:
+        return self._lookup("get_circuit_type", kwargs, self._circuit_type)
+
+    def add(self, function: str, record: Record, **kwargs: Any) -> None:
+        """Return `record` for lookups with `function` and these arguments, instead of a made up record."""
+        self._records[(function, _key(kwargs))] = record
+
+    @contextmanager
+    def counting(self) -> Iterator[Counter]:
+        """Count the lookups made inside the block (by function), in the yielded counter."""
+        counter: Counter = Counter()
+        self._counters.append(counter)
+        try:
+            yield counter
+        finally:
+            self._counters.remove(counter)
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.log.clear()
+
+    @contextmanager
+    def installed(self, module_name: str = "services.netbox") -> Iterator["FakeNetbox"]:
+        """Replace the lookups of `module_name`, also where they were imported by name, inside the block."""
+        module = sys.modules.get(module_name) or __import__(module_name, fromlist=["*"])
+        originals = {name: getattr(module, name) for name in FUNCTIONS if hasattr(module, name)}
+        patched: List[Tuple[Any, str, Any]] = []
+        for other in [other for other in sys.modules.values() if other is not None]:
+            for name, original in originals.items():
+                if other is module or vars(other).get(name) is original:
+                    patched.append((other, name, original))
+                    setattr(other, name, getattr(self, name))
+        try:
+            yield self
+        finally:
+            for other, name, original in patched:
+                setattr(other, name, original)
+
+    def _lookup(self, function: str, kwargs: Dict[str, Any], make: Any) -> Record:
+        frame = sys._getframe(2)  # the caller of get_device() and the like
+        caller = f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}"
+        with self._lock:
+            self.calls[function] += 1
+            for counter in self._counters:
+                counter[function] += 1
+            self.log.append((function, kwargs, caller))
+            fail = self.error_rate and self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeNetboxError(f"Injected error in {function}({_key(kwargs)})")
+        key = (function, _key(kwargs))
+        if key not in self._records:
+            self._records[key] = make(kwargs, random.Random(f"{function}/{key[1]}"))
+        return self._records[key]
+
+    @staticmethod
+    def _device(kwargs: Dict[str, Any], rnd: random.Random) -> Record:
+        name = str(kwargs.get("name") or f"device{kwargs.get('id')}")
+        site = f"site{rnd.randrange(100):02d}"
+        return Record(
+            name,
+            id=kwargs.get("id") or rnd.randrange(1, 100_000),
+            name=name,
+            site=Record(site, id=rnd.randrange(1, 1000), name=site.upper(), slug=site),
+        )
+
+    @staticmethod
+    def _interface(kwargs: Dict[str, Any], rnd: random.Random) -> Record:
+        speed = rnd.choice(_SPEEDS)
+        name = str(kwargs.get("name") or f"et-0/0/{rnd.randrange(48)}")
+        return Record(
+            name,
+            id=kwargs.get("id") or rnd.randrange(1, 100_000),
+            name=name,
+            speed=speed,
+            type=Record(_INTERFACE_TYPES[speed], value=_INTERFACE_TYPES[speed]),
+        )
+
+    @staticmethod
+    def _tenant(kwargs: Dict[str, Any], rnd: random.Random) -> Record:
+        name = str(kwargs.get("name") or f"Customer {kwargs.get('id')}")
+        return Record(
+            name, id=kwargs.get("id") or rnd.randrange(1, 100_000), name=name, slug=name.lower().replace(" ", "-")
+        )
+
+    @staticmethod
+    def _ip_address(kwargs: Dict[str, Any], rnd: random.Random) -> Record:
+        address = f"2001:db8:{rnd.randrange(0x10000):x}::{rnd.randrange(1, 0x10000):x}/64"
+        return Record(address, id=kwargs.get("id") or rnd.randrange(1, 100_000), address=address)
+
+    @staticmethod
+    def _circuit_type(kwargs: Dict[str, Any], rnd: random.Random) -> Record:
+        name = str(kwargs.get("name") or f"Circuit type {kwargs.get('id')}")
+        return Record(
+            name, id=kwargs.get("id") or rnd.randrange(1, 1000), name=name, slug=name.lower().replace(" ", "-")
+        )
+
+
+def _key(kwargs: Dict[str, Any]) -> str:
+    return ",".join(f"{name}={value}" for name, value in sorted(kwargs.items()))
+
+
+def format_calls(calls: Optional[Counter]) -> str:
+    return ", ".join(f"{function} {count}" for function, count in sorted((calls or Counter()).items())) or "-"
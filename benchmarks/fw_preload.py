@@ -0,0 +1,106 @@
+"""Compare loading surf `Fw` subscriptions with and without `surf.products.services.preload`.
+
+    python -m benchmarks.fw_preload
+    python -m benchmarks.fw_preload --endpoints 5 50 200 --repeat 5 --json
+
+Writes a virtual firewall subscription per `--endpoints` size (half L2, half L3 endpoints, each L3 endpoint with its
+internal L2VPN virtual circuit and SAPs) to the database with `loader.GraphWriter`, and loads each one with
+`from_subscription()` as is and after `preload_subscriptions()`. Prints the SQL statements and the time of both (the
+best of `--repeat` loads, each with an empty session). The same seed writes the same subscriptions, so the benchmark
+can run again on the same database.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+
+def _measure(load: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Statements and best time of `repeat` loads, each with an empty session."""
+    from orchestrator.db import db
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    best, statements = float("inf"), 0
+
+    def count(*args: Any) -> None:
+        nonlocal statements
+        statements += 1
+
+    for _ in range(repeat):
+        db.session.expunge_all()
+        statements = 0
+        event.listen(Engine, "before_cursor_execute", count)
+        try:
+            start = time.perf_counter()
+            load()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            event.remove(Engine, "before_cursor_execute", count)
+    return {"statements": statements, "ms": best * 1000}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", type=int, nargs="+", default=[5, 50, 200], help="Endpoints per firewall")
+    parser.add_argument("--repeat", type=int, default=3, help="Loads per path, the best counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-uri", default=os.environ.get("DATABASE_URI"), help="Default: $DATABASE_URI")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    if not args.database_uri:
+        parser.error("--database-uri or DATABASE_URI is required")
+
+    for path in reversed(TREES["surf"].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    from orchestrator.db import db, init_database
+    from orchestrator.settings import AppSettings
+    from surf.products.product_types.fw import Fw
+    from surf.products.services.preload import load_fws
+
+    from benchmarks.factories import ModelFactory
+    from benchmarks.loader import GraphWriter
+
+    firewalls = {}
+    for endpoints in args.endpoints:
+        factory = ModelFactory(
+            seed=args.seed + endpoints,
+            list_sizes={"l2_endpoints": endpoints - endpoints // 2, "l3_endpoints": endpoints // 2},
+            # IP prefixes refer to a parent prefix of their own type
+            overrides={"parent_prefix": lambda factory, owner: None},
+        )
+        firewalls[endpoints] = factory.subscription(Fw, product_name="FW")
+    with create_engine(args.database_uri).connect() as connection:
+        GraphWriter(connection).write(firewalls.values())
+
+    init_database(AppSettings(DATABASE_URI=args.database_uri))
+    results: Dict[int, Dict[str, Dict[str, float]]] = {}
+    with db.database_scope():
+        for endpoints, firewall in firewalls.items():
+            subscription_id = firewall.subscription_id
+            results[endpoints] = {
+                "from_subscription": _measure(lambda: Fw.from_subscription(subscription_id), args.repeat),
+                "preloaded": _measure(lambda: load_fws([subscription_id]), args.repeat),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))  # noqa: T201
+        return
+    print(f"{'endpoints':>9} {'statements':>11} {'ms':>9} {'preloaded statements':>21} {'ms':>9}")  # noqa: T201
+    for endpoints, result in results.items():
+        lazy, preloaded = result["from_subscription"], result["preloaded"]
+        print(  # noqa: T201
+            f"{endpoints:>9} {lazy['statements']:>11.0f} {lazy['ms']:>9.1f}"
+            f" {preloaded['statements']:>21.0f} {preloaded['ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
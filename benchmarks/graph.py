@@ -0,0 +1,533 @@
+"""Referentially consistent subscription graphs for load tests.
+
+    graph = GRAPHS["asiera"](GraphSize(nodes=500, ports_per_node=48, services=75_000), seed=0)
+    for subscription in graph.subscriptions():
+        ...
+
+A graph has nodes, ports on those nodes, links between the nodes and services on the ports, built with the real model
+classes of a tree by `factories.ModelFactory`. Product blocks of other subscriptions (the node of a port, the ports of
+a service) are the blocks of the subscriptions built before, so every relation points to a subscription of the graph,
+and VLANs are unique per port. The same size and seed build the same graph.
+
+Subscriptions are built one at a time in dependency order; only the nodes and ports are kept in memory, so the size of
+a graph is not limited by memory. A service can be more than one subscription, such as an esnetorch L3 service with its
+service edge and prefix list.
+"""
+
+import importlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Type
+from uuid import UUID
+
+from orchestrator.domain.base import ProductBlockModel, SubscriptionModel
+
+from benchmarks.factories import ModelFactory
+
+VLAN_MIN = 2
+VLAN_MAX = 4094
+
+# Product names have the port speed in them, such as "port 10G"
+PORT_SPEED_NAMES = {1000: "1G", 10000: "10G", 40000: "40G", 100000: "100G", 400000: "400G"}
+
+# Share of the ports that is kept free for services that need a whole port (port-to-port, aggregated ports)
+FREE_PORT_SHARE = 0.25
+
+
+@dataclass(frozen=True)
+class GraphSize:
+    nodes: int = 100
+    ports_per_node: int = 24
+    services: int = 1000
+
+
+def load(path: str) -> Type[Any]:
+    """The class at `module:Class`."""
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class VlanPool:
+    """VLANs in use per port, handed out lowest first."""
+
+    def __init__(self) -> None:
+        self._next: Dict[Hashable, int] = {}
+
+    def has_free(self, key: Hashable) -> bool:
+        return self._next.get(key, VLAN_MIN) <= VLAN_MAX
+
+    def allocate(self, key: Hashable) -> int:
+        vlan = self._next.get(key, VLAN_MIN)
+        if vlan > VLAN_MAX:
+            raise ValueError(f"No free VLAN on {key}")
+        self._next[key] = vlan + 1
+        return vlan
+
+
+class SubscriptionGraph(ABC):
+    """Builds the subscriptions of a graph: nodes, ports, links between the nodes, then services.
+
+    Subclasses implement the builders for the products of one tree. Their model classes are imported when the graph
+    is created, so the tree must be importable (see `trees.Tree.sys_path`).
+
+    Args:
+        size: Number of nodes, ports per node and services.
+        seed: Seed of the random generator.
+
+    """
+
+    tree: str
+    # Product block tags that code looks up, by product block name (the factory derives the others from the name)
+    block_tags: Dict[str, str] = {}
+
+    def __init__(self, size: GraphSize, seed: int = 0) -> None:
+        self.size = size
+        self.factory = ModelFactory(seed=seed, shared={}, overrides={})
+        self.random = self.factory.random
+        self.vlans = VlanPool()
+        self.customers = [str(self.factory.uuid()) for _ in range(max(1, size.services // 20))]
+        self.nodes: List[ProductBlockModel] = []
+        self.free_ports: List[ProductBlockModel] = []
+        self.shared_ports: List[ProductBlockModel] = []
+        self._service_nodes: Set[Hashable] = set()
+
+    def subscriptions(self) -> Iterator[SubscriptionModel]:
+        yield from self.build_nodes()
+        yield from self.build_ports()
+        yield from self.build_links()
+        for index in range(self.size.services):
+            self._service_nodes = set()
+            yield from self.build_service(index)
+
+    @abstractmethod
+    def build_nodes(self) -> Iterator[SubscriptionModel]:
+        ...
+
+    @abstractmethod
+    def build_ports(self) -> Iterator[SubscriptionModel]:
+        ...
+
+    def build_links(self) -> Iterator[SubscriptionModel]:
+        return iter(())
+
+    @abstractmethod
+    def build_service(self, index: int) -> Iterator[SubscriptionModel]:
+        ...
+
+    @abstractmethod
+    def node_of(self, port: ProductBlockModel) -> Hashable:
+        """Identity of the node a port is on."""
+
+    def customer(self) -> str:
+        return self.random.choice(self.customers)
+
+    def add_port(self, port: ProductBlockModel) -> None:
+        (self.free_ports if self.random.random() < FREE_PORT_SHARE else self.shared_ports).append(port)
+
+    def take_free_port(self, node: Optional[Hashable] = None) -> Optional[ProductBlockModel]:
+        """Remove and return a free port, on `node` or else on a node the current service does not use yet."""
+        for index in range(len(self.free_ports) - 1, -1, -1):
+            port_node = self.node_of(self.free_ports[index])
+            if (node is None and port_node not in self._service_nodes) or port_node == node:
+                self._service_nodes.add(port_node)
+                return self.free_ports.pop(index)
+        return None
+
+    def tagged_port(self) -> ProductBlockModel:
+        """A port with a free VLAN, preferably on a node the current service does not use yet.
+
+        Ports without free VLANs are dropped from the shared ports.
+
+        Raises:
+            ValueError: when no port has a free VLAN left.
+
+        """
+        port = None
+        for _ in range(16):
+            if not self.shared_ports:
+                break
+            candidate = self.random.choice(self.shared_ports)
+            if not self.vlans.has_free(candidate.subscription_instance_id):
+                self.shared_ports.remove(candidate)
+                continue
+            port = candidate
+            if self.node_of(port) not in self._service_nodes:
+                break
+        if port is None:
+            self.shared_ports = [
+                port for port in self.shared_ports if self.vlans.has_free(port.subscription_instance_id)
+            ]
+            if not self.shared_ports:
+                raise ValueError("No port with a free VLAN left, use more nodes or ports per node")
+            port = self.random.choice(self.shared_ports)
+        self._service_nodes.add(self.node_of(port))
+        return port
+
+    def port_vlan(self, factory: ModelFactory, owner: Type[Any]) -> int:
+        """Override for VLAN fields: a VLAN that is free on the port of the same product block."""
+        port = factory.current_values.get("port")
+        if not isinstance(port, ProductBlockModel):
+            return self.random.randint(VLAN_MIN, VLAN_MAX)
+        return self.vlans.allocate(port.subscription_instance_id)
+
+    def uses_ports(self, source: Callable[[], Optional[ProductBlockModel]], *names: str) -> None:
+        """Let nested product blocks with one of `names` come from `source` instead of being built."""
+        for name in names:
+            self.factory.shared[name] = lambda _factory: source()
+
+
+class AsieraGraph(SubscriptionGraph):
+    """Juniper and Arista nodes, ports, and L2VPN, L3VPN and IP transit services on those ports."""
+
+    tree = "asiera"
+
+    def __init__(self, size: GraphSize, seed: int = 0) -> None:
+        super().__init__(size, seed)
+        self.Node = load("products.product_types.node:Node")
+        self.NodeBlock = load("products.product_blocks.node:NodeBlock")
+        self.NodeType = load("products.product_types.node:NodeType")
+        self.Port = load("products.product_types.port:Port")
+        self.PortBlock = load("products.product_blocks.port:PortBlock")
+        self.PortSpeed = load("products.product_types.port:PortSpeed")
+        self.services = [
+            (0.15, "L2VPN Port-to-Port", load("products.product_types.l2vpn_pp:L2vpnPP")),
+            (0.35, "L2VPN VLAN-to-VLAN", load("products.product_types.l2vpn_vv:L2vpnVV")),
+            (0.25, "L3 VPN", load("products.product_types.l3vpn:L3vpn")),
+            (0.25, "IPT static", load("products.product_types.ipt_static:IPTStatic")),
+        ]
+        self.factory.overrides["vlan"] = self.port_vlan
+
+    def node_of(self, port: ProductBlockModel) -> Hashable:
+        return port.node.subscription_instance_id
+
+    def build_nodes(self) -> Iterator[SubscriptionModel]:
+        node_types = list(self.NodeType)
+        for index in range(self.size.nodes):
+            node_type = node_types[index % len(node_types)]
+            subscription_id = self.factory.new_subscription_id()
+            node = self.factory.block(self.NodeBlock, node_name=f"rt{index:05d}")
+            self.nodes.append(node)
+            yield self.factory.subscription(
+                self.Node,
+                product_name=f"node {node_type.value}",
+                subscription_id=subscription_id,
+                node_type=node_type,
+                node=node,
+            )
+
+    def build_ports(self) -> Iterator[SubscriptionModel]:
+        speeds = list(self.PortSpeed)
+        for node in self.nodes:
+            for index in range(self.size.ports_per_node):
+                speed = self.random.choice(speeds)
+                subscription_id = self.factory.new_subscription_id()
+                port = self.factory.block(self.PortBlock, node=node, port_name=f"et-0/0/{index}")
+                self.add_port(port)
+                yield self.factory.subscription(
+                    self.Port,
+                    product_name=f"port {PORT_SPEED_NAMES[speed.value]}",
+                    customer_id=self.customer(),
+                    subscription_id=subscription_id,
+                    speed=speed,
+                    port=port,
+                )
+
+    def build_service(self, index: int) -> Iterator[SubscriptionModel]:
+        weight = self.random.random()
+        for share, product_name, cls in self.services:
+            if weight < share:
+                break
+            weight -= share
+        if product_name == "L2VPN Port-to-Port" and len(self.free_ports) < 2:
+            _, product_name, cls = self.services[1]
+        if product_name == "L2VPN Port-to-Port":
+            self.uses_ports(lambda: self.take_free_port() or self.tagged_port(), "Port")
+        else:
+            self.uses_ports(self.tagged_port, "Port")
+        self.factory.list_sizes["saps"] = self.random.randint(2, 4) if product_name == "L3 VPN" else 2
+        yield self.factory.subscription(cls, product_name=product_name, customer_id=self.customer())
+
+
+class SurfGraph(SubscriptionGraph):
+    """SN8 nodes, service ports, aggregated service ports, a ring of corelinks, and L2VPN, L3VPN and IP services.
+
+    IP static and IP BGP services come with an IP prefix subscription of their own, for the prefixes of their SAPs.
+    """
+
+    tree = "surf"
+    block_tags = {"Corelink Aggregate": "CA"}
+    AGGREGATE_SHARE = 0.1
+    IP_ROUTING_TYPES = {"SN8 IP Static": "STATIC", "SN8 IP BGP": "BGP"}
+
+    def __init__(self, size: GraphSize, seed: int = 0) -> None:
+        super().__init__(size, seed)
+        self.Node = load("surf.products.product_types.node:Node")
+        self.NodeBlock = load("surf.products.product_blocks.node:NodeProductBlock")
+        self.Domain = load("surf.products.product_types.fixed_input_types:Domain")
+        self.PortSpeed = load("surf.products.product_types.fixed_input_types:PortSpeed")
+        self.ServicePort = load("surf.products.product_types.sp:Sn8ServicePort")
+        self.ServicePortBlock = load("surf.products.product_blocks.sp:Sn8ServicePortBlock")
+        self.AggregatedServicePort = load("surf.products.product_types.sn8_aggsp:Sn8AggregatedServicePort")
+        self.AggregatedServicePortBlock = load(
+            "surf.products.product_blocks.sn8_aggsp:Sn8AggregatedServicePortBlock"
+        )
+        self.Corelink = load("surf.products.product_types.sn8_corelink:Sn8Corelink")
+        self.CorelinkBlock = load("surf.products.product_blocks.corelink:Sn8CorelinkBlock")
+        self.CorelinkAggregateBlock = load(
+            "surf.products.product_blocks.corelink_aggregate:Sn8CorelinkAggregateBlock"
+        )
+        self.IpPrefix = load("surf.products.product_types.ip_prefix:IpPrefix")
+        self.IpPrefixBlock = load("surf.products.product_blocks.ip_prefix:IpPrefixBlock")
+        self.IpRoutingType = load("surf.products.product_types.fixed_input_types:IpRoutingType")
+        self.services = [
+            (0.5, "SN8 L2VPN", load("surf.products.product_types.sn8_l2vpn:Sn8L2Vpn")),
+            (0.2, "SN8 L3VPN", load("surf.products.product_types.sn8_l3vpn:Sn8L3Vpn")),
+            (0.15, "SN8 IP Static", load("surf.products.product_types.sn8_ip_static:Sn8IpStatic")),
+            (0.15, "SN8 IP BGP", load("surf.products.product_types.sn8_ip_bgp:Sn8IpBgp")),
+        ]
+        self._prefix: Optional[ProductBlockModel] = None
+        self.uses_ports(lambda: self._prefix, "IP_PREFIX")
+        self.VlanRanges = load("orchestrator.utils.vlans:VlanRanges")
+        self.factory.overrides["vlanrange"] = lambda factory, owner: self.VlanRanges(self.port_vlan(factory, owner))
+        self.factory.list_sizes.update(esis=2, saps=1, port_pairs=2, prefixes=1, pin_prefix=0)
+
+    def node_of(self, port: ProductBlockModel) -> Hashable:
+        if isinstance(port, self.AggregatedServicePortBlock):
+            port = port.port[0]
+        return port.node.subscription_instance_id
+
+    def build_nodes(self) -> Iterator[SubscriptionModel]:
+        for index in range(self.size.nodes):
+            subscription_id = self.factory.new_subscription_id()
+            node = self.factory.block(self.NodeBlock, nso_device_id=f"rt{index:05d}")
+            self.nodes.append(node)
+            yield self.factory.subscription(
+                self.Node, product_name="SN8 Node", subscription_id=subscription_id, node=node
+            )
+
+    def build_ports(self) -> Iterator[SubscriptionModel]:
+        speeds = list(self.PortSpeed)
+        for node in self.nodes:
+            for _ in range(self.size.ports_per_node):
+                speed = self.random.choice(speeds)
+                subscription_id = self.factory.new_subscription_id()
+                port = self.factory.block(self.ServicePortBlock, node=node)
+                self.add_port(port)
+                yield self.factory.subscription(
+                    self.ServicePort,
+                    product_name=f"SN8 Service Port {PORT_SPEED_NAMES[speed.value]}",
+                    customer_id=self.customer(),
+                    subscription_id=subscription_id,
+                    domain=self.Domain.SURFNET8,
+                    aliased_port_speed=speed,
+                    port=port,
+                )
+
+    def build_links(self) -> Iterator[SubscriptionModel]:
+        if len(self.nodes) < 2:
+            return
+        for index, node_a in enumerate(self.nodes):
+            node_z = self.nodes[(index + 1) % len(self.nodes)]
+            subscription_id = self.factory.new_subscription_id()
+            aggregates = [self.factory.block(self.CorelinkAggregateBlock, node=node) for node in (node_a, node_z)]
+            corelink = self.factory.block(self.CorelinkBlock, aggregates=aggregates)
+            yield self.factory.subscription(
+                self.Corelink, product_name="SN8 Corelink", subscription_id=subscription_id, corelink=corelink
+            )
+
+    def build_service(self, index: int) -> Iterator[SubscriptionModel]:
+        if self.random.random() < self.AGGREGATE_SHARE and self.free_ports:
+            aggregate = self.build_aggregated_port()
+            if aggregate is not None:
+                yield aggregate
+                return
+        weight = self.random.random()
+        for share, product_name, cls in self.services:
+            if weight < share:
+                break
+            weight -= share
+        customer_id = self.customer()
+        values = {}
+        if product_name in self.IP_ROUTING_TYPES:
+            yield self.build_prefix(customer_id)
+            values["ip_routing_type"] = self.IpRoutingType[self.IP_ROUTING_TYPES[product_name]]
+        self.uses_ports(self.tagged_port, "SN8 Service Port")
+        self.factory.list_sizes["saps"] = self.random.randint(2, 4) if product_name == "SN8 L3VPN" else 1
+        yield self.factory.subscription(
+            cls, product_name=product_name, customer_id=customer_id, domain=self.Domain.SURFNET8, **values
+        )
+
+    def build_prefix(self, customer_id: str) -> SubscriptionModel:
+        """An IP prefix subscription, used by the SAPs of the next IP service."""
+        subscription_id = self.factory.new_subscription_id()
+        self._prefix = self.factory.block(self.IpPrefixBlock, parent_prefix=None)
+        return self.factory.subscription(
+            self.IpPrefix,
+            product_name="IP Prefix",
+            customer_id=customer_id,
+            subscription_id=subscription_id,
+            ip_prefix=self._prefix,
+        )
+
+    def build_aggregated_port(self) -> Optional[SubscriptionModel]:
+        """An aggregated service port of two free ports on the same node."""
+        first = self.take_free_port()
+        second = self.take_free_port(self.node_of(first)) if first else None
+        if first is None or second is None:
+            if first is not None:
+                self.free_ports.append(first)
+            return None
+        subscription_id = self.factory.new_subscription_id()
+        port = self.factory.block(self.AggregatedServicePortBlock, port=[first, second])
+        self.shared_ports.append(port)
+        return self.factory.subscription(
+            self.AggregatedServicePort,
+            product_name="SN8 Aggregated Service Port",
+            customer_id=self.customer(),
+            subscription_id=subscription_id,
+            domain=self.Domain.SURFNET8,
+            port=port,
+        )
+
+
+class EsnetorchGraph(SubscriptionGraph):
+    """Enrolled nodes, physical connections, a ring of backbone links, and service edges with L3 services."""
+
+    tree = "esnetorch"
+    # Services that are only a service edge; the others are an L3 service with its own service edge and prefix list
+    EDGE_SHARE = 0.5
+
+    def __init__(self, size: GraphSize, seed: int = 0) -> None:
+        super().__init__(size, seed)
+        self.NodeEnrollment = load("esnetorch.products.product_types.nes:NodeEnrollment")
+        self.NodeEnrollmentBlock = load("esnetorch.products.product_blocks.nes:NodeEnrollmentBlock")
+        self.PhysicalConnection = load("esnetorch.products.product_types.pcs:PhysicalConnection")
+        self.PhysicalConnectionBlock = load("esnetorch.products.product_blocks.pcs:PhysicalConnectionBlock")
+        self.BackboneLink = load("esnetorch.products.product_types.blink:BackboneLink")
+        self.BackboneLinkBlock = load("esnetorch.products.product_blocks.blink:BackboneLinkBlock")
+        self.ServiceEdge = load("esnetorch.products.product_types.service_edge:ServiceEdge")
+        self.EdgeBlock = load("esnetorch.products.product_blocks.service_edge:EdgeBlock")
+        self.BridgeServiceBlock = load("esnetorch.products.product_blocks.service_edge:BridgeServiceBlock")
+        self.PrefixList = load("esnetorch.products.product_types.prefix_list:PrefixList")
+        self.PrefixListBlock = load("esnetorch.products.product_blocks.prefix_list:PrefixListBlock")
+        self.L3Service = load("esnetorch.products.product_types.layer3:L3Service")
+        self.L3Block = load("esnetorch.products.product_blocks.layer3:L3Block")
+        fixed_inputs = "esnetorch.products.product_types.fixed_input_types"
+        self.Flavor = load(f"{fixed_inputs}:Flavor")
+        self.IsisService = load(f"{fixed_inputs}:IsisService")
+        self.RoutingDomain = load(f"{fixed_inputs}:RoutingDomain")
+        self.node_names: Dict[UUID, str] = {}
+        self._node_subscription_id: Optional[UUID] = None
+        # Equipment interfaces refer to the node they are on by subscription id
+        self.factory.overrides["node_subscription_id"] = lambda factory, owner: self._node_subscription_id
+        self.factory.list_sizes.update(members=1, lag_members=0, mgmt_ports=1)
+
+    def node_of(self, port: ProductBlockModel) -> Hashable:
+        return port.equipment_interface.node_subscription_id
+
+    def build_nodes(self) -> Iterator[SubscriptionModel]:
+        for index in range(self.size.nodes):
+            self._node_subscription_id = subscription_id = self.factory.new_subscription_id()
+            node = self.factory.block(self.NodeEnrollmentBlock, node_name=f"rt{index:05d}")
+            self.nodes.append(node)
+            self.node_names[subscription_id] = node.node_name
+            yield self.factory.subscription(
+                self.NodeEnrollment, product_name="Node Enrollment", subscription_id=subscription_id, ne=node
+            )
+
+    def build_ports(self) -> Iterator[SubscriptionModel]:
+        for self._node_subscription_id, node_name in list(self.node_names.items()):
+            for index in range(self.size.ports_per_node):
+                subscription_id = self.factory.new_subscription_id()
+                port = self.factory.block(self.PhysicalConnectionBlock, conn_id=f"{node_name}-{index}")
+                self.add_port(port)
+                yield self.factory.subscription(
+                    self.PhysicalConnection,
+                    product_name="Physical Connection",
+                    customer_id=self.customer(),
+                    subscription_id=subscription_id,
+                    pc=port,
+                )
+
+    def build_links(self) -> Iterator[SubscriptionModel]:
+        node_subscription_ids = list(self.node_names)
+        if len(node_subscription_ids) < 2:
+            return
+        for index, node_a in enumerate(node_subscription_ids):
+            node_z = node_subscription_ids[(index + 1) % len(node_subscription_ids)]
+            subscription_id = self.factory.new_subscription_id()
+            blink = self.factory.block(
+                self.BackboneLinkBlock, node_a_subscription_id=str(node_a), node_z_subscription_id=str(node_z)
+            )
+            yield self.factory.subscription(
+                self.BackboneLink,
+                product_name="Backbone Link",
+                subscription_id=subscription_id,
+                blink=blink,
+                flavor=self.Flavor.BACKBONE,
+                isis_service=self.IsisService.ESNET_293,
+            )
+
+    def build_service(self, index: int) -> Iterator[SubscriptionModel]:
+        customer_id = self.customer()
+        port = self.tagged_port()
+        self._node_subscription_id = self.node_of(port)
+        device = self.node_names[self._node_subscription_id]
+        uplinks = [uplink for uplink in range(1, 5) if self.vlans.has_free((device, uplink))]
+        if not uplinks:
+            raise ValueError(f"No free VLAN left on {device}")
+        switch_uplink_id = self.random.choice(uplinks)
+
+        edge_subscription_id = self.factory.new_subscription_id()
+        bridge = self.factory.block(
+            self.BridgeServiceBlock,
+            vlan=self.vlans.allocate((device, switch_uplink_id)),
+            device=device,
+            switch_uplink_id=switch_uplink_id,
+            pcs_iface=port.equipment_interface,
+        )
+        edge = self.factory.block(
+            self.EdgeBlock, physical_connection_subscription_id=port.owner_subscription_id, bridge_service=bridge
+        )
+        yield self.factory.subscription(
+            self.ServiceEdge,
+            product_name="Service Edge",
+            customer_id=customer_id,
+            subscription_id=edge_subscription_id,
+            edge=edge,
+            routing_domain=self.RoutingDomain.ESNET_293,
+        )
+        if self.random.random() < self.EDGE_SHARE:
+            return
+
+        prefix_list_subscription_id = self.factory.new_subscription_id()
+        peers = self.random.sample(list(self.node_names), min(2, len(self.node_names)))
+        prefix_list = self.factory.block(self.PrefixListBlock, node_enrollment_subscription_id=peers)
+        yield self.factory.subscription(
+            self.PrefixList,
+            product_name="Prefix List",
+            customer_id=customer_id,
+            subscription_id=prefix_list_subscription_id,
+            prefix_list=prefix_list,
+            routing_domain=self.RoutingDomain.ESNET_293,
+        )
+
+        subscription_id = self.factory.new_subscription_id()
+        l3_block = self.factory.block(
+            self.L3Block,
+            service_edge_subscription_id=edge_subscription_id,
+            prefix_list_subscription_id=prefix_list_subscription_id,
+        )
+        yield self.factory.subscription(
+            self.L3Service,
+            product_name="L3 Service",
+            customer_id=customer_id,
+            subscription_id=subscription_id,
+            l3_block=l3_block,
+            routing_domain=self.RoutingDomain.ESNET_293,
+        )
+
+
+GRAPHS: Dict[str, Type[SubscriptionGraph]] = {
+    graph.tree: graph for graph in (AsieraGraph, SurfGraph, EsnetorchGraph)
+}
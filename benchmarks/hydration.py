@@ -0,0 +1,341 @@
+"""Profile the loading of domain models from the database (`from_subscription()` and `from_db()`).
+
+    with HydrationProfiler() as profiler:
+        subscription = Sn8L3Vpn.from_subscription(subscription_id)
+    print(profiler.report())
+    profiler.write_folded("l3vpn.folded")  # flamegraph.pl, speedscope or inferno
+
+Every `SubscriptionModel.from_subscription()` and `ProductBlockModel.from_db()` call inside the block is a frame,
+named after the model it returns, so a load of `Sn8L3Vpn` is a tree of frames for the virtual circuit, its SAP
+settings, their SAPs, ports and nodes. Each frame gets the SQL statements executed while it was the innermost frame
+(including lazy loads of relationships), their database time, and the time spent in pydantic validation (`__init__`)
+of its model. The profiler keeps a report per top level load and aggregates them per model, so wrapping a whole API
+request or workflow step gives the totals for it.
+
+Profilers only see the loads of their own context (thread or asyncio task). The tree must be importable, with the
+orchestrator database configured, before the profiler is used; `python -m benchmarks.hydration` does that.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+MICROSECONDS = 1_000_000
+
+
+@dataclass
+class Frame:
+    """A model load with the loads it made, as a node of the call tree."""
+
+    name: str
+    calls: int = 0
+    statements: int = 0
+    db_seconds: float = 0.0
+    validation_seconds: float = 0.0
+    total_seconds: float = 0.0
+    children: Dict[str, "Frame"] = field(default_factory=dict)
+
+    def merge(self, other: "Frame") -> None:
+        self.calls += other.calls
+        self.statements += other.statements
+        self.db_seconds += other.db_seconds
+        self.validation_seconds += other.validation_seconds
+        self.total_seconds += other.total_seconds
+        for name, child in other.children.items():
+            self.children.setdefault(name, Frame(name)).merge(child)
+
+    def add_child(self, child: "Frame") -> None:
+        self.children.setdefault(child.name, Frame(child.name)).merge(child)
+
+    def walk(self, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], "Frame"]]:
+        """(path, frame) of this frame and all frames below it, depth first."""
+        path = (*path, self.name)
+        yield path, self
+        for child in self.children.values():
+            yield from child.walk(path)
+
+    @property
+    def self_seconds(self) -> float:
+        """Time in this frame that was not spent in SQL, validation or the frames below it."""
+        below = sum(child.total_seconds for child in self.children.values())
+        return max(self.total_seconds - below - self.db_seconds - self.validation_seconds, 0.0)
+
+
+@dataclass
+class ModelStats:
+    loads: int = 0
+    statements: int = 0
+    db_seconds: float = 0.0
+    validation_seconds: float = 0.0
+
+
+@dataclass
+class LoadReport:
+    """A top level load: the model, its totals and the totals per model loaded for it."""
+
+    frame: Frame
+
+    @property
+    def model(self) -> str:
+        return self.frame.name
+
+    @property
+    def seconds(self) -> float:
+        return self.frame.total_seconds
+
+    @property
+    def statements(self) -> int:
+        return sum(frame.statements for _, frame in self.frame.walk())
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(frame.db_seconds for _, frame in self.frame.walk())
+
+    def per_model(self) -> Dict[str, ModelStats]:
+        return _per_model([self.frame])
+
+
+def _per_model(roots: List[Frame]) -> Dict[str, ModelStats]:
+    stats: Dict[str, ModelStats] = defaultdict(ModelStats)
+    for root in roots:
+        for _, frame in root.walk():
+            model = stats[frame.name]
+            model.loads += frame.calls
+            model.statements += frame.statements
+            model.db_seconds += frame.db_seconds
+            model.validation_seconds += frame.validation_seconds
+    return dict(stats)
+
+
+class HydrationProfiler:
+    """Count SQL statements and measure database and validation time of the model loads inside the block.
+
+    Profilers can be nested; the loads count for every active profiler of the context.
+    """
+
+    def __init__(self) -> None:
+        self.loads: List[LoadReport] = []
+        self.tree = Frame("hydration")
+        self._token: Any = None
+
+    def __enter__(self) -> "HydrationProfiler":
+        _install()
+        self._token = _profilers.set((*_profilers.get(), self))
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        _profilers.reset(self._token)
+        _uninstall()
+
+    def record(self, root: Frame) -> None:
+        self.loads.append(LoadReport(root))
+        self.tree.add_child(root)
+
+    @property
+    def statements(self) -> int:
+        return sum(load.statements for load in self.loads)
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(load.db_seconds for load in self.loads)
+
+    def per_model(self) -> Dict[str, ModelStats]:
+        return _per_model([load.frame for load in self.loads])
+
+    def folded(self) -> List[str]:
+        """The call tree in the folded stack format of flame graph tools, in microseconds.
+
+        SQL and validation time are leaves (`sql`, `validation`) below the frame they belong to.
+        """
+        lines = []
+        for path, frame in self.tree.walk():
+            if frame is self.tree:
+                continue
+            stack = ";".join(path[1:])
+            for leaf, seconds in (("", frame.self_seconds), (";sql", frame.db_seconds)):
+                if microseconds := round(seconds * MICROSECONDS):
+                    lines.append(f"{stack}{leaf} {microseconds}")
+            if microseconds := round(frame.validation_seconds * MICROSECONDS):
+                lines.append(f"{stack};validation {microseconds}")
+        return lines
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.writelines(f"{line}\n" for line in self.folded())
+
+    def report(self) -> str:
+        """Totals per top level load and per model, as a table."""
+        lines = [f"{'Load':<48} {'SQL':>6} {'DB ms':>9} {'Total ms':>9}"]
+        for load in self.loads:
+            lines.append(
+                f"{load.model:<48} {load.statements:>6} {load.db_seconds * 1000:>9.1f} {load.seconds * 1000:>9.1f}"
+            )
+        lines += ["", f"{'Model':<48} {'Loads':>6} {'SQL':>6} {'DB ms':>9} {'Valid. ms':>9}"]
+        by_time = sorted(self.per_model().items(), key=lambda item: -(item[1].db_seconds + item[1].validation_seconds))
+        for model, stats in by_time:
+            lines.append(
+                f"{model:<48} {stats.loads:>6} {stats.statements:>6} {stats.db_seconds * 1000:>9.1f}"
+                f" {stats.validation_seconds * 1000:>9.1f}"
+            )
+        lines.append(f"{len(self.loads)} loads, {self.statements} SQL statements, {self.db_seconds * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+_profilers: ContextVar[Tuple[HydrationProfiler, ...]] = ContextVar("hydration_profilers", default=())
+# Open frames of the current context, innermost last
+_stack: ContextVar[Tuple[Frame, ...]] = ContextVar("hydration_stack", default=())
+_validating: ContextVar[bool] = ContextVar("hydration_validating", default=False)
+
+_install_lock = Lock()
+_installed = 0
+_originals: List[Tuple[Any, str, Any]] = []
+
+
+def _frame(load: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a `from_*` classmethod to run in a frame of its own."""
+
+    def wrapper(cls: Any, *args: Any, **kwargs: Any) -> Any:
+        if not _profilers.get():
+            return load(cls, *args, **kwargs)
+        frame = Frame(cls.__name__, calls=1)
+        stack = _stack.get()
+        token = _stack.set((*stack, frame))
+        start = time.perf_counter()
+        try:
+            model = load(cls, *args, **kwargs)
+            frame.name = type(model).__name__
+            return model
+        finally:
+            frame.total_seconds = time.perf_counter() - start
+            _stack.reset(token)
+            if stack:
+                stack[-1].add_child(frame)
+            else:
+                for profiler in _profilers.get():
+                    profiler.record(frame)
+
+    return classmethod(wrapper)
+
+
+def _validation(init: Callable[..., None]) -> Callable[..., None]:
+    def __init__(self: Any, *args: Any, **kwargs: Any) -> None:
+        stack = _stack.get()
+        if not stack or _validating.get():
+            return init(self, *args, **kwargs)
+        token = _validating.set(True)
+        start = time.perf_counter()
+        try:
+            init(self, *args, **kwargs)
+        finally:
+            stack[-1].validation_seconds += time.perf_counter() - start
+            _validating.reset(token)
+
+    return __init__
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool) -> None:
+    conn.info.setdefault("hydration_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool) -> None:
+    starts = conn.info.get("hydration_start")
+    if not starts:
+        # The statement started before the listeners were installed
+        return
+    start = starts.pop()
+    if stack := _stack.get():
+        stack[-1].statements += 1
+        stack[-1].db_seconds += time.perf_counter() - start
+
+
+def _install() -> None:
+    global _installed
+    from orchestrator.domain.base import ProductBlockModel, SubscriptionModel
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _install_lock:
+        _installed += 1
+        if _installed > 1:
+            return
+        for cls, name in ((SubscriptionModel, "from_subscription"), (ProductBlockModel, "from_db")):
+            original = cls.__dict__[name]
+            _originals.append((cls, name, original))
+            setattr(cls, name, _frame(original.__func__))
+        for cls in (SubscriptionModel, ProductBlockModel):
+            _originals.append((cls, "__init__", cls.__dict__.get("__init__")))
+            setattr(cls, "__init__", _validation(cls.__init__))
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _uninstall() -> None:
+    global _installed
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _install_lock:
+        _installed -= 1
+        if _installed:
+            return
+        event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+        for cls, name, original in reversed(_originals):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        _originals.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tree", choices=sorted(TREES))
+    parser.add_argument("model", help="Product type to load, as module:Class")
+    parser.add_argument("--product", required=True, help="Name of the product of the subscriptions to load")
+    parser.add_argument("--limit", type=int, default=100, help="Number of subscriptions to load")
+    parser.add_argument("--folded", help="Write the call tree in the folded stack format to this file")
+    parser.add_argument("--database-uri", default=os.environ.get("DATABASE_URI"), help="Default: $DATABASE_URI")
+    args = parser.parse_args(argv)
+    if not args.database_uri:
+        parser.error("--database-uri or DATABASE_URI is required")
+
+    for path in reversed(TREES[args.tree].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    from orchestrator.db import ProductTable, SubscriptionTable, db, init_database
+    from orchestrator.domain import SUBSCRIPTION_MODEL_REGISTRY
+    from orchestrator.domain.base import SubscriptionModel
+    from orchestrator.settings import AppSettings
+    from sqlalchemy import select
+
+    from benchmarks.graph import load
+
+    SUBSCRIPTION_MODEL_REGISTRY[args.product] = load(args.model)
+    init_database(AppSettings(DATABASE_URI=args.database_uri))
+    with db.database_scope():
+        subscription_ids = db.session.scalars(
+            select(SubscriptionTable.subscription_id)
+            .join(ProductTable)
+            .where(ProductTable.name == args.product)
+            .limit(args.limit)
+        ).all()
+        with HydrationProfiler() as profiler:
+            for subscription_id in subscription_ids:
+                SubscriptionModel.from_subscription(subscription_id)
+    print(profiler.report())  # noqa: T201
+    if args.folded:
+        profiler.write_folded(args.folded)
+    statements = Counter(load.statements for load in profiler.loads)
+    print(f"SQL statements per load: {dict(sorted(statements.items()))}", file=sys.stderr)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""The lifecycle variants of the product blocks of a tree, as one table, and checks of the variants.
+
+    python -m benchmarks.lifecycles surf
+    python -m benchmarks.lifecycles esnetorch --table
+
+A product block has a class per lifecycle: `PortBlockInactive` for initial, `PortBlockProvisioning` for provisioning
+and `PortBlock` for active subscriptions, or one class for several lifecycles (`lifecycle=[ACTIVE, PROVISIONING]`).
+`LifecycleTable` maps (product block name, lifecycle) to the class, for every lifecycle of every registered product
+block, so the class a subscription instance loads as is one lookup by the name stored in the database:
+
+    table = LifecycleTable.compile()  # after all product blocks are imported
+    table.get("SN8 Service Attach Point", SubscriptionLifecycle.PROVISIONING)  # Sn8ServiceAttachPointBlock
+
+`verify()` checks the variants against the model definitions. Orchestrator registers variants silently, so mistakes
+only show when a subscription is loaded:
+
+- two product blocks with the same name (the last one imported wins);
+- two variants of a product block for the same lifecycle (the last one imported wins);
+- a variant that is not a subclass of the variant of the lifecycle before it (initial, provisioning, active);
+- a product block field of a variant whose type is an earlier variant than the lifecycle needs, like a provisioning
+  variant in an active product block. Later variants are fine: a provisioning block can use an active block of
+  another subscription.
+"""
+
+import argparse
+import importlib
+import sys
+import typing
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+Key = Tuple[str, Any]
+
+
+def _subclasses(cls: Type[Any]) -> Iterator[Type[Any]]:
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def _block_types(tp: Any) -> Iterator[Type[Any]]:
+    """The product block classes in a field type (directly, in a list or in a union)."""
+    from orchestrator.domain.base import ProductBlockModel
+
+    if isinstance(tp, type):
+        if issubclass(tp, ProductBlockModel):
+            yield tp
+            return
+        if issubclass(tp, list) and (item_type := getattr(tp, "item_type", None)) is not None:
+            yield from _block_types(item_type)
+            return
+    for arg in typing.get_args(tp):
+        yield from _block_types(arg)
+
+
+def _registered_lifecycles() -> Dict[Type[Any], List[Any]]:
+    """The lifecycles each domain model class is the variant for (`None`: the lifecycles without a variant)."""
+    from orchestrator.domain.lifecycle import _sub_type_per_lifecycle
+
+    lifecycles: Dict[Type[Any], List[Any]] = defaultdict(list)
+    for (_, lifecycle), cls in _sub_type_per_lifecycle.items():
+        lifecycles[cls].append(lifecycle)
+    return lifecycles
+
+
+class LifecycleTable:
+    """The product block class for each (product block name, lifecycle)."""
+
+    def __init__(self, table: Dict[Key, Type[Any]]) -> None:
+        self.table = table
+
+    @classmethod
+    def compile(cls, registry: Optional[Dict[str, Type[Any]]] = None) -> "LifecycleTable":
+        """The table of the registered product blocks (`ProductBlockModel.registry`), for all lifecycles."""
+        from orchestrator.domain.base import ProductBlockModel
+        from orchestrator.domain.lifecycle import lookup_specialized_type
+        from orchestrator.types import SubscriptionLifecycle
+
+        registry = ProductBlockModel.registry if registry is None else registry
+        return cls(
+            {
+                (name, lifecycle): lookup_specialized_type(block, lifecycle)
+                for name, block in sorted(registry.items())
+                for lifecycle in SubscriptionLifecycle
+            }
+        )
+
+    def get(self, name: str, lifecycle: Any) -> Type[Any]:
+        return self.table[(name, lifecycle)]
+
+    def resolve(self, block: Type[Any], lifecycle: Any) -> Type[Any]:
+        """The variant of the product block of class `block` for `lifecycle`."""
+        return self.table[(block.name, lifecycle)]
+
+    def names(self) -> List[str]:
+        return sorted({name for name, _ in self.table})
+
+    def variants(self, name: str) -> Dict[Any, Type[Any]]:
+        return {lifecycle: cls for (block_name, lifecycle), cls in self.table.items() if block_name == name}
+
+    def format(self) -> str:
+        from orchestrator.types import SubscriptionLifecycle
+
+        lines = []
+        for name in self.names():
+            by_class: Dict[str, List[str]] = defaultdict(list)
+            for lifecycle in SubscriptionLifecycle:
+                by_class[self.get(name, lifecycle).__name__].append(lifecycle.value)
+            lines.append(name)
+            lines += [f"  {class_name:<48} {', '.join(lifecycles)}" for class_name, lifecycles in by_class.items()]
+        return "\n".join(lines)
+
+
+def verify(table: LifecycleTable) -> List[str]:
+    """Problems with the lifecycle variants of the product blocks in `table`, see the module docstring."""
+    from orchestrator.domain.base import ProductBlockModel
+    from orchestrator.types import SubscriptionLifecycle
+
+    problems = []
+    registered = _registered_lifecycles()
+
+    for block in _subclasses(ProductBlockModel):
+        if block.__dict__.get("__base_type__") is block and ProductBlockModel.registry.get(block.name) is not block:
+            other = ProductBlockModel.registry.get(block.name)
+            problems.append(f"{_path(block)} and {_path(other)} are both product block {block.name!r}")
+
+    for block in set(_subclasses(ProductBlockModel)):
+        if block.name is None or block is block.__base_type__:
+            continue
+        base = block.__base_type__.__name__
+        if block not in registered:
+            problems.append(f"{_path(block)} is replaced by another variant of {base} for all its lifecycles")
+
+    order = (SubscriptionLifecycle.INITIAL, SubscriptionLifecycle.PROVISIONING, SubscriptionLifecycle.ACTIVE)
+    for name in table.names():
+        for before, after in zip(order, order[1:]):
+            earlier, later = table.get(name, before), table.get(name, after)
+            if not issubclass(later, earlier):
+                problems.append(
+                    f"{name}: {later.__name__} ({after.value}) is not a subclass of {earlier.__name__} ({before.value})"
+                )
+
+    # Product blocks and product types
+    for model, lifecycles in registered.items():
+        for lifecycle in lifecycles:
+            if lifecycle is None:
+                continue
+            for field_name, field_type in model._product_block_fields_.items():
+                for block in _block_types(field_type):
+                    expected = table.table.get((block.name, lifecycle))
+                    if expected is not None and not issubclass(block, expected):
+                        problems.append(
+                            f"{_path(model)}.{field_name} is {block.__name__}, {lifecycle.value} needs (a subclass of)"
+                            f" {expected.__name__}"
+                        )
+    return sorted(set(problems))
+
+
+def _path(cls: Any) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}" if cls is not None else "None"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tree", choices=sorted(TREES))
+    parser.add_argument("--table", action="store_true", help="Print the table")
+    args = parser.parse_args(argv)
+
+    tree = TREES[args.tree]
+    for path in reversed(tree.sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    for module in tree.modules():
+        try:
+            importlib.import_module(module)
+        except ImportError as exc:
+            # Modules that need the tree's application (settings, services) are left out
+            print(f"Skipped {module}: {exc}", file=sys.stderr)  # noqa: T201
+
+    table = LifecycleTable.compile()
+    if args.table:
+        print(table.format())  # noqa: T201
+    problems = verify(table)
+    for problem in problems:
+        print(problem)  # noqa: T201
+    print(f"{len(table.names())} product blocks, {len(problems)} problems", file=sys.stderr)  # noqa: T201
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Write subscription models to an orchestrator database with bulk inserts.
+
+`GraphWriter` writes the rows that `SubscriptionModel.save()` would write (subscription, product block instances,
+their values and the relations between them) for many subscriptions at once, and creates the products, fixed inputs,
+product blocks and resource types the subscriptions need. Saving 100k subscriptions one by one with `save()` takes
+hours; this takes minutes.
+
+The database must have the orchestrator-core schema of the tree's orchestrator version (`db upgrade heads`). The
+schema uses PostgreSQL server defaults and types, so other databases are not supported.
+"""
+
+import enum
+import typing
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from orchestrator.db.models import (
+    FixedInputTable,
+    ProductBlockRelationTable,
+    ProductBlockTable,
+    ProductTable,
+    ResourceTypeTable,
+    SubscriptionInstanceRelationTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    product_block_resource_type_association,
+    product_product_block_association,
+)
+from orchestrator.domain.base import ProductBlockModel, SubscriptionModel
+from sqlalchemy import Table, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+
+from benchmarks.factories import field_alias, model_fields
+
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _contains_block(tp: Any) -> bool:
+    """Whether a field of type `tp` holds product blocks (directly, in a list or in a union)."""
+    if isinstance(tp, type):
+        if issubclass(tp, ProductBlockModel):
+            return True
+        if issubclass(tp, list) and (item_type := getattr(tp, "item_type", None)) is not None:
+            return _contains_block(item_type)
+    return any(_contains_block(arg) for arg in typing.get_args(tp))
+
+
+def _str(value: Any) -> str:
+    """A value as `SubscriptionModel.save()` stores it."""
+    return str(value.value) if isinstance(value, enum.Enum) else str(value)
+
+
+def _block_fields(cls: Type[Any], base: Type[Any]) -> Tuple[List[str], List[str]]:
+    """Names of the product block fields and of the other fields of a model, without those of `base`."""
+    base_fields = set(model_fields(base))
+    blocks, others = [], []
+    for name, tp in model_fields(cls).items():
+        if name not in base_fields:
+            (blocks if _contains_block(tp) else others).append(name)
+    return blocks, others
+
+
+class GraphWriter:
+    """Bulk insert subscription models, `batch_size` subscriptions per transaction.
+
+    Example:
+    ```python
+    with engine.connect() as connection:
+        writer = GraphWriter(connection)
+        writer.write(graph.subscriptions())
+    ```
+
+    Args:
+        connection: Connection to the orchestrator database.
+        batch_size: Number of subscriptions per insert.
+        block_tags: Tags of product blocks by name, for product blocks that are looked up by tag.
+
+    """
+
+    def __init__(
+        self, connection: Connection, batch_size: int = 1000, block_tags: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.connection = connection
+        self.batch_size = batch_size
+        self.block_tags = block_tags or {}
+        self.written = 0
+        self._products: Set[UUID] = set()
+        self._product_blocks: Set[UUID] = set()
+        self._resource_types: Dict[str, UUID] = {}
+        self._block_relations: Set[Tuple[UUID, UUID]] = set()
+        self._rows: Dict[Table, List[Dict[str, Any]]] = {}
+
+    def is_empty(self) -> bool:
+        return not self.connection.execute(select(func.count()).select_from(SubscriptionTable.__table__)).scalar()
+
+    def write(self, subscriptions: Iterable[SubscriptionModel]) -> int:
+        """Write all subscriptions; returns the number written."""
+        pending = 0
+        for subscription in subscriptions:
+            self.add(subscription)
+            pending += 1
+            if pending == self.batch_size:
+                self.flush()
+                pending = 0
+        self.flush()
+        return self.written
+
+    def add(self, subscription: SubscriptionModel) -> None:
+        """Queue the rows of a subscription, and of its product when that is new."""
+        self._add_product(subscription)
+        self._row(
+            SubscriptionTable,
+            subscription_id=subscription.subscription_id,
+            description=subscription.description,
+            status=_str(subscription.status),
+            product_id=subscription.product.product_id,
+            customer_id=subscription.customer_id,
+            insync=subscription.insync,
+            start_date=subscription.start_date,
+            end_date=subscription.end_date,
+            note=subscription.note,
+        )
+        blocks, _ = _block_fields(type(subscription), SubscriptionModel)
+        for name in blocks:
+            for block in self._blocks(getattr(subscription, name)):
+                self._add_block(subscription.subscription_id, block)
+        self.written += 1
+
+    def flush(self) -> None:
+        """Insert the queued rows in one transaction, parents before children."""
+        order = [
+            ProductTable.__table__,
+            FixedInputTable.__table__,
+            ProductBlockTable.__table__,
+            ResourceTypeTable.__table__,
+            product_product_block_association,
+            product_block_resource_type_association,
+            ProductBlockRelationTable.__table__,
+            SubscriptionTable.__table__,
+            SubscriptionInstanceTable.__table__,
+            SubscriptionInstanceValueTable.__table__,
+            SubscriptionInstanceRelationTable.__table__,
+        ]
+        for table in order:
+            if rows := self._rows.pop(table, None):
+                self.connection.execute(insert(table).on_conflict_do_nothing(), rows)
+        self.connection.commit()
+
+    def _row(self, table: Any, **values: Any) -> None:
+        self._rows.setdefault(getattr(table, "__table__", table), []).append(values)
+
+    @staticmethod
+    def _blocks(value: Any) -> List[ProductBlockModel]:
+        if isinstance(value, ProductBlockModel):
+            return [value]
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, ProductBlockModel)]
+        return []
+
+    def _add_block(self, subscription_id: UUID, block: ProductBlockModel) -> None:
+        """Queue the instance of a product block owned by the subscription, with its values and relations."""
+        cls = type(block)
+        self._add_product_block(cls)
+        self._row(
+            SubscriptionInstanceTable,
+            subscription_instance_id=block.subscription_instance_id,
+            subscription_id=subscription_id,
+            product_block_id=block.product_block_id,
+            label=block.label,
+        )
+        blocks, values = _block_fields(cls, ProductBlockModel)
+        for name in values:
+            value = getattr(block, name)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not None:
+                    self._row(
+                        SubscriptionInstanceValueTable,
+                        subscription_instance_id=block.subscription_instance_id,
+                        resource_type_id=self._resource_types[name],
+                        value=_str(item),
+                    )
+        for name in blocks:
+            for order_id, child in enumerate(self._blocks(getattr(block, name))):
+                self._row(
+                    SubscriptionInstanceRelationTable,
+                    in_use_by_id=block.subscription_instance_id,
+                    depends_on_id=child.subscription_instance_id,
+                    order_id=order_id,
+                    domain_model_attr=name,
+                )
+                self._add_block_relation(block.product_block_id, child)
+                # Product blocks of other subscriptions are written with their own subscription
+                if child.owner_subscription_id == subscription_id:
+                    self._add_block(subscription_id, child)
+
+    def _add_product(self, subscription: SubscriptionModel) -> None:
+        product = subscription.product
+        if product.product_id in self._products:
+            return
+        self._products.add(product.product_id)
+        self._row(
+            ProductTable,
+            product_id=product.product_id,
+            name=product.name,
+            description=product.description,
+            product_type=product.product_type,
+            tag=product.tag,
+            status=_str(product.status),
+            created_at=_EPOCH,
+        )
+        cls = type(subscription)
+        blocks, fixed_inputs = _block_fields(cls, SubscriptionModel)
+        for name in fixed_inputs:
+            alias = field_alias(cls, name)
+            self._row(
+                FixedInputTable,
+                fixed_input_id=uuid5(NAMESPACE_URL, f"fixed_input/{product.name}/{alias}"),
+                name=alias,
+                value=_str(getattr(subscription, name)),
+                product_id=product.product_id,
+                created_at=_EPOCH,
+            )
+        for name in blocks:
+            for block in self._blocks(getattr(subscription, name)):
+                self._add_product_block(type(block))
+                self._row(
+                    product_product_block_association,
+                    product_id=product.product_id,
+                    product_block_id=block.product_block_id,
+                )
+
+    def _add_product_block(self, cls: Type[ProductBlockModel]) -> None:
+        product_block_id = cls.product_block_id  # type: ignore[attr-defined]
+        if product_block_id in self._product_blocks:
+            return
+        self._product_blocks.add(product_block_id)
+        self._row(
+            ProductBlockTable,
+            product_block_id=product_block_id,
+            name=cls.name,
+            description=cls.description,  # type: ignore[attr-defined]
+            tag=self.block_tags.get(cls.name, cls.tag),  # type: ignore[attr-defined, arg-type]
+            status="active",
+            created_at=_EPOCH,
+        )
+        for name in _block_fields(cls, ProductBlockModel)[1]:
+            if name not in self._resource_types:
+                self._resource_types[name] = uuid5(NAMESPACE_URL, f"resource_type/{name}")
+                self._row(
+                    ResourceTypeTable,
+                    resource_type_id=self._resource_types[name],
+                    resource_type=name,
+                    description=name,
+                )
+            self._row(
+                product_block_resource_type_association,
+                product_block_id=product_block_id,
+                resource_type_id=self._resource_types[name],
+            )
+
+    def _add_block_relation(self, in_use_by_id: UUID, child: ProductBlockModel) -> None:
+        if (in_use_by_id, child.product_block_id) in self._block_relations:
+            return
+        self._block_relations.add((in_use_by_id, child.product_block_id))
+        self._add_product_block(type(child))
+        self._row(ProductBlockRelationTable, in_use_by_id=in_use_by_id, depends_on_id=child.product_block_id)
@@ -0,0 +1,115 @@
+"""Report the NetBox lookups every asiera code path makes, against the in-process fake NetBox.
+
+    python -m benchmarks.netbox_calls
+    python -m benchmarks.netbox_calls --latency 0.02 --product "IPT static" --json
+
+Builds a subscription of every product (see `products.PRODUCT_TYPE_PATHS`) with `factories.ModelFactory` and runs
+`title()`, `description()`, `build_payload()` for each of its product blocks that has one, and serialization
+(computed fields), plus `resolve_customer()` once. Prints the lookups per function for each, and the time taken with
+`--latency` seconds per lookup. Needs the asiera environment, with `services.netbox` importable.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import types
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+CUSTOMER_ID = "1234"
+
+
+def _blocks(value: Any) -> Iterator[Any]:
+    """All product blocks of a subscription or product block, depth first."""
+    from orchestrator.domain.base import ProductBlockModel
+
+    for name in type(value).model_fields:
+        field = getattr(value, name)
+        for item in field if isinstance(field, list) else [field]:
+            if isinstance(item, ProductBlockModel):
+                yield item
+                yield from _blocks(item)
+
+
+def _measure(netbox: Any, operation: Callable[[], Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with netbox.counting() as calls:
+        try:
+            operation()
+            error = None
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+    seconds = time.perf_counter() - start
+    result: Dict[str, Any] = {"calls": dict(calls), "total": sum(calls.values()), "seconds": seconds}
+    if error:
+        result["error"] = error
+    return result
+
+
+def code_paths(product_name: str, path: str, seed: int) -> Iterator[Tuple[str, Callable[[], Any]]]:
+    """(name, operation) of every code path of a product that can look up something in NetBox."""
+    from benchmarks.factories import ModelFactory, dump
+    from benchmarks.graph import load
+    from products.services.description import description
+    from products.services.netbox.netbox import build_payload
+    from products.services.title import title
+
+    subscription = ModelFactory(seed=seed).subscription(load(path), product_name=product_name, customer_id=CUSTOMER_ID)
+    for function in (title, description):
+        if function.dispatch(type(subscription)) is not function.dispatch(object):
+            yield function.__name__, lambda function=function: function(subscription)  # type: ignore[misc]
+    generic = build_payload.dispatch(object)
+    for block in _blocks(subscription):
+        if build_payload.dispatch(type(block)) is not generic:
+            yield f"build_payload[{type(block).__name__}]", lambda block=block: build_payload(block, subscription)
+    yield "model_dump", lambda: dump(subscription)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--product", action="append", help="Products to run (default: all)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per NetBox lookup")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    for path in reversed(TREES["asiera"].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    import products
+    from benchmarks.fake_netbox import FakeNetbox, format_calls
+    from products.services.customer_type import resolve_customer
+
+    netbox = FakeNetbox(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    report: Dict[str, Dict[str, Any]] = {}
+    with netbox.installed():
+        root = types.SimpleNamespace(customer_id=CUSTOMER_ID)
+        report["customer"] = {"resolve_customer": _measure(netbox, lambda: asyncio.run(resolve_customer(root)))}
+        for product_name, path in products.PRODUCT_TYPE_PATHS.items():
+            if args.product and product_name not in args.product:
+                continue
+            try:
+                report[product_name] = {
+                    name: _measure(netbox, operation) for name, operation in code_paths(product_name, path, args.seed)
+                }
+            except Exception as exc:
+                report[product_name] = {"build": {"error": f"{type(exc).__name__}: {exc}"}}
+
+    if args.json:
+        print(json.dumps(report, indent=2))  # noqa: T201
+        return
+    for product_name, paths in report.items():
+        print(product_name)  # noqa: T201
+        for name, result in paths.items():
+            outcome = result.get("error") or format_calls(Counter(result["calls"]))
+            milliseconds = result.get("seconds", 0) * 1000
+            print(f"  {name:<56} {result.get('total', 0):3} {milliseconds:9.1f} ms  {outcome}")  # noqa: T201
+    print(f"{sum(netbox.calls.values())} lookups: {format_calls(netbox.calls)}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Single measurements, each run by `run.py` in a fresh interpreter.
+
+    python -m benchmarks.probe import esnetorch esnetorch.products.product_blocks.nes
+    python -m benchmarks.probe throughput ihc --min-time 1.0
+    python -m benchmarks.probe registry eager
+
+Prints one JSON object on the last line of stdout.
+"""
+
+import argparse
+import importlib
+import json
+import statistics
+import sys
+import time
+import traceback
+from typing import Any, Callable, Dict, List
+
+from benchmarks.trees import REPO_ROOT, SCENARIOS, TREES
+
+
+def _setup_path(tree_name: str) -> None:
+    for path in reversed(TREES[tree_name].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+
+
+class ClassBuildTimer:
+    """Time spent creating pydantic model classes, measured in the pydantic model metaclass."""
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.classes = 0
+        self._depth = 0
+
+    def install(self) -> None:
+        import pydantic
+
+        metaclass = type(pydantic.BaseModel)
+        original = metaclass.__new__
+        timer = self
+
+        def timed_new(mcs, name, bases, namespace, **kwargs):  # type: ignore[no-untyped-def]
+            timer._depth += 1
+            start = time.perf_counter()
+            try:
+                return original(mcs, name, bases, namespace, **kwargs)
+            finally:
+                timer._depth -= 1
+                if not timer._depth:
+                    timer.seconds += time.perf_counter() - start
+                timer.classes += 1
+
+        metaclass.__new__ = staticmethod(timed_new)
+
+
+def probe_import(tree_name: str, module: str) -> Dict[str, Any]:
+    _setup_path(tree_name)
+    start = time.perf_counter()
+    import orchestrator.domain  # noqa: F401
+
+    result: Dict[str, Any] = {"orchestrator_seconds": time.perf_counter() - start}
+    modules_before = len(sys.modules)
+    timer = ClassBuildTimer()
+    timer.install()
+    start = time.perf_counter()
+    try:
+        importlib.import_module(module)
+    except Exception as exc:
+        result["error"] = f"{type(exc).__name__}: {exc}"
+    result.update(
+        import_seconds=time.perf_counter() - start,
+        class_build_seconds=timer.seconds,
+        classes_built=timer.classes,
+        modules_imported=len(sys.modules) - modules_before,
+    )
+    return result
+
+
+def probe_registry(mode: str, product: str) -> Dict[str, Any]:
+    """Time importing the asiera product registry: without product types (lazy), with one (lookup) or all (eager)."""
+    _setup_path("asiera")
+    import orchestrator.domain
+
+    modules_before = len(sys.modules)
+    timer = ClassBuildTimer()
+    timer.install()
+    start = time.perf_counter()
+    products = importlib.import_module("products")
+    if mode == "lookup":
+        orchestrator.domain.SUBSCRIPTION_MODEL_REGISTRY[product]
+    elif mode == "eager":
+        products.register_all()
+    return {
+        "import_seconds": time.perf_counter() - start,
+        "class_build_seconds": timer.seconds,
+        "classes_built": timer.classes,
+        "modules_imported": len(sys.modules) - modules_before,
+    }
+
+
+def _time(operation: Callable[[], Any], min_time: float, rounds: int) -> Dict[str, Any]:
+    """Run `operation` in `rounds` rounds of at least `min_time` / `rounds` seconds each."""
+    operation()
+    per_op: List[float] = []
+    total_ops = 0
+    for _ in range(rounds):
+        ops = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < min_time / rounds or not ops:
+            operation()
+            ops += 1
+        per_op.append(elapsed / ops)
+        total_ops += ops
+    return {
+        "ops": total_ops,
+        "seconds_per_op": min(per_op),
+        "median_seconds_per_op": statistics.median(per_op),
+        "ops_per_second": 1 / min(per_op),
+    }
+
+
+def probe_throughput(scenario_name: str, min_time: float, rounds: int, seed: int) -> Dict[str, Any]:
+    scenario = SCENARIOS[scenario_name]
+    _setup_path(scenario.tree)
+
+    from benchmarks.factories import ModelFactory, dump, dump_json, validate, without_serializable_properties
+
+    module_name, _, class_name = scenario.model.partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+
+    factory = ModelFactory(seed=seed, list_sizes=scenario.list_sizes)
+    model = factory.subscription(cls, product_name=scenario.product_name)
+    with without_serializable_properties():
+        data = dump(model)
+        return {
+            "model": scenario.model,
+            "product_blocks": factory.blocks_built,
+            "json_bytes": len(dump_json(model)),
+            "validate": _time(lambda: validate(cls, data), min_time, rounds),
+            "dump": _time(lambda: dump(model), min_time, rounds),
+            "dump_json": _time(lambda: dump_json(model), min_time, rounds),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("tree", choices=sorted(TREES))
+    import_parser.add_argument("module")
+    throughput_parser = commands.add_parser("throughput")
+    throughput_parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    throughput_parser.add_argument("--min-time", type=float, default=1.0)
+    throughput_parser.add_argument("--rounds", type=int, default=5)
+    throughput_parser.add_argument("--seed", type=int, default=0)
+    registry_parser = commands.add_parser("registry")
+    registry_parser.add_argument("mode", choices=["lazy", "lookup", "eager"])
+    registry_parser.add_argument("--product", default="L2VPN Port-to-Port")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "import":
+            result = probe_import(args.tree, args.module)
+        elif args.command == "registry":
+            result = probe_registry(args.mode, args.product)
+        else:
+            result = probe_throughput(args.scenario, args.min_time, args.rounds, args.seed)
+    except Exception as exc:
+        traceback.print_exc(file=sys.stderr)
+        result = {"error": f"{type(exc).__name__}: {exc}"}
+    print(json.dumps(result))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
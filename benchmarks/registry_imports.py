@@ -0,0 +1,56 @@
+"""Compare importing the asiera product registry with lazy and eager registration of the product types.
+
+    python -m benchmarks.registry_imports
+    python -m benchmarks.registry_imports --python ../asiera-venv/bin/python --repeat 10 --json
+
+Runs `benchmarks.probe registry` in a fresh interpreter for each mode, `--repeat` times, keeping the fastest run:
+
+- `lazy`: `import products`, as a worker or CLI tool that has not looked up a product yet;
+- `lookup`: `import products` and one lookup of `--product` in the registry, which imports only that product type;
+- `eager`: `import products` and `register_all()`, as the API and the domain model migrations do at startup, which
+  costs the same as importing every product type up front.
+
+Importing orchestrator-core itself is not included.
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import probe
+
+MODES = ("lazy", "lookup", "eager")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--python", default=sys.executable, help="Interpreter of an environment with asiera's requirements"
+    )
+    parser.add_argument("--product", default="L2VPN Port-to-Port", help="Product to look up in the lookup mode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for mode in MODES:
+        runs = [probe(args.python, "registry", mode, "--product", args.product) for _ in range(args.repeat)]
+        ok = [run for run in runs if "error" not in run]
+        results[mode] = min(ok, key=lambda run: run["import_seconds"]) if ok else runs[-1]
+
+    if args.json:
+        print(json.dumps(results, indent=2))  # noqa: T201
+        return
+    for mode, result in results.items():
+        if "error" in result:
+            print(f"{mode:<8} {result['error']}")  # noqa: T201
+            continue
+        print(  # noqa: T201
+            f"{mode:<8} {result['import_seconds'] * 1000:8.1f} ms, {result['classes_built']:>5} classes built, "
+            f"{result['modules_imported']:>4} modules"
+        )
+
+
+if __name__ == "__main__":
+    main()
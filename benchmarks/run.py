@@ -0,0 +1,133 @@
+"""Run the benchmarks and store the results as JSON.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --tree esnetorch --repeat 5
+    python -m benchmarks.run --python asiera=/path/to/asiera-venv/bin/python --output results/asiera.json
+
+Every import is measured in a fresh interpreter, `--repeat` times, keeping the fastest run. The trees need different
+orchestrator-core versions; use `--python TREE=INTERPRETER` to run a tree with the interpreter of its own environment.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.trees import REPO_ROOT, SCENARIOS, TREES
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def probe(python: str, *args: str) -> Dict[str, Any]:
+    """Run `python -m benchmarks.probe` with `args` in a fresh interpreter and return its JSON result."""
+    completed = subprocess.run(  # noqa: S603
+        [python, "-m", "benchmarks.probe", *args], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    lines = completed.stdout.strip().splitlines()
+    if not lines:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output"}
+    return json.loads(lines[-1])
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(  # noqa: S603, S607
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _python_version(python: str) -> str:
+    return subprocess.run(  # noqa: S603
+        [python, "-c", "import sys, pydantic, orchestrator; print(sys.version.split()[0], pydantic.VERSION, "
+         "orchestrator.__version__)"],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def bench_imports(tree_name: str, python: str, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for module in TREES[tree_name].modules():
+        runs = [probe(python, "import", tree_name, module) for _ in range(repeat)]
+        ok = [run for run in runs if "error" not in run]
+        if not ok:
+            results[module] = runs[-1]
+        else:
+            results[module] = min(ok, key=lambda run: run["import_seconds"])
+        status = results[module].get("error") or f"{results[module]['import_seconds'] * 1000:8.1f} ms"
+        print(f"  {module:<72} {status}", file=sys.stderr)  # noqa: T201
+    return results
+
+
+def bench_throughput(tree_name: str, python: str, min_time: float, seed: int) -> Dict[str, Any]:
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        if scenario.tree != tree_name:
+            continue
+        results[name] = probe(python, "throughput", name, "--min-time", str(min_time), "--seed", str(seed))
+        if "error" in results[name]:
+            print(f"  {name:<24} {results[name]['error']}", file=sys.stderr)  # noqa: T201
+        else:
+            summary = "  ".join(
+                f"{operation} {results[name][operation]['ops_per_second']:9.1f}/s"
+                for operation in ("validate", "dump", "dump_json")
+            )
+            print(f"  {name:<24} {summary}", file=sys.stderr)  # noqa: T201
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tree", action="append", choices=sorted(TREES), help="Trees to run (default: all)")
+    parser.add_argument("--python", action="append", default=[], metavar="TREE=INTERPRETER")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per import measurement")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds per throughput measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-imports", action="store_true")
+    parser.add_argument("--skip-throughput", action="store_true")
+    parser.add_argument("--output", type=Path, help="Result file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    interpreters = dict(option.split("=", 1) for option in args.python)
+    started = datetime.now(timezone.utc)
+    result: Dict[str, Any] = {
+        "meta": {
+            "started": started.isoformat(),
+            "git_commit": _git_commit(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "min_time": args.min_time,
+            "seed": args.seed,
+            "interpreters": {},
+        },
+        "imports": {},
+        "throughput": {},
+    }
+
+    start = time.perf_counter()
+    for tree_name in args.tree or list(TREES):
+        python = interpreters.get(tree_name, sys.executable)
+        result["meta"]["interpreters"][tree_name] = {"path": python, "version": _python_version(python)}
+        if not args.skip_imports:
+            print(f"{tree_name}: imports", file=sys.stderr)  # noqa: T201
+            result["imports"][tree_name] = bench_imports(tree_name, python, args.repeat)
+        if not args.skip_throughput:
+            print(f"{tree_name}: throughput", file=sys.stderr)  # noqa: T201
+            result["throughput"][tree_name] = bench_throughput(tree_name, python, args.min_time, args.seed)
+    result["meta"]["duration_seconds"] = time.perf_counter() - start
+
+    output = args.output or RESULTS_DIR / f"{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, sort_keys=True))
+    print(f"Results written to {output}", file=sys.stderr)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""The product trees in this repository and how to import them."""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass(frozen=True)
+class Tree:
+    name: str
+    # Directory that contains the top level package
+    root: Path
+    package: str
+    # Needed on sys.path to import the tree, relative to the repository root
+    sys_path: Tuple[str, ...] = ()
+
+    @property
+    def package_dir(self) -> Path:
+        return self.root.joinpath(*self.package.split("."))
+
+    def modules(self) -> List[str]:
+        """All modules of the tree, sorted, without importing any of them."""
+        modules = []
+        for path in sorted(self.package_dir.rglob("*.py")):
+            if "__pycache__" in path.parts:
+                continue
+            parts = path.relative_to(self.root).with_suffix("").parts
+            if parts[-1] == "__init__":
+                parts = parts[:-1]
+            modules.append(".".join(parts))
+        return modules
+
+
+TREES: Dict[str, Tree] = {
+    "asiera": Tree("asiera", REPO_ROOT / "asiera", "products", sys_path=("asiera",)),
+    "surf": Tree("surf", REPO_ROOT, "surf.products", sys_path=(".",)),
+    "esnetorch": Tree("esnetorch", REPO_ROOT, "esnetorch.products", sys_path=(".",)),
+}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A fully populated subscription model to measure validation and serialization with."""
+
+    name: str
+    tree: str
+    # "module:Class"
+    model: str
+    product_name: str
+    # Number of product blocks to create per list field, by field name
+    list_sizes: Dict[str, int] = field(default_factory=dict)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario(
+            "l2vpn_pp",
+            "asiera",
+            "products.product_types.l2vpn_pp:L2vpnPP",
+            "L2VPN Port-to-Port",
+            list_sizes={"saps": 2},
+        ),
+        Scenario(
+            "sn8_corelink",
+            "surf",
+            "surf.products.product_types.sn8_corelink:Sn8Corelink",
+            "SN8 Corelink",
+            list_sizes={"port_pairs": 8, "aggregates": 2},
+        ),
+        Scenario(
+            "ihc",
+            "esnetorch",
+            "esnetorch.products.product_types.ihc:InternalHostConnectivity",
+            "Internal Host Connectivity",
+            list_sizes={"connections": 16, "lag_members": 2, "mirrored_sources": 1},
+        ),
+    ]
+}
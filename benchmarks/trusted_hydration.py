@@ -0,0 +1,122 @@
+"""Compare validated and trusted construction of surf product blocks from database values.
+
+    python -m benchmarks.trusted_hydration
+    python -m benchmarks.trusted_hydration --blocks 10000 --json
+
+Builds `--blocks` product blocks of each class with `factories.ModelFactory`, turns them into the keyword arguments
+`from_db()` passes (every value a string, as stored; nested product blocks as models) and constructs them again, once
+with full pydantic validation and once in trusted mode (`surf.products.services.trusted_hydration`). Checks that both
+give the same models, and prints blocks per second for each (the best of `--repeat` runs).
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+BLOCKS = [
+    "surf.products.product_blocks.sp:Sn8ServicePortBlock",
+    "surf.products.product_blocks.sap_sn8:Sn8ServiceAttachPointBlock",
+    "surf.products.product_blocks.peer:PeerBlock",
+    "surf.products.product_blocks.ip_peer_group:IpPeerGroupBlock",
+]
+
+
+def stored(block: Any) -> Dict[str, Any]:
+    """The keyword arguments `from_db()` builds `block` from."""
+    values: Dict[str, Any] = {
+        "subscription_instance_id": block.subscription_instance_id,
+        "owner_subscription_id": block.owner_subscription_id,
+        "label": block.label,
+    }
+    for name in type(block)._non_product_block_fields_:
+        value = getattr(block, name)
+        if isinstance(value, list):
+            values[name] = [_str(item) for item in value]
+        elif value is not None:
+            values[name] = _str(value)
+    for name in type(block)._product_block_fields_:
+        values[name] = getattr(block, name)
+    return values
+
+
+def _str(value: Any) -> str:
+    return str(value.value) if isinstance(value, Enum) else str(value)
+
+
+def same(a: Any, b: Any) -> bool:
+    """Whether two models have the same field values, of the same types, including their nested product blocks.
+
+    Not with `==`, which evaluates the serializable properties (some of which query the database).
+    """
+    from pydantic import BaseModel
+
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, BaseModel):
+        return a.__dict__.keys() == b.__dict__.keys() and all(same(a.__dict__[k], b.__dict__[k]) for k in a.__dict__)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _rate(cls: Any, rows: List[Dict[str, Any]], repeat: int) -> Any:
+    """Best rate of `repeat` runs, and the models of the last one."""
+    best = 0.0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        models = [cls(**row) for row in rows]
+        best = max(best, len(rows) / (time.perf_counter() - start))
+    return best, models
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=10_000, help="Product blocks per class")
+    parser.add_argument("--block", action="append", help="Product block class as module:Class (default: a set)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per path, the best counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    for path in reversed(TREES["surf"].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    from surf.products.services import trusted_hydration
+
+    from benchmarks.factories import ModelFactory
+    from benchmarks.graph import load
+
+    results = {}
+    for path in args.block or BLOCKS:
+        cls = load(path)
+        factory = ModelFactory(seed=args.seed)
+        rows = [stored(factory.block(cls)) for _ in range(args.blocks)]
+        validated_rate, validated = _rate(cls, rows, args.repeat)
+        with trusted_hydration.trusted_hydration("on"), trusted_hydration.hydrating():
+            trusted_rate, trusted = _rate(cls, rows, args.repeat)
+        results[cls.__name__] = {
+            "validated_per_second": validated_rate,
+            "trusted_per_second": trusted_rate,
+            "speedup": trusted_rate / validated_rate,
+            "equal": all(same(a, b) for a, b in zip(validated, trusted)),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))  # noqa: T201
+        return
+    print(f"{'Block':<40} {'validated/s':>12} {'trusted/s':>12} {'speedup':>8}  equal")  # noqa: T201
+    for name, result in results.items():
+        print(  # noqa: T201
+            f"{name:<40} {result['validated_per_second']:>12.0f} {result['trusted_per_second']:>12.0f}"
+            f" {result['speedup']:>7.1f}x  {result['equal']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compare `VlanRanges` and `VlanBitset` (surf) on the VLAN checks of a port with many SAPs.
+
+    python -m benchmarks.vlan_bitset
+    python -m benchmarks.vlan_bitset --ranges 4000 --json
+
+Makes `--ranges` random VLAN ranges (the SAPs on a port, as stored strings) and measures, with both implementations:
+parsing them, their union (the VLANs in use), the free VLANs (2-4094 without those in use), checking whether a new SAP
+fits, and serializing the free VLANs. Checks that both give the same results.
+
+Also measures normalizing the VLANs in use on the port, as a list of ints as the IMS returns them, into a `VlanRanges`
+(as `Sn8ServicePort.get_port_used_vlans()` does): directly, and through a `VlanBitset`.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.trees import REPO_ROOT, TREES
+
+
+def _seconds(operation: Callable[[], Any], repeat: int) -> Any:
+    """Best time of `repeat` runs, and the result of the last one."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = operation()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ranges", type=int, default=1000, help="VLAN ranges (SAPs) on the port")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation, the best counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    for path in reversed(TREES["surf"].sys_path):
+        sys.path.insert(0, str(REPO_ROOT / path))
+    from orchestrator.utils.vlans import VlanRanges
+    from surf.products.services.vlan_bitset import VlanBitset
+
+    rnd = random.Random(args.seed)
+    stored = []
+    for _ in range(args.ranges):
+        start = rnd.randint(2, 4094)
+        end = min(start + rnd.choice((0, 0, 0, 1, 9, 99)), 4094)
+        stored.append(f"{start}-{end}" if end > start else str(start))
+    port_vlans = [vlan for value in stored for vlan in VlanRanges(value)]
+    rnd.shuffle(port_vlans)
+    request_start = rnd.randint(2, 4000)
+    request = f"{request_start}-{request_start + 3}"
+
+    def ranges_checks(parsed: List[Any]) -> Any:
+        used = reduce(lambda a, b: a | b, parsed, VlanRanges())
+        free = VlanRanges("2-4094") - used
+        return used, free, VlanRanges(request).isdisjoint(used), str(free)
+
+    def bitset_checks(parsed: List[Any]) -> Any:
+        used = VlanBitset.union_of(parsed)
+        free = VlanBitset.range(2, 4094) - used
+        return used, free, VlanBitset.parse(request).isdisjoint(used), str(free)
+
+    results: Dict[str, Dict[str, float]] = {}
+    outcomes = {}
+    implementations = (
+        ("VlanRanges", VlanRanges, ranges_checks, lambda: VlanRanges(port_vlans)),
+        ("VlanBitset", VlanBitset.parse, bitset_checks, lambda: VlanBitset.of(port_vlans).to_vlan_ranges()),
+    )
+    for name, cls, checks, normalize in implementations:
+        parse_seconds, parsed = _seconds(lambda cls=cls: [cls(value) for value in stored], args.repeat)
+        check_seconds, outcome = _seconds(lambda checks=checks, parsed=parsed: checks(parsed), args.repeat)
+        normalize_seconds, normalized = _seconds(normalize, args.repeat)
+        results[name] = {
+            "parse_ms": parse_seconds * 1000,
+            "checks_ms": check_seconds * 1000,
+            "normalize_ms": normalize_seconds * 1000,
+        }
+        outcomes[name] = (str(outcome[0]), str(outcome[1]), outcome[2], outcome[3], str(normalized))
+
+    same = outcomes["VlanRanges"] == outcomes["VlanBitset"]
+    if args.json:
+        output = {"ranges": args.ranges, "vlans": len(port_vlans), "results": results, "same": same}
+        print(json.dumps(output, indent=2))  # noqa: T201
+        return
+    print(f"{args.ranges} VLAN ranges on the port, {len(port_vlans)} VLANs to normalize")  # noqa: T201
+    print(f"{'':<12} {'parse ms':>10} {'checks ms':>10} {'normalize ms':>13}")  # noqa: T201
+    for name, result in results.items():
+        line = f"{name:<12} {result['parse_ms']:>10.2f} {result['checks_ms']:>10.2f} {result['normalize_ms']:>13.2f}"
+        print(line)  # noqa: T201
+    print(f"Same results: {same}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared BFD templates of Node Enrollments.
+
+Every NodeEnrollmentBlock owns its own BFD Template blocks, but nearly all nodes use the same handful of
+(template_name, interval, multiplier) combinations. The registry interns those combinations as immutable
+BFDTemplateSpec objects, so all nodes using a template share one object, and keeps a reverse index from template to
+the nodes using it for template rollouts.
+
+The per-node BFD Template blocks (and their uuid, the key in NSO) are not shared: they stay owned by the node and are
+still what gets saved.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from orchestrator.db import (
+    ProductBlockTable,
+    ResourceTypeTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    db,
+)
+from sqlalchemy import select
+
+from esnetorch.products.product_blocks.bfd import BFDTemplateInactive
+from esnetorch.products.product_blocks.nes import NodeEnrollmentBlockInactive
+
+
+class BFDTemplateSpec(NamedTuple):
+    """The settings of a BFD template that are shared between nodes."""
+
+    template_name: str
+    interval: int
+    multiplier: int
+
+
+class BFDTemplateRegistry:
+    """Interned BFD templates and the nodes that use them.
+
+    Example:
+    ```python
+    registry = BFDTemplateRegistry.from_db()
+    spec = registry.get("bfd-50ms", 50, 3)
+    for node_subscription_id in registry.nodes_using(spec):
+        ...
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._specs: Dict[BFDTemplateSpec, BFDTemplateSpec] = {}
+        self._nodes_by_spec: Dict[BFDTemplateSpec, Set[UUID]] = defaultdict(set)
+        self._specs_by_node: Dict[UUID, Tuple[BFDTemplateSpec, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def __contains__(self, spec: object) -> bool:
+        return spec in self._specs
+
+    def intern(self, template_name: str, interval: int, multiplier: int) -> BFDTemplateSpec:
+        """Return the shared BFDTemplateSpec for these settings."""
+        spec = BFDTemplateSpec(template_name, int(interval), int(multiplier))
+        with self._lock:
+            return self._specs.setdefault(spec, spec)
+
+    def intern_block(self, template: BFDTemplateInactive) -> BFDTemplateSpec:
+        if template.template_name is None or template.interval is None or template.multiplier is None:
+            raise ValueError(f"BFD template {template.subscription_instance_id} is not fully configured")
+        return self.intern(template.template_name, template.interval, template.multiplier)
+
+    def get(self, template_name: str, interval: int, multiplier: int) -> Optional[BFDTemplateSpec]:
+        return self._specs.get(BFDTemplateSpec(template_name, interval, multiplier))
+
+    def register_node(
+        self, node_subscription_id: UUID, specs: Iterable[BFDTemplateSpec]
+    ) -> Tuple[BFDTemplateSpec, ...]:
+        """Record (or replace) the templates used by a node and return them interned."""
+        interned = tuple(self.intern(*spec) for spec in specs)
+        with self._lock:
+            for spec in self._specs_by_node.get(node_subscription_id, ()):
+                self._nodes_by_spec[spec].discard(node_subscription_id)
+            self._specs_by_node[node_subscription_id] = interned
+            for spec in interned:
+                self._nodes_by_spec[spec].add(node_subscription_id)
+        return interned
+
+    def register_block(
+        self, node_subscription_id: UUID, block: NodeEnrollmentBlockInactive
+    ) -> Tuple[BFDTemplateSpec, ...]:
+        """Record the templates of an already hydrated Node Enrollment block.
+
+        Templates that are not fully configured (still inactive) are skipped, as in `load_bfd_template_specs`.
+        """
+        specs = [
+            self.intern_block(template)
+            for template in block.bfd_templates
+            if None not in (template.template_name, template.interval, template.multiplier)
+        ]
+        return self.register_node(node_subscription_id, specs)
+
+    def forget_node(self, node_subscription_id: UUID) -> None:
+        with self._lock:
+            for spec in self._specs_by_node.pop(node_subscription_id, ()):
+                self._nodes_by_spec[spec].discard(node_subscription_id)
+
+    def templates_of(self, node_subscription_id: UUID) -> Tuple[BFDTemplateSpec, ...]:
+        return self._specs_by_node.get(node_subscription_id, ())
+
+    def nodes_using(self, spec: BFDTemplateSpec) -> FrozenSet[UUID]:
+        """All nodes that use exactly this template."""
+        return frozenset(self._nodes_by_spec.get(spec, ()))
+
+    def nodes_using_name(self, template_name: str) -> Dict[BFDTemplateSpec, FrozenSet[UUID]]:
+        """All nodes using a template with this name, per interval and multiplier in use."""
+        return {
+            spec: frozenset(nodes)
+            for spec, nodes in self._nodes_by_spec.items()
+            if spec.template_name == template_name and nodes
+        }
+
+    @classmethod
+    def from_db(cls, node_subscription_ids: Optional[Iterable[UUID]] = None) -> "BFDTemplateRegistry":
+        """Build a registry from the database without hydrating any Node Enrollment.
+
+        All BFD Template values are read in a single query.
+
+        Args:
+            node_subscription_ids: Limit the registry to these NodeEnrollment subscriptions, all of them when None.
+
+        """
+        registry = cls()
+        for node_subscription_id, specs in load_bfd_template_specs(node_subscription_ids).items():
+            registry.register_node(node_subscription_id, specs)
+        return registry
+
+
+def load_bfd_template_specs(
+    node_subscription_ids: Optional[Iterable[UUID]] = None,
+) -> Dict[UUID, List[BFDTemplateSpec]]:
+    """Read the settings of all BFD Template blocks, grouped by the subscription owning them.
+
+    Blocks that are not fully configured (still inactive) are skipped.
+    """
+    stmt = (
+        select(
+            SubscriptionInstanceTable.subscription_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .join(
+            SubscriptionInstanceValueTable,
+            SubscriptionInstanceValueTable.subscription_instance_id
+            == SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(ProductBlockTable.name == BFDTemplateInactive.name)
+        .where(ResourceTypeTable.resource_type.in_(BFDTemplateSpec._fields))
+    )
+    if node_subscription_ids is not None:
+        stmt = stmt.where(SubscriptionInstanceTable.subscription_id.in_(set(node_subscription_ids)))
+
+    values: Dict[Tuple[UUID, UUID], Dict[str, str]] = defaultdict(dict)
+    for subscription_id, subscription_instance_id, resource_type, value in db.session.execute(stmt):
+        values[(subscription_id, subscription_instance_id)][resource_type] = value
+
+    specs: Dict[UUID, List[BFDTemplateSpec]] = defaultdict(list)
+    for (subscription_id, _), template in values.items():
+        if len(template) < len(BFDTemplateSpec._fields):
+            continue
+        specs[subscription_id].append(
+            BFDTemplateSpec(template["template_name"], int(template["interval"]), int(template["multiplier"]))
+        )
+    for subscription_specs in specs.values():
+        subscription_specs.sort()
+    return dict(specs)
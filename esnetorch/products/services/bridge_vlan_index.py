@@ -0,0 +1,273 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""VLANs in use per device and switch uplink by Bridge Service Blocks.
+
+Validating a new bridge service only needs to know which VLANs are taken on its device and switch uplink. The index
+keeps a bitmap (a Python int, bit n set when VLAN n is in use) per (device, switch_uplink_id), so checking for a
+conflict is a single bit test and finding the next free VLAN is a few integer operations. The index is built with one
+projection query and afterwards updated per subscription.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import (
+    ProductBlockTable,
+    ResourceTypeTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from esnetorch.products.product_blocks.service_edge import BridgeServiceBlockInactive
+
+logger = structlog.get_logger(__name__)
+
+VLAN_MIN = 1
+VLAN_MAX = 4094
+
+# (device, switch_uplink_id)
+BridgeKey = Tuple[str, int]
+
+
+class BridgeVlan(NamedTuple):
+    subscription_id: UUID
+    subscription_instance_id: UUID
+    device: str
+    switch_uplink_id: int
+    vlan: int
+
+    @property
+    def key(self) -> BridgeKey:
+        return self.device, self.switch_uplink_id
+
+
+def _check_vlan(vlan: int) -> None:
+    if not VLAN_MIN <= vlan <= VLAN_MAX:
+        raise ValueError(f"VLAN {vlan} is not in range {VLAN_MIN}-{VLAN_MAX}")
+
+
+def _conflict_error(entry: BridgeVlan, owner: BridgeVlan) -> ValueError:
+    return ValueError(
+        f"VLAN {entry.vlan} on {entry.device} uplink {entry.switch_uplink_id} is already used by bridge service "
+        f"{owner.subscription_instance_id}"
+    )
+
+
+def _range_mask(start: int, end: int) -> int:
+    """Bits start up to and including end set."""
+    return ((1 << (end + 1)) - 1) ^ ((1 << start) - 1)
+
+
+class BridgeVlanIndex:
+    """VLANs in use per (device, switch_uplink_id).
+
+    Example:
+    ```python
+    index = BridgeVlanIndex.from_db()
+    if (owner := index.conflict("sw-1", 12, 100)) is not None:
+        raise ValueError(f"VLAN 100 is already used by bridge service {owner}")
+    vlan = index.next_free("sw-1", 12)
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[BridgeKey, int] = defaultdict(int)
+        self._owners: Dict[Tuple[BridgeKey, int], BridgeVlan] = {}
+        self._by_instance: Dict[UUID, BridgeVlan] = {}
+        self._by_subscription: Dict[UUID, List[UUID]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._by_instance)
+
+    def in_use(self, device: str, switch_uplink_id: int) -> int:
+        """The bitmap of VLANs in use on a device and uplink."""
+        return self._bitmaps.get((device, switch_uplink_id), 0)
+
+    def is_free(self, device: str, switch_uplink_id: int, vlan: int) -> bool:
+        _check_vlan(vlan)
+        return not (self.in_use(device, switch_uplink_id) >> vlan) & 1
+
+    def conflict(self, device: str, switch_uplink_id: int, vlan: int) -> Optional[UUID]:
+        """Return the subscription_instance_id of the bridge service using this VLAN, None when it is free."""
+        if self.is_free(device, switch_uplink_id, vlan):
+            return None
+        return self._owners[((device, switch_uplink_id), vlan)].subscription_instance_id
+
+    def next_free(
+        self, device: str, switch_uplink_id: int, start: int = VLAN_MIN, end: int = VLAN_MAX
+    ) -> Optional[int]:
+        """The lowest VLAN from start up to and including end that is not in use, None when all are taken."""
+        _check_vlan(start)
+        _check_vlan(end)
+        if start > end:
+            raise ValueError(f"VLAN range {start}-{end} is empty")
+        free = ~self.in_use(device, switch_uplink_id) & _range_mask(start, end)
+        if not free:
+            return None
+        return (free & -free).bit_length() - 1
+
+    def add(self, entry: BridgeVlan) -> None:
+        """Register the VLAN of a bridge service.
+
+        Raises:
+            ValueError: when the VLAN is out of range or in use by another bridge service on the same device and uplink.
+
+        """
+        _check_vlan(entry.vlan)
+        with self._lock:
+            self._add(entry)
+
+    def _add(self, entry: BridgeVlan) -> None:
+        # Only called with the lock held
+        owner = self._owners.get((entry.key, entry.vlan))
+        if owner is not None and owner.subscription_instance_id != entry.subscription_instance_id:
+            raise _conflict_error(entry, owner)
+        self._remove(entry.subscription_instance_id)
+        self._bitmaps[entry.key] |= 1 << entry.vlan
+        self._owners[(entry.key, entry.vlan)] = entry
+        self._by_instance[entry.subscription_instance_id] = entry
+        self._by_subscription[entry.subscription_id].append(entry.subscription_instance_id)
+
+    def remove(self, subscription_instance_id: UUID) -> None:
+        with self._lock:
+            self._remove(subscription_instance_id)
+
+    def _remove(self, subscription_instance_id: UUID) -> None:
+        # Only called with the lock held
+        entry = self._by_instance.pop(subscription_instance_id, None)
+        if entry is None:
+            return
+        del self._owners[(entry.key, entry.vlan)]
+        self._bitmaps[entry.key] &= ~(1 << entry.vlan)
+        if not self._bitmaps[entry.key]:
+            del self._bitmaps[entry.key]
+        self._by_subscription[entry.subscription_id].remove(subscription_instance_id)
+        if not self._by_subscription[entry.subscription_id]:
+            del self._by_subscription[entry.subscription_id]
+
+    def allocate(
+        self, subscription_id: UUID, subscription_instance_id: UUID, device: str, switch_uplink_id: int
+    ) -> int:
+        """Take the lowest free VLAN on a device and uplink for a bridge service."""
+        with self._lock:
+            vlan = self.next_free(device, switch_uplink_id)
+            if vlan is None:
+                raise ValueError(f"No free VLAN left on {device} uplink {switch_uplink_id}")
+            self._add(BridgeVlan(subscription_id, subscription_instance_id, device, switch_uplink_id, vlan))
+        return vlan
+
+    def add_block(self, subscription_id: UUID, block: BridgeServiceBlockInactive) -> None:
+        """Register an already hydrated Bridge Service Block; blocks without VLAN, device or uplink are ignored."""
+        if block.vlan is None or block.device is None or block.switch_uplink_id is None:
+            return
+        self.add(
+            BridgeVlan(
+                subscription_id, block.subscription_instance_id, block.device, block.switch_uplink_id, block.vlan
+            )
+        )
+
+    def refresh_subscription(self, subscription_id: UUID) -> None:
+        """Reload the bridge services of one subscription after it was created, modified or terminated.
+
+        Raises:
+            ValueError: when a reloaded VLAN is out of range or in use by a bridge service of another subscription. The
+                index is left unchanged.
+
+        """
+        entries = load_bridge_vlans([subscription_id])
+        for entry in entries:
+            _check_vlan(entry.vlan)
+        with self._lock:
+            replaced = set(self._by_subscription.get(subscription_id, ()))
+            # Check all entries before changing anything: against the bridge services that stay and each other
+            taken: Dict[Tuple[BridgeKey, int], BridgeVlan] = {}
+            for entry in entries:
+                owner = taken.setdefault((entry.key, entry.vlan), entry)
+                if owner.subscription_instance_id == entry.subscription_instance_id:
+                    owner = self._owners.get((entry.key, entry.vlan))
+                    if owner is None or owner.subscription_instance_id in replaced:
+                        continue
+                if owner.subscription_instance_id != entry.subscription_instance_id:
+                    raise _conflict_error(entry, owner)
+            for subscription_instance_id in replaced:
+                self._remove(subscription_instance_id)
+            for entry in entries:
+                self._add(entry)
+
+    @classmethod
+    def from_db(cls) -> "BridgeVlanIndex":
+        """Build the index from all Bridge Service Blocks of subscriptions that are not terminated."""
+        index = cls()
+        entries = load_bridge_vlans()
+        with index._lock:
+            for entry in entries:
+                try:
+                    index._add(entry)
+                except ValueError as exc:
+                    logger.warning("Conflicting bridge service VLAN in database", error=str(exc))
+        logger.debug("Built bridge VLAN index", bridge_services=len(index), bridges=len(index._bitmaps))
+        return index
+
+
+def load_bridge_vlans(subscription_ids: Optional[Iterable[UUID]] = None) -> List[BridgeVlan]:
+    """Read vlan, device and switch_uplink_id of all Bridge Service Blocks in one query.
+
+    Blocks of terminated subscriptions and blocks that miss one of the values are left out.
+    """
+    resource_types = ("vlan", "device", "switch_uplink_id")
+    stmt = (
+        select(
+            SubscriptionInstanceTable.subscription_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(SubscriptionTable, SubscriptionTable.subscription_id == SubscriptionInstanceTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .join(
+            SubscriptionInstanceValueTable,
+            SubscriptionInstanceValueTable.subscription_instance_id
+            == SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(ProductBlockTable.name == BridgeServiceBlockInactive.name)
+        .where(ResourceTypeTable.resource_type.in_(resource_types))
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+
+    values: Dict[Tuple[UUID, UUID], Dict[str, str]] = defaultdict(dict)
+    for subscription_id, subscription_instance_id, resource_type, value in db.session.execute(stmt):
+        values[(subscription_id, subscription_instance_id)][resource_type] = value
+
+    return [
+        BridgeVlan(
+            subscription_id=subscription_id,
+            subscription_instance_id=subscription_instance_id,
+            device=bridge["device"],
+            switch_uplink_id=int(bridge["switch_uplink_id"]),
+            vlan=int(bridge["vlan"]),
+        )
+        for (subscription_id, subscription_instance_id), bridge in values.items()
+        if len(bridge) == len(resource_types)
+    ]
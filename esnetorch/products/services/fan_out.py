@@ -0,0 +1,223 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Render per-node payloads for every node that carries a prefix list or L3 service.
+
+All NodeEnrollment subscriptions involved are loaded up front in one bulk load (see `preload_subscriptions`), after
+which the render function runs for each node in a bounded thread pool. Render functions run outside the thread that
+owns the database session and must not use it; everything they need is on the blocks they get passed.
+
+With a `BFDTemplateRegistry`, the BFD templates of every loaded node are registered as the shared, immutable
+`BFDTemplateSpec` objects, so render functions can look them up with `templates_of()` and render each template once
+for all nodes that use it.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+from uuid import UUID
+
+import structlog
+from more_itertools import only
+from orchestrator.domain.base import ProductBlockModel
+
+from esnetorch.products.product_blocks.layer3 import L3BlockInactive
+from esnetorch.products.product_blocks.nes import NodeEnrollmentBlockInactive
+from esnetorch.products.product_blocks.prefix_list import PrefixListBlockInactive
+from esnetorch.products.product_types.prefix_list import PrefixList
+from esnetorch.products.services.bfd_templates import BFDTemplateRegistry
+from esnetorch.products.services.preload import preload_subscriptions
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_WORKERS = 16
+
+
+@dataclass
+class NodeResult(Generic[T]):
+    """Outcome of rendering the payload for one node."""
+
+    node_subscription_id: UUID
+    node_name: Optional[str]
+    duration: float
+    payload: Optional[T] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class FanOutReport(Generic[T]):
+    """Per-node results of a fan-out, with the time spent loading and rendering."""
+
+    load_duration: float
+    render_duration: float
+    results: List[NodeResult[T]] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> List[NodeResult[T]]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[NodeResult[T]]:
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def payloads(self) -> Dict[UUID, T]:
+        return {result.node_subscription_id: result.payload for result in self.succeeded}  # type: ignore[misc]
+
+    def slowest(self, count: int = 5) -> List[NodeResult[T]]:
+        return sorted(self.results, key=lambda result: result.duration, reverse=True)[:count]
+
+
+def load_node_enrollment_blocks(
+    node_subscription_ids: Iterable[UUID], bfd_templates: Optional[BFDTemplateRegistry] = None
+) -> Dict[UUID, NodeEnrollmentBlockInactive]:
+    """Load the Node Enrollment blocks of many NodeEnrollment (MPR, TPDR) subscriptions in one bulk load.
+
+    Args:
+        node_subscription_ids: NodeEnrollment subscriptions to load.
+        bfd_templates: Registers the BFD templates of every loaded node when given.
+
+    Raises:
+        ValueError: when one of the subscriptions does not exist or has no Node Enrollment block.
+
+    """
+    node_subscription_ids = list(dict.fromkeys(node_subscription_ids))
+    subscriptions = preload_subscriptions(node_subscription_ids)
+    missing = [
+        str(subscription_id) for subscription_id in node_subscription_ids if subscription_id not in subscriptions
+    ]
+    if missing:
+        raise ValueError(f"NodeEnrollment subscriptions not found: {', '.join(missing)}")
+
+    blocks: Dict[UUID, NodeEnrollmentBlockInactive] = {}
+    for subscription_id in node_subscription_ids:
+        instance = only(
+            instance
+            for instance in subscriptions[subscription_id].instances
+            if instance.product_block.name == NodeEnrollmentBlockInactive.name
+        )
+        if instance is None:
+            raise ValueError(f"Subscription {subscription_id} has no {NodeEnrollmentBlockInactive.name} block")
+        blocks[subscription_id] = ProductBlockModel.from_db(subscription_instance=instance)
+        if bfd_templates is not None:
+            bfd_templates.register_block(subscription_id, blocks[subscription_id])
+    return blocks
+
+
+def fan_out(
+    node_subscription_ids: Iterable[UUID],
+    render: Callable[[NodeEnrollmentBlockInactive], T],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    bfd_templates: Optional[BFDTemplateRegistry] = None,
+) -> FanOutReport[T]:
+    """Render a payload for every node, at most `max_workers` at a time.
+
+    A failing node does not stop the others; its exception is recorded on its result.
+
+    Example:
+    ```python
+    report = fan_out(node_ids, lambda node: build_config(node), max_workers=32)
+    for result in report.failed:
+        ...
+    ```
+
+    Args:
+        node_subscription_ids: NodeEnrollment (MPR, TPDR) subscriptions to render for.
+        render: Builds the payload for one node. Must not use the database session.
+        max_workers: Upper bound of nodes rendered concurrently.
+        bfd_templates: Registers the BFD templates of every node before rendering, for `render` to use.
+
+    Returns:
+        FanOutReport with one result per node, in the order of `node_subscription_ids`.
+
+    """
+    start = perf_counter()
+    blocks = load_node_enrollment_blocks(node_subscription_ids, bfd_templates)
+    load_duration = perf_counter() - start
+
+    def render_node(subscription_id: UUID, block: NodeEnrollmentBlockInactive) -> NodeResult[T]:
+        node_start = perf_counter()
+        try:
+            payload = render(block)
+        except Exception as exc:
+            return NodeResult(subscription_id, block.node_name, perf_counter() - node_start, error=exc)
+        return NodeResult(subscription_id, block.node_name, perf_counter() - node_start, payload=payload)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blocks))), thread_name_prefix="fan-out") as pool:
+        futures = [pool.submit(render_node, subscription_id, block) for subscription_id, block in blocks.items()]
+        report = FanOutReport[T](
+            load_duration=load_duration,
+            render_duration=0.0,
+            results=[future.result() for future in futures],
+        )
+    report.render_duration = perf_counter() - start
+
+    for result in report.results:
+        logger.debug(
+            "Rendered node payload",
+            node=result.node_name,
+            node_subscription_id=str(result.node_subscription_id),
+            duration=round(result.duration, 4),
+            ok=result.ok,
+        )
+    for result in report.failed:
+        logger.warning("Rendering node payload failed", node=result.node_name, error=str(result.error))
+    logger.info(
+        "Fan-out finished",
+        nodes=len(report.results),
+        failed=len(report.failed),
+        load_duration=round(report.load_duration, 3),
+        render_duration=round(report.render_duration, 3),
+    )
+    return report
+
+
+def fan_out_prefix_list(
+    prefix_list: PrefixListBlockInactive,
+    render: Callable[[NodeEnrollmentBlockInactive, PrefixListBlockInactive], T],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    bfd_templates: Optional[BFDTemplateRegistry] = None,
+) -> FanOutReport[T]:
+    """Render a prefix list for every node enrolled in it."""
+    return fan_out(
+        prefix_list.node_enrollment_subscription_id or [],
+        lambda node: render(node, prefix_list),
+        max_workers=max_workers,
+        bfd_templates=bfd_templates,
+    )
+
+
+def fan_out_l3_service(
+    l3_block: L3BlockInactive,
+    render: Callable[[NodeEnrollmentBlockInactive, PrefixListBlockInactive, L3BlockInactive], T],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    bfd_templates: Optional[BFDTemplateRegistry] = None,
+) -> FanOutReport[T]:
+    """Render an L3 service for every node that carries its prefix list."""
+    if not l3_block.prefix_list_subscription_id:
+        raise ValueError(f"L3 block {l3_block.subscription_instance_id} has no prefix list")
+    prefix_list = PrefixList.from_subscription(l3_block.prefix_list_subscription_id).prefix_list
+    return fan_out_prefix_list(
+        prefix_list,
+        lambda node, prefix_list_block: render(node, prefix_list_block, l3_block),
+        max_workers=max_workers,
+        bfd_templates=bfd_templates,
+    )
@@ -0,0 +1,222 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read-only snapshots of NodeEnrollment (MPR, TPDR) subscriptions for dashboards.
+
+A snapshot holds only what the dashboard shows: the node name, loopbacks, routing domain and the state of the
+management ports. Snapshots are built with four projection queries that select just those resource type values,
+without hydrating NodeEnrollmentBlock, EquipmentInterfaceBlock or LagMember models. Snapshots are plain tuples; they
+can not be changed or saved.
+"""
+
+import threading
+from collections import defaultdict
+from time import monotonic
+from typing import Collection, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import (
+    ProductBlockTable,
+    ProductTable,
+    ResourceTypeTable,
+    SubscriptionInstanceRelationTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from esnetorch.products.product_blocks.nes import NodeEnrollmentBlockInactive
+
+logger = structlog.get_logger(__name__)
+
+
+class MgmtPortSnapshot(NamedTuple):
+    subscription_instance_id: UUID
+    equipment_interface_id: Optional[int]
+    admin_state: Optional[str]
+    speed: Optional[str]
+
+
+class NodeEnrollmentSnapshot(NamedTuple):
+    subscription_id: UUID
+    product_name: str
+    status: str
+    description: str
+    node_name: Optional[str]
+    v4_loopback: Optional[str]
+    v6_loopback: Optional[str]
+    routing_domain: Optional[str]
+    mgmt_ports: Tuple[MgmtPortSnapshot, ...]
+
+
+NODE_RESOURCE_TYPES = ("node_name", "v4_loopback", "v6_loopback", "routing_domain")
+MGMT_PORT_RESOURCE_TYPES = ("equipment_interface_id", "admin_state", "speed")
+
+
+def _instance_values(instance_ids: Collection[UUID], resource_types: Iterable[str]) -> Dict[UUID, Dict[str, str]]:
+    values: Dict[UUID, Dict[str, str]] = defaultdict(dict)
+    if not instance_ids:
+        return values
+    stmt = (
+        select(
+            SubscriptionInstanceValueTable.subscription_instance_id,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(SubscriptionInstanceValueTable.subscription_instance_id.in_(instance_ids))
+        .where(ResourceTypeTable.resource_type.in_(list(resource_types)))
+    )
+    for subscription_instance_id, resource_type, value in db.session.execute(stmt):
+        values[subscription_instance_id][resource_type] = value
+    return values
+
+
+def load_node_snapshots(subscription_ids: Optional[Iterable[UUID]] = None) -> Dict[UUID, NodeEnrollmentSnapshot]:
+    """Build snapshots of NodeEnrollment (MPR, TPDR) subscriptions.
+
+    Args:
+        subscription_ids: Limit to these subscriptions, all subscriptions with a Node Enrollment block when None.
+
+    Returns:
+        Snapshots by subscription_id. Subscriptions without a Node Enrollment block are left out.
+
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            ProductTable.name,
+            SubscriptionTable.status,
+            SubscriptionTable.description,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(ProductTable, ProductTable.product_id == SubscriptionTable.product_id)
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == NodeEnrollmentBlockInactive.name)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    nodes = db.session.execute(stmt).all()
+    node_instance_ids = [node.subscription_instance_id for node in nodes]
+
+    stmt = (
+        select(SubscriptionInstanceRelationTable.in_use_by_id, SubscriptionInstanceRelationTable.depends_on_id)
+        .where(SubscriptionInstanceRelationTable.in_use_by_id.in_(node_instance_ids))
+        .where(SubscriptionInstanceRelationTable.domain_model_attr == "mgmt_ports")
+        .order_by(SubscriptionInstanceRelationTable.order_id)
+    )
+    port_ids: Dict[UUID, List[UUID]] = defaultdict(list)
+    if node_instance_ids:
+        for in_use_by_id, depends_on_id in db.session.execute(stmt):
+            port_ids[in_use_by_id].append(depends_on_id)
+
+    node_values = _instance_values(node_instance_ids, NODE_RESOURCE_TYPES)
+    port_values = _instance_values(
+        [port_id for ports in port_ids.values() for port_id in ports], MGMT_PORT_RESOURCE_TYPES
+    )
+
+    def port_snapshot(port_id: UUID) -> MgmtPortSnapshot:
+        values = port_values.get(port_id, {})
+        equipment_interface_id = values.get("equipment_interface_id")
+        return MgmtPortSnapshot(
+            subscription_instance_id=port_id,
+            equipment_interface_id=int(equipment_interface_id) if equipment_interface_id is not None else None,
+            admin_state=values.get("admin_state"),
+            speed=values.get("speed"),
+        )
+
+    snapshots = {}
+    for subscription_id, product_name, status, description, subscription_instance_id in nodes:
+        values = node_values.get(subscription_instance_id, {})
+        snapshots[subscription_id] = NodeEnrollmentSnapshot(
+            subscription_id=subscription_id,
+            product_name=product_name,
+            status=status,
+            description=description,
+            node_name=values.get("node_name"),
+            v4_loopback=values.get("v4_loopback"),
+            v6_loopback=values.get("v6_loopback"),
+            routing_domain=values.get("routing_domain"),
+            mgmt_ports=tuple(port_snapshot(port_id) for port_id in port_ids.get(subscription_instance_id, ())),
+        )
+    return snapshots
+
+
+class NodeSnapshotCache:
+    """All NodeEnrollment snapshots, kept up to date by lifecycle events.
+
+    Workflows that create, modify or terminate a NodeEnrollment call `handle_lifecycle_event` for it; the whole cache
+    is rebuilt when it is older than `max_age` seconds, to also pick up changes made outside of workflows.
+
+    Example:
+    ```python
+    cache = NodeSnapshotCache(max_age=300)
+    rows = cache.all()
+    cache.handle_lifecycle_event(subscription_id, SubscriptionLifecycle.ACTIVE)
+    ```
+    """
+
+    def __init__(self, max_age: Optional[float] = None) -> None:
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots: Dict[UUID, NodeEnrollmentSnapshot] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self.max_age is not None and monotonic() - self._loaded_at > self.max_age
+
+    def refresh(self) -> None:
+        """Rebuild the whole cache."""
+        snapshots = load_node_snapshots()
+        with self._lock:
+            self._snapshots = snapshots
+            self._loaded_at = monotonic()
+        logger.debug("Refreshed node snapshots", nodes=len(snapshots))
+
+    def all(self) -> List[NodeEnrollmentSnapshot]:
+        """All snapshots, sorted by node name."""
+        if self._is_stale():
+            self.refresh()
+        return sorted(self._snapshots.values(), key=lambda snapshot: snapshot.node_name or "")
+
+    def get(self, subscription_id: UUID) -> Optional[NodeEnrollmentSnapshot]:
+        if self._is_stale():
+            self.refresh()
+        return self._snapshots.get(subscription_id)
+
+    def invalidate(self, subscription_id: Optional[UUID] = None) -> None:
+        """Drop one snapshot, or mark the whole cache stale when no subscription is given."""
+        with self._lock:
+            if subscription_id is None:
+                self._loaded_at = None
+            else:
+                self._snapshots.pop(subscription_id, None)
+
+    def handle_lifecycle_event(self, subscription_id: UUID, status: SubscriptionLifecycle) -> None:
+        """Update the snapshot of one subscription after it changed or moved to another lifecycle state."""
+        if status == SubscriptionLifecycle.TERMINATED:
+            self.invalidate(subscription_id)
+            return
+        snapshot = load_node_snapshots([subscription_id]).get(subscription_id)
+        with self._lock:
+            if snapshot is None:
+                self._snapshots.pop(subscription_id, None)
+            else:
+                self._snapshots[subscription_id] = snapshot
@@ -0,0 +1,278 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of expanded prefix lists.
+
+A PrefixListBlock only stores a pointer (prefix_manager_id) to the list that is kept in the prefix manager. Every
+node enrolled in that prefix list needs the same expansion, so entries are fetched once per prefix_manager_id,
+revalidated with the etag handed out by the prefix manager and stored content-addressed: two prefix lists with the
+same content share one ExpandedPrefixList object.
+
+Prefixes are stored per address family as sorted, merged (start, end) integer ranges. That keeps entries small and
+makes diffing two versions of a list a linear sweep.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from ipaddress import IPv4Address, IPv6Address, ip_network, summarize_address_range
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+from uuid import UUID
+
+import structlog
+
+from esnetorch.products.product_blocks.prefix_list import PrefixListBlockInactive
+
+logger = structlog.get_logger(__name__)
+
+# Inclusive (start, end) of an address range, as integers
+Range = Tuple[int, int]
+Ranges = Tuple[Range, ...]
+
+
+@dataclass(frozen=True)
+class PrefixListVersion:
+    """A prefix list as returned by the prefix manager."""
+
+    etag: str
+    prefixes: List[str]
+
+
+class PrefixManager(Protocol):
+    def fetch(self, prefix_manager_id: str, etag: Optional[str] = None) -> Optional[PrefixListVersion]:
+        """Return the current version of a prefix list, or None when `etag` is still the current version."""
+
+
+def merge_ranges(ranges: Iterable[Range]) -> Ranges:
+    """Sort ranges and merge the ones that overlap or are adjacent."""
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+def subtract_ranges(ranges: Ranges, other: Ranges) -> Ranges:
+    """Return the parts of `ranges` that are not covered by `other`. Both need to be merged (see merge_ranges)."""
+    result: List[Range] = []
+    first = 0
+    for start, end in ranges:
+        while first < len(other) and other[first][1] < start:
+            first += 1
+        current = start
+        index = first
+        while index < len(other) and other[index][0] <= end:
+            if other[index][0] > current:
+                result.append((current, other[index][0] - 1))
+            current = max(current, other[index][1] + 1)
+            index += 1
+        if current <= end:
+            result.append((current, end))
+    return tuple(result)
+
+
+def to_ranges(prefixes: Iterable[str]) -> Tuple[Ranges, Ranges]:
+    """Convert prefixes to merged IPv4 and IPv6 integer ranges."""
+    ipv4: List[Range] = []
+    ipv6: List[Range] = []
+    for prefix in prefixes:
+        network = ip_network(prefix, strict=False)
+        family = ipv4 if network.version == 4 else ipv6
+        family.append((int(network.network_address), int(network.broadcast_address)))
+    return merge_ranges(ipv4), merge_ranges(ipv6)
+
+
+def _ranges_to_prefixes(ranges: Ranges, address_type: type) -> List[str]:
+    return [
+        str(network)
+        for start, end in ranges
+        for network in summarize_address_range(address_type(start), address_type(end))
+    ]
+
+
+@dataclass(frozen=True)
+class PrefixListDiff:
+    """Address ranges added and removed between two versions of a prefix list."""
+
+    added_ipv4: Ranges = ()
+    removed_ipv4: Ranges = ()
+    added_ipv6: Ranges = ()
+    removed_ipv6: Ranges = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.added_ipv4 or self.removed_ipv4 or self.added_ipv6 or self.removed_ipv6)
+
+    @property
+    def added(self) -> List[str]:
+        return _ranges_to_prefixes(self.added_ipv4, IPv4Address) + _ranges_to_prefixes(self.added_ipv6, IPv6Address)
+
+    @property
+    def removed(self) -> List[str]:
+        return _ranges_to_prefixes(self.removed_ipv4, IPv4Address) + _ranges_to_prefixes(
+            self.removed_ipv6, IPv6Address
+        )
+
+
+@dataclass(frozen=True)
+class ExpandedPrefixList:
+    """Content of a prefix list, addressed by the digest of its ranges."""
+
+    digest: str
+    ipv4: Ranges
+    ipv6: Ranges
+
+    @classmethod
+    def from_ranges(cls, ipv4: Ranges, ipv6: Ranges) -> "ExpandedPrefixList":
+        canonical = ";".join(
+            [",".join(f"{start}-{end}" for start, end in ipv4), ",".join(f"{start}-{end}" for start, end in ipv6)]
+        )
+        return cls(digest=hashlib.sha256(canonical.encode()).hexdigest(), ipv4=ipv4, ipv6=ipv6)
+
+    @property
+    def prefixes(self) -> List[str]:
+        """The shortest list of prefixes covering exactly the same addresses."""
+        return _ranges_to_prefixes(self.ipv4, IPv4Address) + _ranges_to_prefixes(self.ipv6, IPv6Address)
+
+    def diff(self, newer: "ExpandedPrefixList") -> PrefixListDiff:
+        if newer.digest == self.digest:
+            return PrefixListDiff()
+        return PrefixListDiff(
+            added_ipv4=subtract_ranges(newer.ipv4, self.ipv4),
+            removed_ipv4=subtract_ranges(self.ipv4, newer.ipv4),
+            added_ipv6=subtract_ranges(newer.ipv6, self.ipv6),
+            removed_ipv6=subtract_ranges(self.ipv6, newer.ipv6),
+        )
+
+
+EMPTY_PREFIX_LIST = ExpandedPrefixList.from_ranges((), ())
+
+
+@dataclass(frozen=True)
+class CachedPrefixList:
+    """A prefix list in the cache: the version the prefix manager handed out and its (shared) expansion."""
+
+    prefix_manager_id: str
+    etag: str
+    expanded: ExpandedPrefixList
+
+
+class PrefixListCache:
+    """Expanded prefix lists keyed by prefix_manager_id, deduplicated on content.
+
+    Example:
+    ```python
+    cache = PrefixListCache(prefix_manager)
+    subscription = PrefixList.from_subscription(subscription_id)
+    per_node = cache.for_block(subscription.prefix_list)
+    ```
+    """
+
+    def __init__(self, prefix_manager: PrefixManager) -> None:
+        self._prefix_manager = prefix_manager
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedPrefixList] = {}
+        self._contents: Dict[str, ExpandedPrefixList] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def unique_contents(self) -> int:
+        """Number of distinct expanded prefix lists held in the cache."""
+        return len(self._contents)
+
+    def get(self, prefix_manager_id: str) -> CachedPrefixList:
+        """Return the cached prefix list, fetching it from the prefix manager on first use."""
+        entry = self._entries.get(prefix_manager_id)
+        if entry is None:
+            entry, _ = self.refresh(prefix_manager_id)
+        return entry
+
+    def refresh(self, prefix_manager_id: str) -> Tuple[CachedPrefixList, PrefixListDiff]:
+        """Revalidate a prefix list with the prefix manager.
+
+        Returns:
+            The current entry and the changes compared to the previously cached version. The diff is empty when the
+            prefix manager reported the cached etag as current.
+
+        """
+        current = self._entries.get(prefix_manager_id)
+        version = self._prefix_manager.fetch(prefix_manager_id, etag=current.etag if current else None)
+        if version is None:
+            if current is None:
+                raise ValueError(f"Prefix manager returned no content for uncached prefix list {prefix_manager_id}")
+            return current, PrefixListDiff()
+
+        expanded = ExpandedPrefixList.from_ranges(*to_ranges(version.prefixes))
+        with self._lock:
+            expanded = self._contents.setdefault(expanded.digest, expanded)
+            entry = CachedPrefixList(prefix_manager_id=prefix_manager_id, etag=version.etag, expanded=expanded)
+            self._entries[prefix_manager_id] = entry
+            if current is not None:
+                self._release(current.expanded.digest)
+
+        diff = (current.expanded if current else EMPTY_PREFIX_LIST).diff(expanded)
+        if diff:
+            logger.debug(
+                "Prefix list changed",
+                prefix_manager_id=prefix_manager_id,
+                etag=version.etag,
+                added=len(diff.added_ipv4) + len(diff.added_ipv6),
+                removed=len(diff.removed_ipv4) + len(diff.removed_ipv6),
+            )
+        return entry, diff
+
+    def for_block(self, block: PrefixListBlockInactive) -> Dict[UUID, CachedPrefixList]:
+        """Map every node enrolled in the prefix list to its (shared) cache entry."""
+        if not block.prefix_manager_id:
+            raise ValueError(f"Prefix list {block.subscription_instance_id} has no prefix_manager_id")
+        entry = self.get(block.prefix_manager_id)
+        return {node_id: entry for node_id in block.node_enrollment_subscription_id or []}
+
+    def invalidate(self, prefix_manager_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(prefix_manager_id, None)
+            if entry is not None:
+                self._release(entry.expanded.digest)
+
+    def _release(self, digest: str) -> None:
+        # Only called with the lock held
+        if not any(entry.expanded.digest == digest for entry in self._entries.values()):
+            self._contents.pop(digest, None)
+
+
+@dataclass
+class LocalPrefixManager:
+    """In-memory stand-in for the prefix manager, for tests and local development.
+
+    The etag is derived from the content of a list, like the prefix manager does, and every fetch is counted.
+    """
+
+    prefix_lists: Dict[str, PrefixListVersion] = field(default_factory=dict)
+    fetch_count: int = 0
+
+    def publish(self, prefix_manager_id: str, prefixes: Iterable[str]) -> str:
+        prefixes = sorted(prefixes)
+        etag = hashlib.sha1(",".join(prefixes).encode()).hexdigest()[:16]  # noqa: S324
+        self.prefix_lists[prefix_manager_id] = PrefixListVersion(etag=etag, prefixes=prefixes)
+        return etag
+
+    def fetch(self, prefix_manager_id: str, etag: Optional[str] = None) -> Optional[PrefixListVersion]:
+        self.fetch_count += 1
+        version = self.prefix_lists.get(prefix_manager_id)
+        if version is None:
+            raise KeyError(f"Unknown prefix list {prefix_manager_id}")
+        return None if version.etag == etag else version
@@ -0,0 +1,101 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bulk loading of subscriptions into the database session.
+
+Hydrating a domain model walks its subscription instances one relation at a time, which costs a few queries per
+product block. `preload_subscriptions` loads a set of subscriptions together with every subscription instance they
+depend on (also when those belong to other subscriptions) in a fixed number of queries: one round per level of
+nesting. `from_subscription` and `from_db` afterwards find everything in the identity map of the session.
+"""
+
+from typing import Dict, Iterable, Set
+from uuid import UUID
+
+import structlog
+from orchestrator.db import (
+    ProductTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+logger = structlog.get_logger(__name__)
+
+# Product blocks nest six levels deep at most (IHC -> Connection -> Edge -> Bridge Service -> Interface -> LAG member);
+# the rounds after that leave room for deeper models
+MAX_DEPTH = 8
+
+
+def _instance_options(loader):  # type: ignore[no-untyped-def]
+    return loader.options(
+        selectinload(SubscriptionInstanceTable.product_block),
+        selectinload(SubscriptionInstanceTable.values).joinedload(SubscriptionInstanceValueTable.resource_type),
+        selectinload(SubscriptionInstanceTable.depends_on_block_relations),
+        selectinload(SubscriptionInstanceTable.in_use_by_block_relations),
+    )
+
+
+def _depends_on_ids(instances: Iterable[SubscriptionInstanceTable]) -> Set[UUID]:
+    return {relation.depends_on_id for instance in instances for relation in instance.depends_on_block_relations}
+
+
+def preload_subscriptions(subscription_ids: Iterable[UUID]) -> Dict[UUID, SubscriptionTable]:
+    """Load subscriptions and all subscription instances they depend on into the session.
+
+    Args:
+        subscription_ids: The subscriptions to load.
+
+    Returns:
+        The loaded subscriptions by subscription_id. Unknown ids are left out.
+
+    """
+    subscription_ids = set(subscription_ids)
+    if not subscription_ids:
+        return {}
+
+    stmt = (
+        select(SubscriptionTable)
+        .where(SubscriptionTable.subscription_id.in_(subscription_ids))
+        .options(
+            selectinload(SubscriptionTable.product).selectinload(ProductTable.fixed_inputs),
+            _instance_options(selectinload(SubscriptionTable.instances)),
+        )
+    )
+    subscriptions = {subscription.subscription_id: subscription for subscription in db.session.scalars(stmt)}
+
+    instances = [instance for subscription in subscriptions.values() for instance in subscription.instances]
+    loaded = {instance.subscription_instance_id for instance in instances}
+    pending = _depends_on_ids(instances) - loaded
+
+    for _ in range(MAX_DEPTH):
+        if not pending:
+            break
+        stmt = (
+            select(SubscriptionInstanceTable)
+            .where(SubscriptionInstanceTable.subscription_instance_id.in_(pending))
+            .options(joinedload(SubscriptionInstanceTable.subscription))
+        )
+        instances = db.session.scalars(_instance_options(stmt)).unique().all()
+        loaded |= pending
+        pending = _depends_on_ids(instances) - loaded
+
+    if pending:
+        # Hydration still works, but loads the remaining instances one relation at a time
+        logger.warning(
+            "Subscription instances nest deeper than MAX_DEPTH, not all were preloaded", unresolved=len(pending)
+        )
+    return subscriptions
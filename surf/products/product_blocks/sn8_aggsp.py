@@ -13,7 +13,7 @@
 
 from uuid import UUID
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from orchestrator.domain.base import SubscriptionInstanceList, serializable_property
 from orchestrator.types import SubscriptionLifecycle
@@ -28,7 +28,7 @@ from surf.products.product_blocks.sp import (
     ServicePortBlockProvisioning,
     Sn8ServicePortBlock,
 )
-from surf.products.product_types.sp import Sn8ServicePort
+from surf.products.services.aggregated_ports import preload_member_ports
 
 MAX_LINK_MEMBER_PORTS = 8
 
@@ -45,6 +45,9 @@ class Sn8AggregatedServicePortBlockInactive(ServicePortBlockInactive, product_bl
     nso_service_id: UUID | None = None
     ims_circuit_id: int | None = None
 
+    # Port speed by member port subscription_id, see `preload_member_ports()`
+    _member_port_speeds: dict[UUID, int] = PrivateAttr(default_factory=dict)
+
     @property
     def port_subscription_id(self) -> list[UUID]:
         return [port.owner_subscription_id for port in self.port]
@@ -53,14 +56,19 @@ class Sn8AggregatedServicePortBlockInactive(ServicePortBlockInactive, product_bl
         assert self.port_mode
         return self.port_mode.value
 
+    def get_member_port_speeds(self) -> list[int]:
+        """The port speed of each member port, loaded for all members at once and cached on the block."""
+        preload_member_ports([self])
+        return [self._member_port_speeds[port.owner_subscription_id] for port in self.port]
+
     def get_port_speed(self) -> int:
-        return sum(Sn8ServicePort.from_subscription(sub).get_port_speed() for sub in self.port_subscription_id)
+        return sum(self.get_member_port_speeds())
 
     def get_port_node_subscription_id(self) -> UUID:
-        assert self.port_subscription_id
-        port_subscription_lm = Sn8ServicePort.from_subscription(self.port_subscription_id[0])
-        assert port_subscription_lm.port.node
-        return port_subscription_lm.port.node.owner_subscription_id
+        assert self.port
+        # All ports on same node, and the member port blocks are loaded with their node
+        assert self.port[0].node
+        return self.port[0].node.owner_subscription_id
 
 
 class Sn8AggregatedServicePortBlockProvisioning(
@@ -71,18 +79,13 @@ class Sn8AggregatedServicePortBlockProvisioning(
     port_mode: AggregatedPortMode
     port: ListOfPortsInactive
 
-    @property
-    def port_subscription_id(self) -> list[UUID]:
-        return [port.owner_subscription_id for port in self.port]
-
     nso_service_id: UUID | None = None
     ims_circuit_id: int | None = None
 
     @property
     def node(self) -> NodeProductBlock:
         # All ports on same node, get the first one
-        port_subscription_lm = Sn8ServicePort.from_subscription(self.port_subscription_id[0])
-        return port_subscription_lm.port.node
+        return self.port[0].node
 
     @serializable_property
     def title(self) -> str:
@@ -102,9 +105,5 @@ class Sn8AggregatedServicePortBlock(
     port_mode: AggregatedPortMode
     port: ListOfPorts
 
-    @property
-    def port_subscription_id(self) -> list[UUID]:
-        return [port.owner_subscription_id for port in self.port]
-
     nso_service_id: UUID
     ims_circuit_id: int
@@ -29,7 +29,7 @@ from surf.products.product_blocks.sp import (
     Sn8ServicePortBlockProvisioning,
 )
 from surf.products.product_types.fixed_input_types import Domain, PortSpeed
-from surf.services import ims
+from surf.products.services.external_calls import ims
 
 
 class ServicePortInactive(SubscriptionModel):
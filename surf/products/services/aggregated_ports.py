@@ -0,0 +1,85 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load the member ports of aggregated service ports in bulk.
+
+The member port blocks of an aggregated service port, with their nodes, are loaded with the aggregated port itself;
+only the port speed is missing, because it is a fixed input of the product of each member subscription. Loading every
+member with `Sn8ServicePort.from_subscription()` for that costs a full subscription load per member, for every title.
+`load_member_port_speeds()` selects the speeds of all members of one or many aggregated ports in one query instead,
+and `preload_member_ports()` caches them on the aggregated port blocks::
+
+    preload_member_ports(subscription.port for subscription in aggregated_port_subscriptions)
+"""
+
+from __future__ import annotations
+
+from collections.abc import Collection, Iterable
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+from orchestrator.db import FixedInputTable, SubscriptionTable, db
+from sqlalchemy import select
+
+from surf.products.product_types.fixed_input_types import PortSpeed
+from surf.products.product_types.sp import Sn8ServicePort
+
+if TYPE_CHECKING:
+    from surf.products.product_blocks.sn8_aggsp import Sn8AggregatedServicePortBlockInactive
+
+# Name under which the `aliased_port_speed` fixed input of Sn8ServicePort is stored
+PORT_SPEED_FIXED_INPUT = "port_speed"
+
+
+def load_member_port_speeds(subscription_ids: Collection[UUID]) -> dict[UUID, int]:
+    """The port speed of member port subscriptions, in Mbit/s.
+
+    Args:
+        subscription_ids: Service port subscriptions.
+
+    Returns:
+        Port speed by subscription_id. Members whose product has no port speed fixed input (IRB ports) are loaded
+        with `Sn8ServicePort.from_subscription()`, as before.
+
+    """
+    if not subscription_ids:
+        return {}
+    stmt = (
+        select(SubscriptionTable.subscription_id, FixedInputTable.value)
+        .join(FixedInputTable, FixedInputTable.product_id == SubscriptionTable.product_id)
+        .where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+        .where(FixedInputTable.name == PORT_SPEED_FIXED_INPUT)
+    )
+    speeds = {subscription_id: PortSpeed(int(value)).value for subscription_id, value in db.session.execute(stmt)}
+    for subscription_id in subscription_ids:
+        if subscription_id not in speeds:
+            speeds[subscription_id] = Sn8ServicePort.from_subscription(subscription_id).get_port_speed()
+    return speeds
+
+
+def preload_member_ports(blocks: Iterable[Sn8AggregatedServicePortBlockInactive]) -> None:
+    """Load the member port speeds of all `blocks` in one query, and cache them on each block."""
+    blocks = list(blocks)
+    missing = {
+        subscription_id
+        for block in blocks
+        for subscription_id in block.port_subscription_id
+        if subscription_id not in block._member_port_speeds
+    }
+    speeds = load_member_port_speeds(missing)
+    for block in blocks:
+        block._member_port_speeds.update(
+            (subscription_id, speeds[subscription_id])
+            for subscription_id in block.port_subscription_id
+            if subscription_id in speeds
+        )
@@ -0,0 +1,313 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""IS-IS metrics and capacity of the backbone, and the effect of metric changes.
+
+Every `Sn8Corelink` connects the nodes of its two aggregates with an IS-IS metric and up to 8 port pairs; corelinks
+in maintenance mode carry no traffic. `load_corelinks()` reads all corelinks with a few projection queries, and
+`CorelinkMatrix` turns them into sparse node-by-node metric and capacity matrices. It computes the shortest paths
+between all nodes (Dijkstra), the number of equal cost paths and the load of each corelink when traffic is split
+evenly over the equal cost next hops (ECMP), and simulates metric changes without touching the network::
+
+    matrix = CorelinkMatrix.from_db()
+    impact = matrix.simulate_metric(corelink_subscription_id, 500)
+    for pair in impact.changed_pairs:
+        ...
+
+Corelinks are undirected: the metric and the capacity apply to both directions.
+"""
+
+from collections.abc import Iterable, Mapping
+from typing import NamedTuple
+from uuid import UUID
+
+import numpy as np
+import structlog
+from orchestrator.db import FixedInputTable, ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from sqlalchemy import select
+
+from surf.products.product_blocks.corelink import Sn8CorelinkBlockInactive
+from surf.products.product_types.fixed_input_types import PortSpeed
+from surf.products.services.projection import first, instance_values, owners, related
+
+logger = structlog.get_logger(__name__)
+
+CORELINK_RESOURCE_TYPES = ("isis_metric", "maintenance_mode")
+PORT_SPEED_FIXED_INPUT = "port_speed"
+# Corelink products without a port speed fixed input
+DEFAULT_PORT_SPEED = PortSpeed._100000.value
+
+
+class Corelink(NamedTuple):
+    subscription_id: UUID
+    description: str
+    status: str
+    # Node subscriptions of the two aggregates
+    node_a: UUID
+    node_b: UUID
+    isis_metric: int
+    maintenance_mode: bool
+    port_pairs: int
+    port_speed: int
+
+    @property
+    def capacity(self) -> int:
+        """The capacity in Mbit/s, per direction."""
+        return self.port_pairs * self.port_speed
+
+
+class Routing(NamedTuple):
+    """Shortest paths and ECMP load for one set of metrics; node and corelink order as in the `CorelinkMatrix`."""
+
+    # Per corelink, inf when it carries no traffic
+    metrics: np.ndarray
+    # (nodes, nodes): inf when unreachable
+    distances: np.ndarray
+    # (nodes, nodes): the number of equal cost shortest paths
+    path_counts: np.ndarray
+    # (corelinks, 2): the traffic from node_a to node_b and back
+    load: np.ndarray
+
+
+class MetricImpact(NamedTuple):
+    before: Routing
+    after: Routing
+    # Node subscription pairs whose distance or number of equal cost paths changed, in both directions
+    changed_pairs: list[tuple[UUID, UUID]]
+    # Node subscription pairs that can no longer reach each other
+    disconnected_pairs: list[tuple[UUID, UUID]]
+    # The change in traffic (both directions) per corelink subscription, for corelinks whose load changed
+    shifted: dict[UUID, float]
+
+
+class CorelinkMatrix:
+    """The backbone as sparse matrices, with shortest path and metric change simulations.
+
+    Args:
+        corelinks: The corelinks of the backbone.
+        demands: The traffic between every pair of nodes, in the order of `nodes`; one unit between every pair when
+            None. Loads are in the unit of the demands.
+
+    """
+
+    def __init__(self, corelinks: Iterable[Corelink], demands: np.ndarray | None = None) -> None:
+        self.corelinks = list(corelinks)
+        self.nodes = sorted({node for link in self.corelinks for node in (link.node_a, link.node_b)}, key=str)
+        self.node_index = {node: index for index, node in enumerate(self.nodes)}
+        self.link_index = {link.subscription_id: index for index, link in enumerate(self.corelinks)}
+        self._a = np.array([self.node_index[link.node_a] for link in self.corelinks], dtype=np.int64)
+        self._b = np.array([self.node_index[link.node_b] for link in self.corelinks], dtype=np.int64)
+        self.capacities = np.array([link.capacity for link in self.corelinks], dtype=np.float64)
+
+        n = len(self.nodes)
+        if demands is None:
+            demands = np.ones((n, n)) - np.eye(n)
+        if demands.shape != (n, n):
+            raise ValueError(f"Expected demands of shape {(n, n)}, got {demands.shape}")
+        self.demands = demands.astype(np.float64)
+
+        self.routing = self.route(self.metrics())
+
+    def __len__(self) -> int:
+        return len(self.corelinks)
+
+    def metrics(self, changes: Mapping[UUID, int | None] | None = None) -> np.ndarray:
+        """The metric per corelink: inf in maintenance mode, with `changes` (None takes a corelink out) applied."""
+        metrics = np.array(
+            [np.inf if link.maintenance_mode else link.isis_metric for link in self.corelinks], dtype=np.float64
+        )
+        for subscription_id, metric in (changes or {}).items():
+            if metric is not None and metric < 1:
+                raise ValueError(f"IS-IS metrics start at 1, got {metric}")
+            metrics[self.link_index[subscription_id]] = np.inf if metric is None else metric
+        return metrics
+
+    def metric_matrix(self, metrics: np.ndarray | None = None) -> csr_matrix:
+        """The lowest metric between every pair of adjacent nodes (corelinks in parallel count once)."""
+        metrics = self.routing.metrics if metrics is None else metrics
+        up = np.flatnonzero(np.isfinite(metrics))
+        src = np.concatenate([self._a[up], self._b[up]])
+        dst = np.concatenate([self._b[up], self._a[up]])
+        weight = np.tile(metrics[up], 2)
+        # csr_matrix sums duplicate entries: keep the lowest metric per node pair
+        n = len(self.nodes)
+        order = np.lexsort((weight, dst, src))
+        _, lowest = np.unique(src[order] * n + dst[order], return_index=True)
+        keep = order[lowest]
+        return csr_matrix((weight[keep], (src[keep], dst[keep])), shape=(n, n))
+
+    def capacity_matrix(self, metrics: np.ndarray | None = None) -> csr_matrix:
+        """The capacity between every pair of adjacent nodes, over the corelinks that carry traffic."""
+        metrics = self.routing.metrics if metrics is None else metrics
+        up = np.flatnonzero(np.isfinite(metrics))
+        src = np.concatenate([self._a[up], self._b[up]])
+        dst = np.concatenate([self._b[up], self._a[up]])
+        n = len(self.nodes)
+        return csr_matrix((np.tile(self.capacities[up], 2), (src, dst)), shape=(n, n))
+
+    def route(self, metrics: np.ndarray) -> Routing:
+        """Compute the shortest paths, the number of equal cost paths and the ECMP load for per-corelink metrics."""
+        n, count = len(self.nodes), len(self.corelinks)
+        distances = dijkstra(self.metric_matrix(metrics), directed=True)
+
+        # Both directions of the corelinks that carry traffic; an arc is a next hop towards destination t when the
+        # metric of the arc plus the distance from its far end equals the distance from its near end.
+        up = np.flatnonzero(np.isfinite(metrics))
+        src = np.concatenate([self._a[up], self._b[up]])
+        dst = np.concatenate([self._b[up], self._a[up]])
+        weight = np.tile(metrics[up], 2)
+        arcs = np.arange(len(src))
+        next_hop = np.isfinite(distances[src]) & (distances[src] == weight[:, None] + distances[dst])
+        next_hop = next_hop.astype(np.float64)
+        out_arcs = csr_matrix((np.ones(len(src)), (src, arcs)), shape=(n, len(src)))
+        in_arcs = csr_matrix((np.ones(len(src)), (dst, arcs)), shape=(n, len(src)))
+
+        # The next hops form a DAG per destination, so both sums are exact after at most the longest hop count
+        path_counts = np.eye(n)
+        for _ in range(n):
+            updated = np.eye(n) + out_arcs @ (next_hop * path_counts[dst])
+            if np.array_equal(updated, path_counts):
+                break
+            path_counts = updated
+
+        next_hops = out_arcs @ next_hop
+        share = np.divide(next_hop, next_hops[src], out=np.zeros(next_hop.shape), where=next_hop > 0)
+        traffic = self.demands.copy()
+        for _ in range(n):
+            updated = self.demands + in_arcs @ (share * traffic[src])
+            if np.array_equal(updated, traffic):
+                break
+            traffic = updated
+
+        arc_load = (share * traffic[src]).sum(axis=1)
+        load = np.zeros((count, 2))
+        load[up, 0], load[up, 1] = arc_load[: len(up)], arc_load[len(up) :]
+        return Routing(metrics=metrics, distances=distances, path_counts=path_counts, load=load)
+
+    def utilization(self, routing: Routing | None = None) -> dict[UUID, float]:
+        """The load of the busiest direction per corelink subscription, relative to its capacity."""
+        routing = self.routing if routing is None else routing
+        busiest = routing.load.max(axis=1) / self.capacities
+        return {link.subscription_id: float(busiest[index]) for index, link in enumerate(self.corelinks)}
+
+    def path(self, source: UUID, target: UUID, routing: Routing | None = None) -> list[UUID] | None:
+        """One shortest path between two node subscriptions, or None when the target is unreachable."""
+        routing = self.routing if routing is None else routing
+        start, end = self.node_index[source], self.node_index[target]
+        if not np.isfinite(routing.distances[start, end]):
+            return None
+        _, predecessors = dijkstra(self.metric_matrix(routing.metrics), indices=start, return_predecessors=True)
+        path = [end]
+        while path[-1] != start:
+            path.append(predecessors[path[-1]])
+        return [self.nodes[index] for index in reversed(path)]
+
+    def simulate(self, changes: Mapping[UUID, int | None]) -> MetricImpact:
+        """The effect of changing the metrics of corelinks.
+
+        Args:
+            changes: The new metric per corelink subscription; None takes a corelink out of service, a metric puts a
+                corelink in maintenance mode back in service.
+
+        """
+        before, after = self.routing, self.route(self.metrics(changes))
+        changed = (before.distances != after.distances) | (before.path_counts != after.path_counts)
+        disconnected = np.isfinite(before.distances) & ~np.isfinite(after.distances)
+        delta = after.load.sum(axis=1) - before.load.sum(axis=1)
+        return MetricImpact(
+            before=before,
+            after=after,
+            changed_pairs=[(self.nodes[a], self.nodes[b]) for a, b in zip(*np.nonzero(changed))],
+            disconnected_pairs=[(self.nodes[a], self.nodes[b]) for a, b in zip(*np.nonzero(disconnected))],
+            shifted={
+                self.corelinks[index].subscription_id: float(delta[index])
+                for index in np.flatnonzero(~np.isclose(delta, 0))
+            },
+        )
+
+    def simulate_metric(self, subscription_id: UUID, metric: int | None) -> MetricImpact:
+        """The effect of setting the metric of one corelink, or taking it out of service (None)."""
+        return self.simulate({subscription_id: metric})
+
+    @classmethod
+    def from_db(cls, demands: np.ndarray | None = None) -> "CorelinkMatrix":
+        """Build the matrices from all corelink subscriptions that are not terminated."""
+        matrix = cls(load_corelinks(), demands)
+        logger.debug("Built corelink matrix", nodes=len(matrix.nodes), corelinks=len(matrix))
+        return matrix
+
+
+def load_corelinks(subscription_ids: Iterable[UUID] | None = None) -> list[Corelink]:
+    """Read all (or the given) corelink subscriptions that are not terminated.
+
+    Corelinks without two nodes or without a metric (not yet provisioned) are left out.
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionTable.status,
+            SubscriptionTable.product_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == Sn8CorelinkBlockInactive.name)
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    corelinks = db.session.execute(stmt).all()
+
+    stmt = select(FixedInputTable.product_id, FixedInputTable.value).where(
+        FixedInputTable.product_id.in_({corelink.product_id for corelink in corelinks}),
+        FixedInputTable.name == PORT_SPEED_FIXED_INPUT,
+    )
+    port_speeds = {product_id: PortSpeed(int(value)).value for product_id, value in db.session.execute(stmt)}
+
+    # Level by level: corelink -> aggregates and port pairs -> nodes
+    corelink_ids = [corelink.subscription_instance_id for corelink in corelinks]
+    parts = related(corelink_ids, ["aggregates", "port_pairs"])
+    aggregate_ids = [
+        aggregate_id for corelink_id in corelink_ids for aggregate_id in parts.get((corelink_id, "aggregates"), ())
+    ]
+    nodes = related(aggregate_ids, ["node"])
+    node_owners = owners([node_id for node_ids in nodes.values() for node_id in node_ids])
+    values = instance_values(corelink_ids, CORELINK_RESOURCE_TYPES)
+
+    result = []
+    for corelink in corelinks:
+        corelink_values = values.get(corelink.subscription_instance_id, {})
+        aggregates = parts.get((corelink.subscription_instance_id, "aggregates"), ())
+        node_ids = [first(nodes, aggregate_id, "node") for aggregate_id in aggregates]
+        if len(node_ids) != 2 or not all(node_id in node_owners for node_id in node_ids):
+            continue
+        if corelink_values.get("isis_metric") is None:
+            continue
+        result.append(
+            Corelink(
+                subscription_id=corelink.subscription_id,
+                description=corelink.description,
+                status=corelink.status,
+                node_a=node_owners[node_ids[0]].subscription_id,
+                node_b=node_owners[node_ids[1]].subscription_id,
+                isis_metric=int(corelink_values["isis_metric"]),
+                maintenance_mode=corelink_values.get("maintenance_mode", "False").lower() == "true",
+                port_pairs=len(parts.get((corelink.subscription_instance_id, "port_pairs"), ())),
+                port_speed=port_speeds.get(corelink.product_id, DEFAULT_PORT_SPEED),
+            )
+        )
+    return result
@@ -0,0 +1,138 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Flat rows of the SAP settings of all L3VPNs, for reports and configuration audits.
+
+Reports across all LHCONE or LHCOPN L3VPNs need the routing settings of every SAP; hydrating hundreds of `Sn8L3Vpn`
+models for that loads every SAP, port and node. `iter_l3vpn_sap_rows()` reads the values straight from the resource
+type values with projection queries, a batch of L3VPN virtual circuits at a time, and yields a row per SAP::
+
+    for row in iter_l3vpn_sap_rows(specific_template=SpecificTemplateType.LHCONE):
+        print(row.description, row.nso_device_id, row.vlanrange, row.asn, row.urpf, row.bfd)
+"""
+
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+from uuid import UUID
+
+from orchestrator.db import (
+    ProductBlockTable,
+    ResourceTypeTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.types import SubscriptionLifecycle
+from orchestrator.utils.vlans import VlanRanges
+from sqlalchemy import select
+
+from surf.products.product_blocks.resource_type_types import SpecificTemplateType, URPFType
+from surf.products.product_blocks.vc_l3vpn_sn8 import Sn8L3VpnVirtualCircuitBlockInactive
+from surf.products.services.projection import first, instance_values, related, sap_nodes
+
+SETTINGS_RESOURCE_TYPES = ("asn", "urpf", "bfd", "enable_routing")
+BATCH_SIZE = 200
+
+
+class L3VpnSapRow(NamedTuple):
+    subscription_id: UUID
+    description: str
+    specific_template: SpecificTemplateType | None
+    # The SN8 L3VPN Service Attach Point Settings block
+    subscription_instance_id: UUID
+    nso_device_id: str | None
+    vlanrange: str | None
+    asn: int | None
+    urpf: URPFType
+    bfd: bool | None
+    enable_routing: bool
+
+
+def _bool(value: str | None) -> bool | None:
+    return value.lower() == "true" if value is not None else None
+
+
+def _rows(circuits: list[tuple[UUID, str, UUID]]) -> Iterator[L3VpnSapRow]:
+    """The rows of one batch of (subscription_id, description, virtual circuit) tuples."""
+    circuit_ids = [circuit_id for _, _, circuit_id in circuits]
+    settings = related(circuit_ids, ["saps"])
+    settings_ids = [settings_id for settings_ids in settings.values() for settings_id in settings_ids]
+    saps = related(settings_ids, ["sap"])
+    sap_ids = [sap_id for sap_ids in saps.values() for sap_id in sap_ids]
+    nodes = sap_nodes(sap_ids)
+    values = instance_values(
+        [*circuit_ids, *settings_ids, *sap_ids, *set(nodes.values())],
+        ("specific_template", "vlanrange", "nso_device_id") + SETTINGS_RESOURCE_TYPES,
+    )
+
+    for subscription_id, description, circuit_id in circuits:
+        specific_template = values.get(circuit_id, {}).get("specific_template")
+        for settings_id in settings.get((circuit_id, "saps"), ()):
+            setting = values.get(settings_id, {})
+            sap_id = first(saps, settings_id, "sap")
+            vlanrange = values.get(sap_id, {}).get("vlanrange") if sap_id else None
+            asn = setting.get("asn")
+            yield L3VpnSapRow(
+                subscription_id=subscription_id,
+                description=description,
+                specific_template=SpecificTemplateType(specific_template) if specific_template else None,
+                subscription_instance_id=settings_id,
+                nso_device_id=values.get(nodes[sap_id], {}).get("nso_device_id") if sap_id in nodes else None,
+                vlanrange=str(VlanRanges(vlanrange)) if vlanrange is not None else None,
+                asn=int(asn) if asn is not None else None,
+                urpf=URPFType(setting.get("urpf", URPFType.disabled.value)),
+                bfd=_bool(setting.get("bfd")),
+                enable_routing=_bool(setting.get("enable_routing")) is not False,
+            )
+
+
+def iter_l3vpn_sap_rows(
+    subscription_ids: Iterable[UUID] | None = None,
+    specific_template: SpecificTemplateType | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[L3VpnSapRow]:
+    """Yield a row per SAP of all (or the given) L3VPN subscriptions that are not terminated.
+
+    Args:
+        subscription_ids: Limit to these L3VPN subscriptions.
+        specific_template: Limit to L3VPNs with this template (LHCOPN, LHCONE).
+        batch_size: The number of virtual circuits read per round of projection queries.
+
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == Sn8L3VpnVirtualCircuitBlockInactive.name)
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+        .order_by(SubscriptionTable.description, SubscriptionTable.subscription_id)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    if specific_template is not None:
+        with_template = (
+            select(SubscriptionInstanceValueTable.subscription_instance_id)
+            .join(ResourceTypeTable)
+            .where(ResourceTypeTable.resource_type == "specific_template")
+            .where(SubscriptionInstanceValueTable.value == specific_template.value)
+        )
+        stmt = stmt.where(SubscriptionInstanceTable.subscription_instance_id.in_(with_template))
+
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    for circuits in result.partitions():
+        yield from _rows([tuple(circuit) for circuit in circuits])
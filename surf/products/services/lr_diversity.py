@@ -0,0 +1,261 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Check that the two light paths of protected and redundant light path (LR) subscriptions are diverse.
+
+The `LR Service Settings` block of an LR subscription holds two light path virtual circuits. They only protect each
+other when they do not share a port: the port of a SAP, the carrier port of a multi service carrier or a member of an
+aggregated port. Redundant LRs must not share a node either. `DiversityIndex` resolves the SAP -> port -> node chains of
+both virtual circuits of all LR subscriptions with a few projection queries per level, keeps a report per LR with the
+shared ports and nodes, and reloads only the LRs that use a port or node subscription when that one changes::
+
+    index = DiversityIndex.from_db()
+    for report in index.violations():
+        ...
+    index.refresh_subscription(port_subscription_id)
+"""
+
+import threading
+from collections import defaultdict
+from collections.abc import Collection, Iterable
+from typing import NamedTuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import FixedInputTable, ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from surf.products.product_blocks.lrss import Sn8LightPathRedundantServiceSettingsBlockInactive
+from surf.products.product_types.fixed_input_types import ProtectionType
+from surf.products.services.projection import owners, related
+
+logger = structlog.get_logger(__name__)
+
+PROTECTION_TYPE_FIXED_INPUT = "protection_type"
+# Multi service carrier -> aggregated port -> member port -> node
+MAX_PORT_DEPTH = 4
+
+
+class SapElements(NamedTuple):
+    # Port subscriptions along the chain: the port of the SAP, a carrier port, members of an aggregated port
+    ports: frozenset[UUID]
+    nodes: frozenset[UUID]
+
+
+class DiversityReport(NamedTuple):
+    subscription_id: UUID
+    description: str
+    protection_type: ProtectionType | None
+    # The port and node subscriptions of the SAPs of each virtual circuit
+    ports: tuple[frozenset[UUID], frozenset[UUID]]
+    nodes: tuple[frozenset[UUID], frozenset[UUID]]
+
+    @property
+    def shared_ports(self) -> frozenset[UUID]:
+        return self.ports[0] & self.ports[1]
+
+    @property
+    def shared_nodes(self) -> frozenset[UUID]:
+        return self.nodes[0] & self.nodes[1]
+
+    @property
+    def complete(self) -> bool:
+        """Whether the ports and nodes of both virtual circuits are known."""
+        return all(self.ports) and all(self.nodes)
+
+    @property
+    def diverse(self) -> bool:
+        """No shared port, and for redundant LRs no shared node either."""
+        if self.shared_ports:
+            return False
+        return self.protection_type != ProtectionType.REDUNDANT or not self.shared_nodes
+
+    @property
+    def elements(self) -> frozenset[UUID]:
+        """All port and node subscriptions the LR depends on."""
+        return frozenset().union(*self.ports, *self.nodes)
+
+
+class DiversityIndex:
+    """Diversity reports of LR subscriptions, with the LRs per port and node subscription.
+
+    Example:
+    ```python
+    index = DiversityIndex.from_db()
+    for report in index.violations():
+        print(report.description, report.shared_ports, report.shared_nodes)
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._reports: dict[UUID, DiversityReport] = {}
+        self._by_element: dict[UUID, set[UUID]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._reports)
+
+    def get(self, subscription_id: UUID) -> DiversityReport | None:
+        with self._lock:
+            return self._reports.get(subscription_id)
+
+    def violations(self) -> list[DiversityReport]:
+        """The LRs whose virtual circuits are not diverse, or whose ports or nodes are not known."""
+        with self._lock:
+            reports = list(self._reports.values())
+        return [report for report in reports if not report.diverse or not report.complete]
+
+    def using(self, subscription_id: UUID) -> list[UUID]:
+        """The LR subscriptions that use a port or node subscription."""
+        with self._lock:
+            return list(self._by_element.get(subscription_id, ()))
+
+    def add(self, report: DiversityReport) -> None:
+        with self._lock:
+            self._add(report)
+
+    def _add(self, report: DiversityReport) -> None:
+        # Only called with the lock held
+        self._remove(report.subscription_id)
+        self._reports[report.subscription_id] = report
+        for element in report.elements:
+            self._by_element[element].add(report.subscription_id)
+
+    def remove(self, subscription_id: UUID) -> None:
+        with self._lock:
+            self._remove(subscription_id)
+
+    def _remove(self, subscription_id: UUID) -> None:
+        # Only called with the lock held
+        report = self._reports.pop(subscription_id, None)
+        if report is None:
+            return
+        for element in report.elements:
+            self._by_element[element].discard(subscription_id)
+            if not self._by_element[element]:
+                del self._by_element[element]
+
+    def refresh_subscription(self, subscription_id: UUID) -> list[DiversityReport]:
+        """Reload an LR subscription, or the LRs using a port or node subscription, after it changed.
+
+        Returns:
+            The reloaded reports.
+
+        """
+        with self._lock:
+            affected = {subscription_id, *self._by_element.get(subscription_id, ())}
+        reports = load_diversity_reports(affected)
+        with self._lock:
+            for lr_subscription_id in affected:
+                self._remove(lr_subscription_id)
+            for report in reports:
+                self._add(report)
+        return reports
+
+    @classmethod
+    def from_db(cls) -> "DiversityIndex":
+        """Build the index from all LR subscriptions that are not terminated."""
+        index = cls()
+        reports = load_diversity_reports()
+        with index._lock:
+            for report in reports:
+                index._add(report)
+        logger.debug("Built LR diversity index", subscriptions=len(index), violations=len(index.violations()))
+        return index
+
+
+def load_sap_elements(sap_ids: Collection[UUID]) -> dict[UUID, SapElements]:
+    """The port and node subscriptions of SAPs, following carrier ports and all members of aggregated ports."""
+    ports = related(sap_ids, ["port"])
+    # (SAP, port instance) pairs, level by level
+    current = {(sap_id, port_id) for (sap_id, _), port_ids in ports.items() for port_id in port_ids}
+    port_instances: dict[UUID, set[UUID]] = defaultdict(set)
+    node_instances: dict[UUID, set[UUID]] = defaultdict(set)
+    for _ in range(MAX_PORT_DEPTH):
+        if not current:
+            break
+        for sap_id, port_id in current:
+            port_instances[sap_id].add(port_id)
+        relations = related({port_id for _, port_id in current}, ["node", "port"])
+        pending = set()
+        for sap_id, port_id in current:
+            node_instances[sap_id].update(relations.get((port_id, "node"), ()))
+            pending.update((sap_id, member_id) for member_id in relations.get((port_id, "port"), ()))
+        current = pending
+
+    instance_owners = owners(
+        {instance_id for instances in (*port_instances.values(), *node_instances.values()) for instance_id in instances}
+    )
+
+    def subscriptions(instance_ids: Iterable[UUID]) -> frozenset[UUID]:
+        return frozenset(instance_owners[i].subscription_id for i in instance_ids if i in instance_owners)
+
+    return {
+        sap_id: SapElements(ports=subscriptions(port_instances[sap_id]), nodes=subscriptions(node_instances[sap_id]))
+        for sap_id in sap_ids
+    }
+
+
+def load_diversity_reports(subscription_ids: Iterable[UUID] | None = None) -> list[DiversityReport]:
+    """Check all (or the given) LR subscriptions that are not terminated; other subscription ids are ignored."""
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionTable.product_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == Sn8LightPathRedundantServiceSettingsBlockInactive.name)
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    lrs = db.session.execute(stmt).all()
+    if not lrs:
+        return []
+
+    stmt = select(FixedInputTable.product_id, FixedInputTable.value).where(
+        FixedInputTable.product_id.in_({lr.product_id for lr in lrs}),
+        FixedInputTable.name == PROTECTION_TYPE_FIXED_INPUT,
+    )
+    protection_types = {product_id: ProtectionType(value) for product_id, value in db.session.execute(stmt)}
+
+    # Level by level: LR service settings -> virtual circuits -> SAPs -> ports -> nodes
+    vcs = related([lr.subscription_instance_id for lr in lrs], ["vcs"])
+    saps = related([vc_id for vc_ids in vcs.values() for vc_id in vc_ids], ["saps"])
+    elements = load_sap_elements({sap_id for sap_ids in saps.values() for sap_id in sap_ids})
+
+    def vc_elements(vc_id: UUID | None) -> SapElements:
+        sap_elements = [elements[sap_id] for sap_id in saps.get((vc_id, "saps"), ())] if vc_id else []
+        return SapElements(
+            ports=frozenset().union(*(sap.ports for sap in sap_elements)),
+            nodes=frozenset().union(*(sap.nodes for sap in sap_elements)),
+        )
+
+    reports = []
+    for lr in lrs:
+        vc_ids = vcs.get((lr.subscription_instance_id, "vcs"), [])
+        first_vc, second_vc = (vc_elements(vc_id) for vc_id in (vc_ids + [None, None])[:2])
+        reports.append(
+            DiversityReport(
+                subscription_id=lr.subscription_id,
+                description=lr.description,
+                protection_type=protection_types.get(lr.product_id),
+                ports=(first_vc.ports, second_vc.ports),
+                nodes=(first_vc.nodes, second_vc.nodes),
+            )
+        )
+    return reports
@@ -0,0 +1,238 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The NSI topology document: the service termination points (STPs) of all NSISTP subscriptions exposed in topology.
+
+Each NSISTP subscription describes one STP: its topology, STP id, the VLANs of its SAP and its aliases in other
+networks. Building the topology from `Nsistp` models loads every NSISTP subscription, and the title of each also loads
+the subscription of its SAP. `NsiTopology` reads all exposed STPs with a few projection queries and renders the
+document as NML in JSON, grouped by topology, with a content hash to publish it with (as an ETag, for instance). The
+JSON of every STP is kept; after an NSISTP subscription changes, only its STP is read and rendered again::
+
+    topology = NsiTopology.from_db()
+    document, content_hash = topology.document(), topology.content_hash()
+    topology.refresh_subscription(nsistp_subscription_id)
+"""
+
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any, NamedTuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from orchestrator.utils.vlans import VlanRanges
+from sqlalchemy import select
+
+from surf.products.product_blocks.sn8_nsistp import NsistpBlockInactive
+from surf.products.services.projection import first, instance_values, owners, related
+
+logger = structlog.get_logger(__name__)
+
+STP_RESOURCE_TYPES = (
+    "topology",
+    "stp_id",
+    "stp_description",
+    "is_alias_in",
+    "is_alias_out",
+    "expose_in_topology",
+    "bandwidth",
+)
+VLAN_LABEL_TYPE = "http://schemas.ogf.org/nml/2012/10/ethernet#vlan"
+
+
+class StpEntry(NamedTuple):
+    subscription_id: UUID
+    tag: str
+    topology: str
+    stp_id: str
+    stp_description: str | None
+    is_alias_in: str | None
+    is_alias_out: str | None
+    bandwidth: int | None
+    vlanrange: str
+    # The description of the subscription of the SAP
+    sap_description: str
+
+    @property
+    def title(self) -> str:
+        """The title of the `NsistpBlock`."""
+        return f"{self.tag} {self.topology} {self.stp_id} {self.sap_description} VLAN {self.vlanrange}"
+
+    def nml(self) -> dict[str, Any]:
+        """The STP as an NML bidirectional port."""
+        port: dict[str, Any] = {
+            "id": self.stp_id,
+            "name": self.stp_description or self.sap_description,
+            "labelGroup": {"labeltype": VLAN_LABEL_TYPE, "values": self.vlanrange},
+        }
+        if self.bandwidth is not None:
+            port["capacity"] = self.bandwidth
+        if self.is_alias_in or self.is_alias_out:
+            port["isAlias"] = {"in": self.is_alias_in, "out": self.is_alias_out}
+        return port
+
+
+class NsiTopology:
+    """The exposed STPs of all NSISTP subscriptions, with the rendered topology document.
+
+    Example:
+    ```python
+    topology = NsiTopology.from_db()
+    if topology.content_hash() != published_hash:
+        publish(topology.document())
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[UUID, StpEntry] = {}
+        # The JSON of each STP, by subscription_id
+        self._fragments: dict[UUID, str] = {}
+        self._document: str | None = None
+        self._hash: str | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, subscription_id: UUID) -> StpEntry | None:
+        with self._lock:
+            return self._entries.get(subscription_id)
+
+    def document(self) -> str:
+        """The topology document (NML as JSON), rendered again only after STPs changed."""
+        with self._lock:
+            if self._document is None:
+                self._render()
+            return self._document  # type: ignore[return-value]
+
+    def content_hash(self) -> str:
+        """The SHA-256 hash of the document."""
+        with self._lock:
+            if self._hash is None:
+                self._render()
+            return self._hash  # type: ignore[return-value]
+
+    def _render(self) -> None:
+        # Only called with the lock held. Joins the JSON of the STPs, by topology and STP id.
+        topologies: dict[str, list[StpEntry]] = defaultdict(list)
+        for entry in self._entries.values():
+            topologies[entry.topology].append(entry)
+        parts = []
+        for topology in sorted(topologies):
+            ports = ",".join(
+                self._fragments[entry.subscription_id]
+                for entry in sorted(topologies[topology], key=lambda entry: entry.stp_id)
+            )
+            parts.append(f'{{"id":{json.dumps(topology)},"bidirectionalPorts":[{ports}]}}')
+        self._document = f'{{"topologies":[{",".join(parts)}]}}'
+        self._hash = hashlib.sha256(self._document.encode()).hexdigest()
+
+    def add(self, entry: StpEntry) -> None:
+        with self._lock:
+            self._add(entry)
+
+    def _add(self, entry: StpEntry) -> None:
+        # Only called with the lock held
+        if self._entries.get(entry.subscription_id) == entry:
+            return
+        self._entries[entry.subscription_id] = entry
+        self._fragments[entry.subscription_id] = json.dumps(entry.nml(), sort_keys=True, separators=(",", ":"))
+        self._document = self._hash = None
+
+    def remove(self, subscription_id: UUID) -> None:
+        with self._lock:
+            self._remove(subscription_id)
+
+    def _remove(self, subscription_id: UUID) -> None:
+        # Only called with the lock held
+        if self._entries.pop(subscription_id, None) is None:
+            return
+        del self._fragments[subscription_id]
+        self._document = self._hash = None
+
+    def refresh_subscription(self, subscription_id: UUID) -> None:
+        """Reload the STP of one NSISTP subscription after it was created, modified or terminated."""
+        entries = load_stp_entries([subscription_id])
+        with self._lock:
+            if not entries:
+                self._remove(subscription_id)
+            for entry in entries:
+                self._add(entry)
+
+    @classmethod
+    def from_db(cls) -> "NsiTopology":
+        """Build the topology from the exposed STPs of all NSISTP subscriptions that are not terminated."""
+        topology = cls()
+        entries = load_stp_entries()
+        with topology._lock:
+            for entry in entries:
+                topology._add(entry)
+        logger.debug("Built NSI topology", stps=len(topology))
+        return topology
+
+
+def load_stp_entries(subscription_ids: Iterable[UUID] | None = None) -> list[StpEntry]:
+    """Read the STPs of all (or the given) NSISTP subscriptions that are not terminated and are exposed in topology.
+
+    STPs without a topology, STP id or SAP are left out.
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+            ProductBlockTable.tag,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == NsistpBlockInactive.name)
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    stps = db.session.execute(stmt).all()
+
+    stp_ids = [stp.subscription_instance_id for stp in stps]
+    saps = related(stp_ids, ["sap"])
+    sap_ids = [sap_id for sap_ids in saps.values() for sap_id in sap_ids]
+    values = instance_values([*stp_ids, *sap_ids], STP_RESOURCE_TYPES + ("vlanrange",))
+    sap_owners = owners(sap_ids)
+
+    entries = []
+    for stp in stps:
+        stp_values = values.get(stp.subscription_instance_id, {})
+        sap_id = first(saps, stp.subscription_instance_id, "sap")
+        if stp_values.get("expose_in_topology", "False").lower() != "true":
+            continue
+        if not stp_values.get("topology") or not stp_values.get("stp_id") or sap_id not in sap_owners:
+            continue
+        bandwidth = stp_values.get("bandwidth")
+        entries.append(
+            StpEntry(
+                subscription_id=stp.subscription_id,
+                tag=stp.tag,
+                topology=stp_values["topology"],
+                stp_id=stp_values["stp_id"],
+                stp_description=stp_values.get("stp_description"),
+                is_alias_in=stp_values.get("is_alias_in"),
+                is_alias_out=stp_values.get("is_alias_out"),
+                bandwidth=int(bandwidth) if bandwidth is not None else None,
+                vlanrange=str(VlanRanges(values.get(sap_id, {}).get("vlanrange", ""))),
+                sap_description=sap_owners[sap_id].description,
+            )
+        )
+    return entries
@@ -0,0 +1,236 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The BGP sessions (peerings) in each IP peer group.
+
+A `PeerBlock` of an IP peer subscription points to its `IpPeerGroupBlock`; the peer group does not know its peerings.
+Changing the policy of a peer group therefore means loading every IP peer subscription to find the peerings in the
+group. `PeerGroupIndex` keeps the reverse: the peerings per peer group, with what a group-wide configuration change
+needs (the IP peer, its ASN, the remote addresses and the BGP session priority). The index is built with five
+projection queries and afterwards updated per IP peer or IP peer group subscription.
+"""
+
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from typing import NamedTuple, TypeVar
+from uuid import UUID
+
+import structlog
+from orchestrator.db import ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from surf.products.product_blocks.ip_peer import IpPeerBlockInactive
+from surf.products.services.projection import first, instance_values, owners, related
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+IP_PEER_RESOURCE_TYPES = ("peer_name", "asn")
+PEER_RESOURCE_TYPES = ("ipv4_remote_address", "ipv6_remote_address", "bgp_session_priority")
+GROUP_RESOURCE_TYPES = ("peer_group_name",)
+
+
+class PeerGroupMember(NamedTuple):
+    peer_group_instance_id: UUID
+    peer_group_subscription_id: UUID
+    peer_group_name: str | None
+    ip_peer_subscription_id: UUID
+    ip_peer_instance_id: UUID
+    peer_name: str | None
+    asn: int | None
+    # The PeerBlock
+    subscription_instance_id: UUID
+    ipv4_remote_address: str | None
+    ipv6_remote_address: str | None
+    bgp_session_priority: str | None
+
+
+class PeerGroupIndex:
+    """The peerings per IP peer group (`IpPeerGroupBlock` subscription_instance_id).
+
+    Example:
+    ```python
+    index = PeerGroupIndex.from_db()
+    for ip_peer_subscription_id, peerings in index.by_ip_peer(peer_group_instance_id).items():
+        ...  # modify the IP peer subscription, for its peerings in the group
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_group: dict[UUID, dict[UUID, PeerGroupMember]] = defaultdict(dict)
+        self._by_instance: dict[UUID, PeerGroupMember] = {}
+        self._by_subscription: dict[UUID, list[UUID]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._by_instance)
+
+    def groups(self) -> list[UUID]:
+        """The peer groups with peerings."""
+        with self._lock:
+            return list(self._by_group)
+
+    def groups_of_subscription(self, peer_group_subscription_id: UUID) -> list[UUID]:
+        """The peer groups (with peerings) of an IP peer group subscription."""
+        with self._lock:
+            return [
+                group_id
+                for group_id, members in self._by_group.items()
+                if next(iter(members.values())).peer_group_subscription_id == peer_group_subscription_id
+            ]
+
+    def members(self, peer_group_instance_id: UUID) -> list[PeerGroupMember]:
+        """The peerings in a peer group, by ASN."""
+        with self._lock:
+            members = list(self._by_group.get(peer_group_instance_id, {}).values())
+        return sorted(members, key=lambda member: (member.asn or 0, str(member.subscription_instance_id)))
+
+    def by_ip_peer(self, peer_group_instance_id: UUID) -> dict[UUID, list[PeerGroupMember]]:
+        """The peerings in a peer group per IP peer subscription: the subscriptions a group-wide change modifies."""
+        result: dict[UUID, list[PeerGroupMember]] = defaultdict(list)
+        for member in self.members(peer_group_instance_id):
+            result[member.ip_peer_subscription_id].append(member)
+        return dict(result)
+
+    def changes(
+        self, peer_group_instance_ids: Iterable[UUID], change: Callable[[PeerGroupMember], T | None]
+    ) -> dict[UUID, list[T]]:
+        """Apply `change` to every peering in the peer groups, and collect the results per IP peer subscription.
+
+        Args:
+            peer_group_instance_ids: The peer groups to change.
+            change: Returns the configuration change for a peering, or None when the peering needs none.
+
+        Returns:
+            The changes per IP peer subscription; subscriptions without changes are left out.
+
+        """
+        result: dict[UUID, list[T]] = defaultdict(list)
+        for peer_group_instance_id in peer_group_instance_ids:
+            for member in self.members(peer_group_instance_id):
+                if (item := change(member)) is not None:
+                    result[member.ip_peer_subscription_id].append(item)
+        return dict(result)
+
+    def add(self, member: PeerGroupMember) -> None:
+        with self._lock:
+            self._add(member)
+
+    def _add(self, member: PeerGroupMember) -> None:
+        # Only called with the lock held
+        self._remove(member.subscription_instance_id)
+        self._by_group[member.peer_group_instance_id][member.subscription_instance_id] = member
+        self._by_instance[member.subscription_instance_id] = member
+        self._by_subscription[member.ip_peer_subscription_id].append(member.subscription_instance_id)
+
+    def remove(self, subscription_instance_id: UUID) -> None:
+        with self._lock:
+            self._remove(subscription_instance_id)
+
+    def _remove(self, subscription_instance_id: UUID) -> None:
+        # Only called with the lock held
+        member = self._by_instance.pop(subscription_instance_id, None)
+        if member is None:
+            return
+        del self._by_group[member.peer_group_instance_id][subscription_instance_id]
+        if not self._by_group[member.peer_group_instance_id]:
+            del self._by_group[member.peer_group_instance_id]
+        self._by_subscription[member.ip_peer_subscription_id].remove(subscription_instance_id)
+        if not self._by_subscription[member.ip_peer_subscription_id]:
+            del self._by_subscription[member.ip_peer_subscription_id]
+
+    def refresh_subscription(self, subscription_id: UUID) -> None:
+        """Reload after an IP peer or IP peer group subscription was created, modified or terminated.
+
+        For an IP peer subscription its peerings are reloaded, for an IP peer group subscription the peerings of all IP
+        peer subscriptions with a peering in one of its groups (which hold the name of the group).
+        """
+        with self._lock:
+            affected = {subscription_id}
+            for members in self._by_group.values():
+                if next(iter(members.values())).peer_group_subscription_id == subscription_id:
+                    affected.update(member.ip_peer_subscription_id for member in members.values())
+        members = load_peer_group_members(affected)
+        with self._lock:
+            for ip_peer_subscription_id in affected:
+                for subscription_instance_id in list(self._by_subscription.get(ip_peer_subscription_id, ())):
+                    self._remove(subscription_instance_id)
+            for member in members:
+                self._add(member)
+
+    @classmethod
+    def from_db(cls) -> "PeerGroupIndex":
+        """Build the index from the peerings of all IP peer subscriptions that are not terminated."""
+        index = cls()
+        members = load_peer_group_members()
+        with index._lock:
+            for member in members:
+                index._add(member)
+        logger.debug("Built peer group index", peerings=len(index), peer_groups=len(index._by_group))
+        return index
+
+
+def load_peer_group_members(subscription_ids: Iterable[UUID] | None = None) -> list[PeerGroupMember]:
+    """Read the peerings of all (or the given) IP peer subscriptions that are not terminated, with their peer group.
+
+    Peerings without a peer group are left out.
+    """
+    stmt = (
+        select(SubscriptionTable.subscription_id, SubscriptionInstanceTable.subscription_instance_id)
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == IpPeerBlockInactive.name)
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    ip_peers = db.session.execute(stmt).all()
+
+    ip_peer_ids = [ip_peer.subscription_instance_id for ip_peer in ip_peers]
+    peers = related(ip_peer_ids, ["peers"])
+    peer_ids = [peer_id for instances in peers.values() for peer_id in instances]
+    groups = related(peer_ids, ["peer_group"])
+    group_ids = {group_id for instances in groups.values() for group_id in instances}
+    values = instance_values(
+        [*ip_peer_ids, *peer_ids, *group_ids], IP_PEER_RESOURCE_TYPES + PEER_RESOURCE_TYPES + GROUP_RESOURCE_TYPES
+    )
+    group_owners = owners(group_ids)
+
+    members = []
+    for ip_peer_subscription_id, ip_peer_id in ip_peers:
+        ip_peer = values.get(ip_peer_id, {})
+        asn = ip_peer.get("asn")
+        for peer_id in peers.get((ip_peer_id, "peers"), ()):
+            group_id = first(groups, peer_id, "peer_group")
+            if group_id is None or group_id not in group_owners:
+                continue
+            peer = values.get(peer_id, {})
+            members.append(
+                PeerGroupMember(
+                    peer_group_instance_id=group_id,
+                    peer_group_subscription_id=group_owners[group_id].subscription_id,
+                    peer_group_name=values.get(group_id, {}).get("peer_group_name"),
+                    ip_peer_subscription_id=ip_peer_subscription_id,
+                    ip_peer_instance_id=ip_peer_id,
+                    peer_name=ip_peer.get("peer_name"),
+                    asn=int(asn) if asn is not None else None,
+                    subscription_instance_id=peer_id,
+                    ipv4_remote_address=peer.get("ipv4_remote_address"),
+                    ipv6_remote_address=peer.get("ipv6_remote_address"),
+                    bgp_session_priority=peer.get("bgp_session_priority"),
+                )
+            )
+    return members
@@ -0,0 +1,168 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read-only views of the peerings of IP peer subscriptions, for lists and overviews.
+
+The title of every `PeerBlock` loads the subscription of the SAP of its port, so listing the (up to 20) peerings of an
+IP peer loads 20 subscriptions or more, and listing all IX peers thousands. `load_ip_peer_views()` reads the IP peers,
+their peerings, ports, SAPs, peer groups and the descriptions of the subscriptions they belong to with a few
+projection queries, level by level, whatever the number of peers:
+
+    for view in load_ip_peer_views().values():
+        print(view.summary())
+
+Views are plain tuples with the same titles as the product blocks; they can not be changed or saved.
+"""
+
+from collections.abc import Iterable
+from typing import NamedTuple
+from uuid import UUID
+
+from orchestrator.db import ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from orchestrator.utils.vlans import VlanRanges
+from sqlalchemy import select
+
+from surf.products.product_blocks.ip_peer import IpPeerBlockInactive
+from surf.products.services.projection import first, instance_values, owners, related
+
+IP_PEER_RESOURCE_TYPES = ("peer_name", "asn")
+PEER_RESOURCE_TYPES = ("ipv4_remote_address", "ipv6_remote_address", "bfd")
+PORT_RESOURCE_TYPES = ("peer_port_name",)
+SAP_RESOURCE_TYPES = ("vlanrange",)
+GROUP_RESOURCE_TYPES = ("peer_group_name",)
+
+
+class PeeringView(NamedTuple):
+    subscription_instance_id: UUID
+    port_subscription_id: UUID | None
+    peer_port_name: str | None
+    sap_subscription_id: UUID | None
+    sap_description: str | None
+    vlanrange: str | None
+    peer_group_name: str | None
+    ipv4_remote_address: str | None
+    ipv6_remote_address: str | None
+    bfd: bool | None
+
+    @property
+    def title(self) -> str:
+        """The title of the `PeerBlock`: the description of the SAP subscription and the VLAN range."""
+        return f"{self.sap_description}{self.vlanrange}"
+
+
+class IpPeerView(NamedTuple):
+    subscription_id: UUID
+    description: str
+    status: str
+    # Tag of the IP Peer product block, as in the title of `IpPeerBlock`
+    tag: str
+    subscription_instance_id: UUID
+    peer_name: str | None
+    asn: int | None
+    peerings: tuple[PeeringView, ...]
+
+    @property
+    def title(self) -> str:
+        """The title of the `IpPeerBlock`."""
+        return f"{self.tag} {self.peer_name} AS{self.asn}"
+
+    def summary(self) -> str:
+        """The title of the IP peer and a line per peering."""
+        lines = [f"{self.title} ({self.description}, {self.status}): {len(self.peerings)} peerings"]
+        for peering in self.peerings:
+            addresses = " ".join(filter(None, (peering.ipv4_remote_address, peering.ipv6_remote_address)))
+            bfd = " bfd" if peering.bfd else ""
+            lines.append(f"  {peering.title} {peering.peer_group_name} {addresses}{bfd}".rstrip())
+        return "\n".join(lines)
+
+
+def load_ip_peer_views(subscription_ids: Iterable[UUID] | None = None) -> dict[UUID, IpPeerView]:
+    """Build views of IP peer subscriptions and their peerings.
+
+    Args:
+        subscription_ids: Limit to these subscriptions, all IP peer subscriptions that are not terminated when None.
+
+    Returns:
+        Views by subscription_id, with the peerings in the order of the `peers` list.
+
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionTable.status,
+            ProductBlockTable.tag,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name == IpPeerBlockInactive.name)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    else:
+        stmt = stmt.where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    ip_peers = db.session.execute(stmt).all()
+
+    # Level by level: IP peer -> peerings -> ports and peer groups -> SAPs
+    ip_peer_ids = [ip_peer.subscription_instance_id for ip_peer in ip_peers]
+    peers = related(ip_peer_ids, ["peers"])
+    peer_ids = [peer_id for instances in peers.values() for peer_id in instances]
+    ports_and_groups = related(peer_ids, ["port", "peer_group"])
+    port_ids = [first(ports_and_groups, peer_id, "port") for peer_id in peer_ids]
+    group_ids = [first(ports_and_groups, peer_id, "peer_group") for peer_id in peer_ids]
+    saps = related([port_id for port_id in port_ids if port_id], ["sap"])
+    sap_ids = [sap_id for instances in saps.values() for sap_id in instances]
+
+    values = instance_values(
+        [instance_id for instance_id in (*ip_peer_ids, *peer_ids, *port_ids, *sap_ids, *group_ids) if instance_id],
+        IP_PEER_RESOURCE_TYPES + PEER_RESOURCE_TYPES + PORT_RESOURCE_TYPES + SAP_RESOURCE_TYPES + GROUP_RESOURCE_TYPES,
+    )
+    owner = owners([instance_id for instance_id in (*port_ids, *sap_ids) if instance_id])
+
+    def peering(peer_id: UUID) -> PeeringView:
+        peer = values.get(peer_id, {})
+        port_id = first(ports_and_groups, peer_id, "port")
+        sap_id = first(saps, port_id, "sap") if port_id else None
+        group_id = first(ports_and_groups, peer_id, "peer_group")
+        vlanrange = values.get(sap_id, {}).get("vlanrange") if sap_id else None
+        bfd = peer.get("bfd")
+        return PeeringView(
+            subscription_instance_id=peer_id,
+            port_subscription_id=owner[port_id].subscription_id if port_id in owner else None,
+            peer_port_name=values.get(port_id, {}).get("peer_port_name") if port_id else None,
+            sap_subscription_id=owner[sap_id].subscription_id if sap_id in owner else None,
+            sap_description=owner[sap_id].description if sap_id in owner else None,
+            vlanrange=str(VlanRanges(vlanrange)) if vlanrange is not None else None,
+            peer_group_name=values.get(group_id, {}).get("peer_group_name") if group_id else None,
+            ipv4_remote_address=peer.get("ipv4_remote_address"),
+            ipv6_remote_address=peer.get("ipv6_remote_address"),
+            bfd=bfd.lower() == "true" if bfd is not None else None,
+        )
+
+    views = {}
+    for ip_peer in ip_peers:
+        ip_peer_values = values.get(ip_peer.subscription_instance_id, {})
+        asn = ip_peer_values.get("asn")
+        views[ip_peer.subscription_id] = IpPeerView(
+            subscription_id=ip_peer.subscription_id,
+            description=ip_peer.description,
+            status=ip_peer.status,
+            tag=ip_peer.tag,
+            subscription_instance_id=ip_peer.subscription_instance_id,
+            peer_name=ip_peer_values.get("peer_name"),
+            asn=int(asn) if asn is not None else None,
+            peerings=tuple(peering(peer_id) for peer_id in peers.get((ip_peer.subscription_instance_id, "peers"), ())),
+        )
+    return views
@@ -0,0 +1,427 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The hierarchy of IP prefix subscriptions, as a radix trie per address family.
+
+`IpPrefixBlock` points to its `parent_prefix`, another `IpPrefixBlock`, so loading a customer prefix loads all its
+ancestors, and finding the prefixes inside an aggregate means loading every IP prefix subscription. `PrefixIndex`
+keeps the prefixes of all IP prefix subscriptions in a path-compressed binary trie, IPv4 and IPv6 apart, so these
+questions are a walk of at most 32 or 128 bits without loading a subscription:
+
+    index = PrefixIndex.from_db(resolve)
+    index.longest_match("145.100.1.10")  # the most specific prefix subscription containing the address
+    index.ancestors("145.100.1.0/24")  # the aggregates it is part of, outermost first
+    index.children("145.100.0.0/16")  # the prefixes directly inside the aggregate
+    index.first_free("145.100.0.0/16", 24)  # the first /24 in the aggregate not used by a prefix
+
+The prefixes are kept in IPAM; an IP prefix subscription only stores `ipam_prefix_id`. The index is built with two
+projection queries and one call of `resolve` for all prefix ids, and afterwards updated per subscription with
+`refresh_subscription()` when a prefix subscription is created, modified or terminated. `resolve` returns the prefixes
+of IPAM prefix ids: a bulk IPAM lookup, or a lookup in an IPAM export. The index does not call IPAM itself, as the IPAM
+client has no confirmed bulk lookup by id yet.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_network, summarize_address_range
+from typing import NamedTuple
+from uuid import UUID
+
+import structlog
+from orchestrator.db import (
+    ProductBlockTable,
+    ResourceTypeTable,
+    SubscriptionInstanceRelationTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from surf.products.product_blocks.ip_prefix import IpPrefixBlockInactive
+
+logger = structlog.get_logger(__name__)
+
+Network = IPv4Network | IPv6Network
+# A prefix or address as a network, its string or an address
+PrefixLike = Network | IPv4Address | IPv6Address | str
+# Returns the prefixes of IPAM prefix ids, by id; unknown ids are left out
+Resolver = Callable[[Collection[int]], Mapping[int, str]]
+
+
+class PrefixEntry(NamedTuple):
+    subscription_id: UUID
+    subscription_instance_id: UUID
+    status: str
+    ipam_prefix_id: int
+    prefix: Network
+    customer_aggregate: bool | None
+    planned: bool | None
+    # The stored parent_prefix block, which may differ from the parent in the index
+    parent_subscription_instance_id: UUID | None
+
+
+class _Node:
+    __slots__ = ("value", "length", "entry", "children")
+
+    def __init__(self, value: int, length: int, entry: PrefixEntry | None = None) -> None:
+        self.value = value
+        self.length = length
+        self.entry = entry
+        self.children: list[_Node | None] = [None, None]
+
+
+class PrefixTrie:
+    """A path-compressed binary trie of the prefixes of one address family, with one entry per prefix.
+
+    Prefixes are (network address as int, prefix length). Every node has the bits its children have in common; nodes
+    without entry only exist where two branches split.
+    """
+
+    def __init__(self, bits: int) -> None:
+        self.bits = bits
+        self.root = _Node(0, 0)
+        self.size = 0
+
+    def _bit(self, value: int, position: int) -> int:
+        """Bit `position` of `value`, counted from the most significant bit."""
+        return (value >> (self.bits - position - 1)) & 1
+
+    def _mask(self, length: int) -> int:
+        return ((1 << length) - 1) << (self.bits - length)
+
+    def _covers(self, node: _Node, value: int, length: int) -> bool:
+        """Whether the prefix of `node` contains (or is) prefix (value, length)."""
+        return node.length <= length and (value ^ node.value) >> (self.bits - node.length) == 0
+
+    def insert(self, value: int, length: int, entry: PrefixEntry) -> PrefixEntry | None:
+        """Set the entry of a prefix, returns the entry it replaces."""
+        node = self.root
+        while node.length < length:
+            bit = self._bit(value, node.length)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(value, length, entry)
+                self.size += 1
+                return None
+            common = min(length, child.length, self.bits - (value ^ child.value).bit_length())
+            if common == child.length:
+                node = child
+                continue
+            new = _Node(value, length, entry) if common == length else _Node(value & self._mask(common), common)
+            new.children[self._bit(child.value, common)] = child
+            if common < length:
+                new.children[self._bit(value, common)] = _Node(value, length, entry)
+            node.children[bit] = new
+            self.size += 1
+            return None
+        previous, node.entry = node.entry, entry
+        if previous is None:
+            self.size += 1
+        return previous
+
+    def delete(self, value: int, length: int) -> PrefixEntry | None:
+        """Remove the entry of a prefix, returns it."""
+        path = [self.root]
+        while path[-1].length < length:
+            child = path[-1].children[self._bit(value, path[-1].length)]
+            if child is None or not self._covers(child, value, length):
+                return None
+            path.append(child)
+        node = path[-1]
+        entry, node.entry = node.entry, None
+        if entry is None:
+            return None
+        self.size -= 1
+        # Drop the nodes that no longer split two branches
+        while len(path) > 1 and path[-1].entry is None:
+            node, parent = path.pop(), path[-1]
+            remaining = [child for child in node.children if child is not None]
+            if len(remaining) == 2:
+                break
+            parent.children[parent.children.index(node)] = remaining[0] if remaining else None
+        return entry
+
+    def get(self, value: int, length: int) -> PrefixEntry | None:
+        node = self._subtree(value, length)
+        return node.entry if node is not None and node.length == length else None
+
+    def covering(self, value: int, length: int) -> Iterator[PrefixEntry]:
+        """The entries of the prefixes containing (value, length), including itself, outermost first."""
+        node: _Node | None = self.root
+        while node is not None and self._covers(node, value, length):
+            if node.entry is not None:
+                yield node.entry
+            if node.length == length:
+                return
+            node = node.children[self._bit(value, node.length)]
+
+    def _subtree(self, value: int, length: int) -> _Node | None:
+        """The topmost node inside prefix (value, length), or None when the trie has no prefix inside it."""
+        node = self.root
+        while node.length < length:
+            child = node.children[self._bit(value, node.length)]
+            if child is None:
+                return None
+            if child.length <= length:
+                if not self._covers(child, value, length):
+                    return None
+            elif (child.value ^ value) >> (self.bits - length):
+                return None
+            node = child
+        return node
+
+    def inside(self, value: int, length: int, nested: bool = True) -> Iterator[PrefixEntry]:
+        """The entries of the prefixes inside (value, length), excluding itself, in address order.
+
+        With `nested` false only the outermost ones: the prefixes inside another prefix inside (value, length) are
+        left out.
+        """
+        top = self._subtree(value, length)
+        if top is None:
+            return
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            if node.entry is not None and node.length > length:
+                yield node.entry
+                if not nested:
+                    continue
+            stack.extend(child for child in reversed(node.children) if child is not None)
+
+
+class PrefixIndex:
+    """The prefixes of all IP prefix subscriptions that are not terminated, in a trie per address family.
+
+    Example:
+    ```python
+    index = PrefixIndex.from_db(resolve)
+    if (entry := index.get("145.100.1.0/24")) is not None:
+        raise ValueError(f"145.100.1.0/24 is already used by IP prefix subscription {entry.subscription_id}")
+    aggregate = index.parent("145.100.1.0/24")
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self._by_instance: dict[UUID, PrefixEntry] = {}
+        self._by_subscription: dict[UUID, list[UUID]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._by_instance)
+
+    def _key(self, prefix: PrefixLike) -> tuple[PrefixTrie, int, int]:
+        network = prefix if isinstance(prefix, IPv4Network | IPv6Network) else ip_network(prefix)
+        return self._tries[network.version], int(network.network_address), network.prefixlen
+
+    def get(self, prefix: PrefixLike) -> PrefixEntry | None:
+        """The prefix subscription of exactly this prefix."""
+        trie, value, length = self._key(prefix)
+        return trie.get(value, length)
+
+    def longest_match(self, prefix: PrefixLike) -> PrefixEntry | None:
+        """The most specific prefix subscription containing an address or prefix (or of the prefix itself)."""
+        trie, value, length = self._key(prefix)
+        return next(reversed(list(trie.covering(value, length))), None)
+
+    def ancestors(self, prefix: PrefixLike) -> list[PrefixEntry]:
+        """The prefix subscriptions of the prefixes containing `prefix`, without itself, outermost first."""
+        trie, value, length = self._key(prefix)
+        return [entry for entry in trie.covering(value, length) if entry.prefix.prefixlen < length]
+
+    def parent(self, prefix: PrefixLike) -> PrefixEntry | None:
+        """The most specific prefix subscription containing `prefix`, without itself."""
+        ancestors = self.ancestors(prefix)
+        return ancestors[-1] if ancestors else None
+
+    def children(self, prefix: PrefixLike) -> list[PrefixEntry]:
+        """The prefix subscriptions directly inside `prefix`: not inside another prefix inside it."""
+        trie, value, length = self._key(prefix)
+        return list(trie.inside(value, length, nested=False))
+
+    def descendants(self, prefix: PrefixLike) -> list[PrefixEntry]:
+        """All prefix subscriptions inside `prefix`, in address order."""
+        trie, value, length = self._key(prefix)
+        return list(trie.inside(value, length))
+
+    def free(self, prefix: PrefixLike) -> list[Network]:
+        """The largest networks inside `prefix` that are not (part of) a prefix subscription inside it."""
+        network = prefix if isinstance(prefix, IPv4Network | IPv6Network) else ip_network(prefix)
+        address = type(network.network_address)
+        result: list[Network] = []
+        start = int(network.network_address)
+        for child in self.children(network):
+            if int(child.prefix.network_address) > start:
+                end = int(child.prefix.network_address) - 1
+                result.extend(summarize_address_range(address(start), address(end)))  # type: ignore[arg-type]
+            start = int(child.prefix.broadcast_address) + 1
+        if start <= int(network.broadcast_address):
+            result.extend(summarize_address_range(address(start), network.broadcast_address))  # type: ignore[arg-type]
+        return result
+
+    def first_free(self, prefix: PrefixLike, prefixlen: int) -> Network | None:
+        """The first network of length `prefixlen` inside `prefix` that is free, None when there is none."""
+        for network in self.free(prefix):
+            if network.prefixlen <= prefixlen:
+                return ip_network((network.network_address, prefixlen))
+        return None
+
+    def add(self, entry: PrefixEntry) -> None:
+        """Register the prefix of an IP prefix subscription.
+
+        Raises:
+            ValueError: when the prefix belongs to another IP prefix subscription.
+
+        """
+        with self._lock:
+            self._add(entry)
+
+    def _add(self, entry: PrefixEntry) -> None:
+        # Only called with the lock held
+        trie, value, length = self._key(entry.prefix)
+        owner = trie.get(value, length)
+        if owner is not None and owner.subscription_instance_id != entry.subscription_instance_id:
+            raise ValueError(f"Prefix {entry.prefix} is already used by IP prefix subscription {owner.subscription_id}")
+        self._remove(entry.subscription_instance_id)
+        trie.insert(value, length, entry)
+        self._by_instance[entry.subscription_instance_id] = entry
+        self._by_subscription[entry.subscription_id].append(entry.subscription_instance_id)
+
+    def remove(self, subscription_instance_id: UUID) -> None:
+        with self._lock:
+            self._remove(subscription_instance_id)
+
+    def _remove(self, subscription_instance_id: UUID) -> None:
+        # Only called with the lock held
+        entry = self._by_instance.pop(subscription_instance_id, None)
+        if entry is None:
+            return
+        trie, value, length = self._key(entry.prefix)
+        trie.delete(value, length)
+        self._by_subscription[entry.subscription_id].remove(subscription_instance_id)
+        if not self._by_subscription[entry.subscription_id]:
+            del self._by_subscription[entry.subscription_id]
+
+    def refresh_subscription(self, subscription_id: UUID, resolve: Resolver) -> None:
+        """Reload the prefix of one subscription after it was created, modified or terminated."""
+        entries = load_prefixes([subscription_id], resolve=resolve)
+        with self._lock:
+            for subscription_instance_id in list(self._by_subscription.get(subscription_id, ())):
+                self._remove(subscription_instance_id)
+            for entry in entries:
+                self._add(entry)
+
+    @classmethod
+    def from_db(cls, resolve: Resolver) -> PrefixIndex:
+        """Build the index from all IP prefix subscriptions that are not terminated.
+
+        Args:
+            resolve: Returns the prefixes of IPAM prefix ids, called once with all ids.
+
+        """
+        index = cls()
+        entries = load_prefixes(resolve=resolve)
+        with index._lock:
+            for entry in entries:
+                try:
+                    index._add(entry)
+                except ValueError as exc:
+                    logger.warning("Duplicate IP prefix subscription in database", error=str(exc))
+        logger.debug("Built prefix index", prefixes=len(index), v4=index._tries[4].size, v6=index._tries[6].size)
+        return index
+
+
+def load_prefixes(subscription_ids: Iterable[UUID] | None = None, *, resolve: Resolver) -> list[PrefixEntry]:
+    """Read the IP prefix blocks of all (or the given) subscriptions that are not terminated, in two queries.
+
+    Args:
+        subscription_ids: Limit to these subscriptions, all IP prefix subscriptions when None.
+        resolve: Returns the prefixes of IPAM prefix ids. Called once, with all ids.
+
+    Returns:
+        The entries of the blocks with an `ipam_prefix_id` that IPAM knows; the others are left out.
+
+    """
+    resource_types = ("ipam_prefix_id", "customer_aggregate", "planned")
+    stmt = (
+        select(
+            SubscriptionInstanceTable.subscription_id,
+            SubscriptionInstanceTable.subscription_instance_id,
+            SubscriptionTable.status,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(SubscriptionTable, SubscriptionTable.subscription_id == SubscriptionInstanceTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .join(
+            SubscriptionInstanceValueTable,
+            SubscriptionInstanceValueTable.subscription_instance_id
+            == SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(ProductBlockTable.name == IpPrefixBlockInactive.name)
+        .where(ResourceTypeTable.resource_type.in_(resource_types))
+        .where(SubscriptionTable.status != SubscriptionLifecycle.TERMINATED.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+
+    values: dict[tuple[UUID, UUID, str], dict[str, str]] = defaultdict(dict)
+    for subscription_id, subscription_instance_id, status, resource_type, value in db.session.execute(stmt):
+        values[(subscription_id, subscription_instance_id, status)][resource_type] = value
+
+    parents: dict[UUID, UUID] = {}
+    instance_ids = [subscription_instance_id for _, subscription_instance_id, _ in values]
+    if instance_ids:
+        stmt = (
+            select(SubscriptionInstanceRelationTable.in_use_by_id, SubscriptionInstanceRelationTable.depends_on_id)
+            .where(SubscriptionInstanceRelationTable.in_use_by_id.in_(instance_ids))
+            .where(SubscriptionInstanceRelationTable.domain_model_attr == "parent_prefix")
+        )
+        parents = dict(db.session.execute(stmt).tuples().all())
+
+    def flag(value: str | None) -> bool | None:
+        return None if value is None else value.lower() == "true"
+
+    prefixes = resolve({int(block["ipam_prefix_id"]) for block in values.values() if "ipam_prefix_id" in block})
+    entries = []
+    for (subscription_id, subscription_instance_id, status), block in values.items():
+        if "ipam_prefix_id" not in block:
+            continue
+        ipam_prefix_id = int(block["ipam_prefix_id"])
+        if ipam_prefix_id not in prefixes:
+            logger.warning(
+                "IPAM prefix of IP prefix subscription not found",
+                subscription_id=str(subscription_id),
+                ipam_prefix_id=ipam_prefix_id,
+            )
+            continue
+        entries.append(
+            PrefixEntry(
+                subscription_id=subscription_id,
+                subscription_instance_id=subscription_instance_id,
+                status=status,
+                ipam_prefix_id=ipam_prefix_id,
+                prefix=ip_network(prefixes[ipam_prefix_id]),
+                customer_aggregate=flag(block.get("customer_aggregate")),
+                planned=flag(block.get("planned")),
+                parent_subscription_instance_id=parents.get(subscription_instance_id),
+            )
+        )
+    return entries
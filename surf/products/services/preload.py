@@ -0,0 +1,136 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bulk loading of subscriptions into the database session.
+
+Hydrating a domain model walks its subscription instances one relation at a time, which costs a few queries per
+product block. A virtual firewall (`Fw`) with dozens of endpoints loads every endpoint, its internal L2VPN virtual
+circuit, its SAPs and their ports and nodes in turn. `preload_subscriptions()` loads a set of subscriptions together
+with every subscription instance they depend on (also when those belong to other subscriptions) in a fixed number of
+queries: one round per level of nesting, whatever the number of endpoints. `from_subscription()` and `from_db()`
+afterwards find everything in the identity map of the session::
+
+    firewalls = load_fws(subscription_ids)
+"""
+
+from collections.abc import Iterable
+from typing import Any
+from uuid import UUID
+
+import structlog
+
+from orchestrator.db import (
+    ProductBlockTable,
+    ProductTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from orchestrator.domain.lifecycle import lookup_specialized_type
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from surf.products.product_blocks.fw import FwBlockInactive
+from surf.products.product_types.fw import FwInactive
+
+logger = structlog.get_logger(__name__)
+
+# Product blocks nest eight levels deep at most (FW -> FW L3 Endpoint -> SN8 L2VPN Virtual Circuit -> SN8 L2VPN ESI ->
+# SN8 Service Attach Point -> SN8 Aggregated Service Port -> SN8 Service Port -> Node), seven rounds below the blocks
+# of the subscriptions themselves; the last round leaves room for deeper models
+MAX_DEPTH = 8
+
+
+def _instance_options(loader: Any) -> Any:
+    return loader.options(
+        selectinload(SubscriptionInstanceTable.product_block).selectinload(ProductBlockTable.resource_types),
+        selectinload(SubscriptionInstanceTable.values).joinedload(SubscriptionInstanceValueTable.resource_type),
+        selectinload(SubscriptionInstanceTable.depends_on_block_relations),
+        selectinload(SubscriptionInstanceTable.in_use_by_block_relations),
+    )
+
+
+def _depends_on_ids(instances: Iterable[SubscriptionInstanceTable]) -> set[UUID]:
+    return {relation.depends_on_id for instance in instances for relation in instance.depends_on_block_relations}
+
+
+def preload_subscriptions(subscription_ids: Iterable[UUID]) -> dict[UUID, SubscriptionTable]:
+    """Load subscriptions and all subscription instances they depend on into the session.
+
+    Args:
+        subscription_ids: The subscriptions to load.
+
+    Returns:
+        The loaded subscriptions by subscription_id. Unknown ids are left out.
+
+    """
+    subscription_ids = set(subscription_ids)
+    if not subscription_ids:
+        return {}
+
+    stmt = (
+        select(SubscriptionTable)
+        .where(SubscriptionTable.subscription_id.in_(subscription_ids))
+        .options(
+            selectinload(SubscriptionTable.product).selectinload(ProductTable.fixed_inputs),
+            _instance_options(selectinload(SubscriptionTable.instances)),
+        )
+    )
+    subscriptions = {subscription.subscription_id: subscription for subscription in db.session.scalars(stmt)}
+
+    instances = [instance for subscription in subscriptions.values() for instance in subscription.instances]
+    loaded = {instance.subscription_instance_id for instance in instances}
+    pending = _depends_on_ids(instances) - loaded
+
+    for _ in range(MAX_DEPTH):
+        if not pending:
+            break
+        stmt = (
+            select(SubscriptionInstanceTable)
+            .where(SubscriptionInstanceTable.subscription_instance_id.in_(pending))
+            .options(joinedload(SubscriptionInstanceTable.subscription))
+        )
+        instances = db.session.scalars(_instance_options(stmt)).unique().all()
+        loaded |= pending
+        pending = _depends_on_ids(instances) - loaded
+
+    if pending:
+        # Hydration still works, but loads the remaining instances one relation at a time
+        logger.warning(
+            "Subscription instances nest deeper than MAX_DEPTH, not all were preloaded", unresolved=len(pending)
+        )
+    return subscriptions
+
+
+def load_fws(subscription_ids: Iterable[UUID]) -> dict[UUID, FwInactive]:
+    """Load `Fw` subscriptions with all their endpoints, virtual circuits and SAPs preloaded.
+
+    Returns:
+        The domain models (`Fw`, `FwProvisioning` or `FwInactive`, by the lifecycle of each subscription) by
+        subscription_id. Unknown ids are left out.
+
+    Raises:
+        ValueError: When one of the subscriptions is not a `Fw` subscription.
+
+    """
+    subscriptions = preload_subscriptions(subscription_ids)
+    for subscription_id, subscription in subscriptions.items():
+        if not any(instance.product_block.name == FwBlockInactive.name for instance in subscription.instances):
+            raise ValueError(f"Subscription {subscription_id} ({subscription.product.name}) is not a Fw subscription")
+    return {
+        subscription_id: lookup_specialized_type(FwInactive, SubscriptionLifecycle(subscription.status))
+        .from_subscription(subscription_id)
+        for subscription_id, subscription in subscriptions.items()
+    }
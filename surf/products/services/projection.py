@@ -0,0 +1,143 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Projection queries: read resource type values and instance relations without hydrating domain models.
+
+Read-only views and indexes select only the values they need, for all the instances they cover at once, with these
+helpers, and walk the relations between product blocks level by level instead of loading subscriptions.
+"""
+
+from collections import defaultdict
+from collections.abc import Collection, Iterable
+from typing import NamedTuple
+from uuid import UUID
+
+from orchestrator.db import (
+    ResourceTypeTable,
+    SubscriptionInstanceRelationTable,
+    SubscriptionInstanceTable,
+    SubscriptionInstanceValueTable,
+    SubscriptionTable,
+    db,
+)
+from sqlalchemy import select
+
+# Service port, IRB port -> node; multi service carrier -> port; aggregated port -> member ports
+MAX_PORT_DEPTH = 4
+
+
+class Owner(NamedTuple):
+    subscription_id: UUID
+    description: str
+    status: str
+
+
+def instance_values(instance_ids: Collection[UUID], resource_types: Iterable[str]) -> dict[UUID, dict[str, str]]:
+    """The values of `resource_types` of each instance, as stored (strings)."""
+    values: dict[UUID, dict[str, str]] = defaultdict(dict)
+    if not instance_ids:
+        return values
+    stmt = (
+        select(
+            SubscriptionInstanceValueTable.subscription_instance_id,
+            ResourceTypeTable.resource_type,
+            SubscriptionInstanceValueTable.value,
+        )
+        .join(ResourceTypeTable, ResourceTypeTable.resource_type_id == SubscriptionInstanceValueTable.resource_type_id)
+        .where(SubscriptionInstanceValueTable.subscription_instance_id.in_(instance_ids))
+        .where(ResourceTypeTable.resource_type.in_(list(resource_types)))
+    )
+    for subscription_instance_id, resource_type, value in db.session.execute(stmt):
+        values[subscription_instance_id][resource_type] = value
+    return values
+
+
+def related(instance_ids: Collection[UUID], attributes: Iterable[str]) -> dict[tuple[UUID, str], list[UUID]]:
+    """The instances the `instance_ids` depend on, by (instance, domain model attribute), in order."""
+    result: dict[tuple[UUID, str], list[UUID]] = defaultdict(list)
+    if not instance_ids:
+        return result
+    stmt = (
+        select(
+            SubscriptionInstanceRelationTable.in_use_by_id,
+            SubscriptionInstanceRelationTable.domain_model_attr,
+            SubscriptionInstanceRelationTable.depends_on_id,
+        )
+        .where(SubscriptionInstanceRelationTable.in_use_by_id.in_(instance_ids))
+        .where(SubscriptionInstanceRelationTable.domain_model_attr.in_(list(attributes)))
+        .order_by(SubscriptionInstanceRelationTable.order_id)
+    )
+    for in_use_by_id, attribute, depends_on_id in db.session.execute(stmt):
+        result[(in_use_by_id, attribute)].append(depends_on_id)
+    return result
+
+
+def used_by(instance_ids: Collection[UUID], attributes: Iterable[str]) -> dict[tuple[UUID, str], list[UUID]]:
+    """The instances that depend on the `instance_ids`, by (instance, domain model attribute): `related()` reversed."""
+    result: dict[tuple[UUID, str], list[UUID]] = defaultdict(list)
+    if not instance_ids:
+        return result
+    stmt = (
+        select(
+            SubscriptionInstanceRelationTable.depends_on_id,
+            SubscriptionInstanceRelationTable.domain_model_attr,
+            SubscriptionInstanceRelationTable.in_use_by_id,
+        )
+        .where(SubscriptionInstanceRelationTable.depends_on_id.in_(instance_ids))
+        .where(SubscriptionInstanceRelationTable.domain_model_attr.in_(list(attributes)))
+    )
+    for depends_on_id, attribute, in_use_by_id in db.session.execute(stmt):
+        result[(depends_on_id, attribute)].append(in_use_by_id)
+    return result
+
+
+def owners(instance_ids: Collection[UUID]) -> dict[UUID, Owner]:
+    """The subscription owning each instance."""
+    if not instance_ids:
+        return {}
+    stmt = (
+        select(
+            SubscriptionInstanceTable.subscription_instance_id,
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionTable.status,
+        )
+        .join(SubscriptionTable, SubscriptionTable.subscription_id == SubscriptionInstanceTable.subscription_id)
+        .where(SubscriptionInstanceTable.subscription_instance_id.in_(instance_ids))
+    )
+    return {instance_id: Owner(*owner) for instance_id, *owner in db.session.execute(stmt)}
+
+
+def first(relations: dict[tuple[UUID, str], list[UUID]], instance_id: UUID, attribute: str) -> UUID | None:
+    """The first instance `instance_id` depends on as `attribute`, in the result of `related()`."""
+    instances = relations.get((instance_id, attribute))
+    return instances[0] if instances else None
+
+
+def sap_nodes(sap_ids: Collection[UUID]) -> dict[UUID, UUID]:
+    """The node instance of the port of each SAP; SAPs on aggregated ports take the node of the first member."""
+    ports = related(sap_ids, ["port"])
+    current = {sap_id: port_id for sap_id in sap_ids if (port_id := first(ports, sap_id, "port"))}
+    nodes: dict[UUID, UUID] = {}
+    for _ in range(MAX_PORT_DEPTH):
+        if not current:
+            break
+        relations = related(set(current.values()), ["node", "port"])
+        pending = {}
+        for sap_id, port_id in current.items():
+            if node_id := first(relations, port_id, "node"):
+                nodes[sap_id] = node_id
+            elif member_id := first(relations, port_id, "port"):
+                pending[sap_id] = member_id
+        current = pending
+    return nodes
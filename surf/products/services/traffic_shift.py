@@ -0,0 +1,264 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Where traffic goes when corelinks are put in maintenance mode.
+
+Putting a corelink in maintenance mode moves its traffic to other corelinks. `TrafficShiftSimulator` estimates the
+traffic between every pair of nodes from the active light path, L2VPN and L3VPN services: the `service_speed` of each
+virtual circuit, spread evenly from every endpoint node (the node of the port of a SAP) to the other endpoint nodes. It
+routes that traffic over the `CorelinkMatrix` and reports the corelinks that would be overloaded without the corelinks
+that go into maintenance::
+
+    simulator = TrafficShiftSimulator.from_db()
+    shift = simulator.simulate([corelink_subscription_id])
+    for overload in shift.overloaded:
+        ...
+
+Traffic is in Mbit/s. Services with all endpoints on one node do not use the backbone. Two kinds of virtual circuits
+are left out, as their speed is not traffic of their own:
+
+- The second virtual circuit of a Protected light path (`LR Service Settings`, protection type Protected): it only
+  carries the traffic of the first one when that fails, so the light path counts once, over the path of its first
+  virtual circuit. Redundant light paths carry traffic on both virtual circuits, and both count.
+- The internal L2VPNs of firewall endpoints (`l2vpn_internal`): their speed is the bandwidth of the firewall per
+  endpoint, which all endpoints of a firewall share, so counting each at full speed multiplies the bandwidth of the
+  firewall by its number of endpoints.
+"""
+
+from collections.abc import Collection, Iterable
+from typing import NamedTuple
+from uuid import UUID
+
+import numpy as np
+import structlog
+from orchestrator.db import FixedInputTable, ProductBlockTable, SubscriptionInstanceTable, SubscriptionTable, db
+from orchestrator.types import SubscriptionLifecycle
+from sqlalchemy import select
+
+from surf.products.product_blocks.vc_l2vpn_sn8 import Sn8L2VpnVirtualCircuitBlockInactive
+from surf.products.product_blocks.vc_l3vpn_sn8 import Sn8L3VpnVirtualCircuitBlockInactive
+from surf.products.product_blocks.vc_lp_sn8 import Sn8LightPathVirtualCircuitBlockInactive
+from surf.products.product_types.fixed_input_types import ProtectionType
+from surf.products.services.corelink_matrix import Corelink, CorelinkMatrix, MetricImpact, load_corelinks
+from surf.products.services.lr_diversity import PROTECTION_TYPE_FIXED_INPUT
+from surf.products.services.projection import instance_values, owners, related, sap_nodes, used_by
+
+logger = structlog.get_logger(__name__)
+
+VIRTUAL_CIRCUIT_BLOCKS = (
+    Sn8LightPathVirtualCircuitBlockInactive.name,
+    Sn8L2VpnVirtualCircuitBlockInactive.name,
+    Sn8L3VpnVirtualCircuitBlockInactive.name,
+)
+
+
+class ServiceDemand(NamedTuple):
+    subscription_id: UUID
+    description: str
+    service_speed: int
+    # Node subscriptions of the endpoints, once per node
+    nodes: tuple[UUID, ...]
+
+
+class Overload(NamedTuple):
+    corelink: Corelink
+    utilization_before: float
+    utilization: float
+    # Busiest direction, in Mbit/s
+    load: float
+
+
+class TrafficShift(NamedTuple):
+    maintenance: tuple[UUID, ...]
+    impact: MetricImpact
+    # Corelinks above the threshold with the maintenance corelinks out of service, busiest first
+    overloaded: list[Overload]
+    # Traffic between nodes that can no longer reach each other, in Mbit/s
+    unroutable: float
+
+
+class TrafficShiftSimulator:
+    """Route service traffic over the corelinks, and simulate putting corelinks in maintenance mode.
+
+    Args:
+        corelinks: The corelinks of the backbone.
+        services: The services whose traffic to route.
+        threshold: The utilization above which a corelink counts as overloaded.
+
+    """
+
+    def __init__(
+        self, corelinks: Iterable[Corelink], services: Iterable[ServiceDemand], threshold: float = 1.0
+    ) -> None:
+        corelinks = list(corelinks)
+        self.services = list(services)
+        self.threshold = threshold
+        nodes = sorted({node for link in corelinks for node in (link.node_a, link.node_b)}, key=str)
+        self.matrix = CorelinkMatrix(corelinks, demand_matrix(self.services, nodes))
+
+    def utilization(self) -> dict[UUID, float]:
+        """The current utilization per corelink subscription, with the corelinks in maintenance mode out of service."""
+        return self.matrix.utilization()
+
+    def simulate(self, corelink_subscription_ids: Collection[UUID]) -> TrafficShift:
+        """Take corelinks out of service and find the corelinks that would be overloaded."""
+        impact = self.matrix.simulate({subscription_id: None for subscription_id in corelink_subscription_ids})
+        before = self.matrix.utilization(impact.before)
+        after = self.matrix.utilization(impact.after)
+        busiest = impact.after.load.max(axis=1)
+        overloaded = [
+            Overload(
+                corelink=link,
+                utilization_before=before[link.subscription_id],
+                utilization=after[link.subscription_id],
+                load=float(busiest[index]),
+            )
+            for index, link in enumerate(self.matrix.corelinks)
+            if after[link.subscription_id] > self.threshold
+        ]
+        unroutable = self.matrix.demands[~np.isfinite(impact.after.distances)].sum()
+        unroutable -= self.matrix.demands[~np.isfinite(impact.before.distances)].sum()
+        return TrafficShift(
+            maintenance=tuple(corelink_subscription_ids),
+            impact=impact,
+            overloaded=sorted(overloaded, key=lambda overload: overload.utilization, reverse=True),
+            unroutable=float(unroutable),
+        )
+
+    @classmethod
+    def from_db(cls, threshold: float = 1.0) -> "TrafficShiftSimulator":
+        """Build the simulator from all corelinks that are not terminated and all active services."""
+        simulator = cls(load_corelinks(), load_service_demands(), threshold)
+        logger.debug(
+            "Built traffic shift simulator",
+            nodes=len(simulator.matrix.nodes),
+            corelinks=len(simulator.matrix),
+            services=len(simulator.services),
+        )
+        return simulator
+
+
+def demand_matrix(services: Iterable[ServiceDemand], nodes: list[UUID]) -> np.ndarray:
+    """The traffic between every pair of `nodes`: each endpoint sends its service speed, split over the others.
+
+    Endpoints on nodes without corelinks are left out.
+    """
+    index = {node: position for position, node in enumerate(nodes)}
+    sources, targets, traffic = [], [], []
+    for service in services:
+        endpoints = [index[node] for node in service.nodes if node in index]
+        if len(endpoints) < 2:
+            continue
+        share = service.service_speed / (len(endpoints) - 1)
+        for source in endpoints:
+            for target in endpoints:
+                if source != target:
+                    sources.append(source)
+                    targets.append(target)
+                    traffic.append(share)
+    demands = np.zeros((len(nodes), len(nodes)))
+    np.add.at(demands, (np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64)), traffic)
+    return demands
+
+
+def load_sap_nodes(sap_ids: Collection[UUID]) -> dict[UUID, UUID]:
+    """The node subscription of the port of each SAP; SAPs on aggregated ports take the node of the first member."""
+    nodes = sap_nodes(sap_ids)
+    node_owners = owners(set(nodes.values()))
+    return {sap_id: node_owners[node_id].subscription_id for sap_id, node_id in nodes.items() if node_id in node_owners}
+
+
+def load_protection_types(instance_ids: Collection[UUID]) -> dict[UUID, ProtectionType]:
+    """The protection type fixed input of the product of the subscription of each instance, for those that have one."""
+    if not instance_ids:
+        return {}
+    stmt = (
+        select(SubscriptionInstanceTable.subscription_instance_id, FixedInputTable.value)
+        .join(SubscriptionTable, SubscriptionTable.subscription_id == SubscriptionInstanceTable.subscription_id)
+        .join(FixedInputTable, FixedInputTable.product_id == SubscriptionTable.product_id)
+        .where(SubscriptionInstanceTable.subscription_instance_id.in_(set(instance_ids)))
+        .where(FixedInputTable.name == PROTECTION_TYPE_FIXED_INPUT)
+    )
+    return {instance_id: ProtectionType(value) for instance_id, value in db.session.execute(stmt)}
+
+
+def left_out_circuits(circuit_ids: Collection[UUID]) -> set[UUID]:
+    """The protection virtual circuits of Protected light paths and the internal L2VPNs of firewall endpoints."""
+    users = used_by(circuit_ids, ["vcs", "l2vpn_internal"])
+    internal = {circuit_id for circuit_id, attribute in users if attribute == "l2vpn_internal"}
+    settings_ids = {settings_id for (_, attribute), ids in users.items() if attribute == "vcs" for settings_id in ids}
+    protection_types = load_protection_types(settings_ids)
+    protected = [
+        settings_id for settings_id in settings_ids if protection_types.get(settings_id) == ProtectionType.PROTECTED
+    ]
+    protection = {circuit_id for ids in related(protected, ["vcs"]).values() for circuit_id in ids[1:]}
+    return internal | (protection & set(circuit_ids))
+
+
+def load_service_demands(subscription_ids: Iterable[UUID] | None = None) -> list[ServiceDemand]:
+    """Read the speed and endpoint nodes of all (or the given) active light path, L2VPN and L3VPN services.
+
+    Protection virtual circuits and the internal L2VPNs of firewalls are left out, see `left_out_circuits()`.
+    """
+    stmt = (
+        select(
+            SubscriptionTable.subscription_id,
+            SubscriptionTable.description,
+            SubscriptionInstanceTable.subscription_instance_id,
+        )
+        .join(SubscriptionInstanceTable, SubscriptionInstanceTable.subscription_id == SubscriptionTable.subscription_id)
+        .join(ProductBlockTable, ProductBlockTable.product_block_id == SubscriptionInstanceTable.product_block_id)
+        .where(ProductBlockTable.name.in_(VIRTUAL_CIRCUIT_BLOCKS))
+        .where(SubscriptionTable.status == SubscriptionLifecycle.ACTIVE.value)
+    )
+    if subscription_ids is not None:
+        stmt = stmt.where(SubscriptionTable.subscription_id.in_(set(subscription_ids)))
+    circuits = db.session.execute(stmt).all()
+    left_out = left_out_circuits([circuit.subscription_instance_id for circuit in circuits])
+    circuits = [circuit for circuit in circuits if circuit.subscription_instance_id not in left_out]
+
+    # Light paths and L3VPNs (SAP settings) list their SAPs, L2VPNs their ESIs: one level down to the SAPs
+    circuit_ids = [circuit.subscription_instance_id for circuit in circuits]
+    parts = related(circuit_ids, ["saps", "esis"])
+    part_ids = {part_id for part_ids in parts.values() for part_id in part_ids}
+    saps = related(part_ids, ["saps", "sap"])
+    values = instance_values(circuit_ids, ("service_speed",))
+
+    def circuit_saps(circuit_id: UUID) -> list[UUID]:
+        result = []
+        for attribute in ("saps", "esis"):
+            for part_id in parts.get((circuit_id, attribute), ()):
+                nested = [*saps.get((part_id, "saps"), ()), *saps.get((part_id, "sap"), ())]
+                # Light path SAPs have no SAPs of their own
+                result.extend(nested if nested or attribute == "esis" else [part_id])
+        return result
+
+    sap_ids = {circuit.subscription_instance_id: circuit_saps(circuit.subscription_instance_id) for circuit in circuits}
+    endpoint_nodes = load_sap_nodes({sap_id for ids in sap_ids.values() for sap_id in ids})
+
+    demands = []
+    for circuit in circuits:
+        speed = values.get(circuit.subscription_instance_id, {}).get("service_speed")
+        if speed is None:
+            continue
+        endpoints = sap_ids[circuit.subscription_instance_id]
+        nodes = dict.fromkeys(endpoint_nodes[sap_id] for sap_id in endpoints if sap_id in endpoint_nodes)
+        demands.append(
+            ServiceDemand(
+                subscription_id=circuit.subscription_id,
+                description=circuit.description,
+                service_speed=int(speed),
+                nodes=tuple(nodes),
+            )
+        )
+    return demands
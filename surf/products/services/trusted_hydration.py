@@ -0,0 +1,244 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load domain models from the database without validating the stored values again.
+
+The values of a subscription were validated when they were saved, but `from_subscription()` and `from_db()` validate
+them again on every load: each resource type value is a string that pydantic parses into an `Asn`, `MaxPrefix`,
+`VlanRanges`, enum, UUID or IP address, including the constraint checks. In trusted mode these loads construct the
+models without pydantic validation instead, converting each value with a function compiled once per field:
+
+- `int` and constrained ints (`Asn`, `MetricOut`, `MTU`, ...) with `int()`, without the bounds checks;
+- enums, UUIDs, IP addresses and `VlanRanges` with their constructor;
+- `bool` from `"True"` and `"False"`, as `save()` stores them;
+- product blocks as given: they were built by their own `from_db()`.
+
+Other fields (dates, for example) are validated by pydantic as before. A model whose values do not convert, or that
+misses a required value, is validated in full, so a bad row still raises `ValidationError`.
+
+Trusted mode is off unless it is switched on, once at startup::
+
+    trusted_hydration.install()  # reads TRUSTED_HYDRATION: "off" (default), "on" or "verify"
+
+"verify" builds every model both ways, logs the fields that differ, and uses the validated model; it is meant for
+trying out trusted mode on production data. Models built in any other way, such as from forms or in lifecycle
+transitions, are always validated.
+"""
+
+import os
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from ipaddress import IPv4Address, IPv4Interface, IPv4Network, IPv6Address, IPv6Interface, IPv6Network
+from typing import Any
+from uuid import UUID
+
+import structlog
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
+
+from orchestrator.domain.base import DomainModel, ProductBlockModel, SubscriptionModel
+from orchestrator.utils.vlans import VlanRanges
+
+logger = structlog.get_logger(__name__)
+
+MODES = ("off", "on", "verify")
+_CONSTRUCTED = (UUID, IPv4Address, IPv6Address, IPv4Interface, IPv6Interface, IPv4Network, IPv6Network, VlanRanges)
+_BOOLEANS = {"True": True, "False": False, "true": True, "false": False}
+
+_mode = "off"
+_hydrating: ContextVar[bool] = ContextVar("trusted_hydration", default=False)
+_originals: dict[tuple[type, str], Any] = {}
+# Per model class: (field name, alias, field, converter) for every field; converter None: validate with pydantic
+_compiled: dict[type, list[tuple[str, str, ModelField, Callable[[Any], Any] | None]]] = {}
+
+
+class Untrusted(Exception):
+    """The values can not be used without validation."""
+
+
+def _keep(value: Any) -> Any:
+    return value
+
+
+def _bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return _BOOLEANS[value]
+
+
+def _convert(tp: type, convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def converter(value: Any) -> Any:
+        return value if type(value) is tp else convert(value)
+
+    return converter
+
+
+def _element_converter(tp: Any) -> Callable[[Any], Any] | None:
+    if not isinstance(tp, type):
+        return None
+    if issubclass(tp, Enum):
+        return tp
+    if issubclass(tp, bool):
+        return _bool
+    if issubclass(tp, int):
+        return _convert(int, int)
+    if issubclass(tp, float):
+        return _convert(float, float)
+    if tp is str:
+        return _convert(str, str)
+    if issubclass(tp, _CONSTRUCTED):
+        return _convert(tp, tp)
+    return None
+
+
+def _field_converter(model: type[DomainModel], name: str, field: ModelField) -> Callable[[Any], Any] | None:
+    if name in model._product_block_fields_:
+        return _keep
+    element = _element_converter(field.type_)
+    if element is None:
+        return None
+    if field.shape == SHAPE_SINGLETON:
+        return element
+    if field.shape == SHAPE_LIST:
+        return lambda values: [element(value) for value in values]
+    return None
+
+
+def _fields(model: type[DomainModel]) -> list[tuple[str, str, ModelField, Callable[[Any], Any] | None]]:
+    if model not in _compiled:
+        _compiled[model] = [
+            (name, field.alias, field, _field_converter(model, name, field)) for name, field in model.__fields__.items()
+        ]
+    return _compiled[model]
+
+
+def trusted_values(model: type[DomainModel], data: dict[str, Any]) -> tuple[dict[str, Any], set[str]]:
+    """The field values and the set fields of a `model` built from `data`, without validation.
+
+    Raises:
+        Untrusted: A value does not convert, or a required value is missing.
+
+    """
+    values: dict[str, Any] = {}
+    fields_set = set()
+    for name, alias, field, converter in _fields(model):
+        if alias in data:
+            value = data[alias]
+            fields_set.add(name)
+            if value is None:
+                if not field.allow_none:
+                    raise Untrusted(f"{model.__name__}.{name} is None")
+            elif converter is not None:
+                try:
+                    value = converter(value)
+                except (KeyError, TypeError, ValueError) as exc:
+                    raise Untrusted(f"{model.__name__}.{name}: {exc}") from exc
+            else:
+                value, errors = field.validate(value, values, loc=alias, cls=model)  # type: ignore[arg-type]
+                if errors:
+                    raise Untrusted(f"{model.__name__}.{name} is not valid")
+        elif field.required:
+            raise Untrusted(f"{model.__name__}.{name} is missing")
+        else:
+            value = field.get_default()
+        values[name] = value
+    return values, fields_set
+
+
+def _differences(model: type[DomainModel], values: dict[str, Any], validated: dict[str, Any]) -> list[str]:
+    # Product blocks are passed on as given; comparing them would evaluate their serializable properties
+    return [
+        name
+        for name, value in validated.items()
+        if name not in model._product_block_fields_
+        and (name not in values or type(values[name]) is not type(value) or values[name] != value)
+    ]
+
+
+def _init(original: Callable[..., None]) -> Callable[..., None]:
+    def __init__(self: DomainModel, **data: Any) -> None:
+        if _mode == "off" or not _hydrating.get():
+            return original(self, **data)
+        try:
+            values, fields_set = trusted_values(type(self), data)
+        except Untrusted as exc:
+            logger.debug("Validating model", model=type(self).__name__, reason=str(exc))
+            return original(self, **data)
+        if _mode == "verify":
+            original(self, **data)
+            if differences := _differences(type(self), values, self.__dict__):
+                logger.warning("Trusted model differs from validated", model=type(self).__name__, fields=differences)
+            return
+        object.__setattr__(self, "__dict__", values)
+        object.__setattr__(self, "__fields_set__", fields_set)
+        self._init_private_attributes()
+
+    return __init__
+
+
+def _loader(load: Callable[..., Any]) -> Any:
+    def wrapper(cls: type, *args: Any, **kwargs: Any) -> Any:
+        with hydrating():
+            return load(cls, *args, **kwargs)
+
+    return classmethod(wrapper)
+
+
+@contextmanager
+def hydrating() -> Iterator[None]:
+    """Models built inside the block are built from database values (trusted, when trusted mode is on)."""
+    token = _hydrating.set(True)
+    try:
+        yield
+    finally:
+        _hydrating.reset(token)
+
+
+def install(mode: str | None = None) -> str:
+    """Switch trusted mode to `mode`, or to the `TRUSTED_HYDRATION` environment variable; returns the mode."""
+    global _mode
+    mode = mode or os.environ.get("TRUSTED_HYDRATION", "off")
+    if mode not in MODES:
+        raise ValueError(f"Trusted hydration mode must be one of {', '.join(MODES)}, not {mode!r}")
+    if mode != "off" and not _originals:
+        for cls, name in ((SubscriptionModel, "from_subscription"), (ProductBlockModel, "from_db")):
+            _originals[(cls, name)] = cls.__dict__[name]
+            setattr(cls, name, _loader(cls.__dict__[name].__func__))
+        _originals[(DomainModel, "__init__")] = DomainModel.__dict__.get("__init__")
+        DomainModel.__init__ = _init(DomainModel.__init__)  # type: ignore[assignment]
+    _mode = mode
+    logger.info("Trusted hydration", mode=mode)
+    return mode
+
+
+def uninstall() -> None:
+    """Switch trusted mode off and restore the orchestrator methods."""
+    global _mode
+    _mode = "off"
+    for (cls, name), original in _originals.items():
+        if original is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, original)
+    _originals.clear()
+
+
+@contextmanager
+def trusted_hydration(mode: str = "on") -> Iterator[None]:
+    """Trusted mode `mode` inside the block, for scripts and tests."""
+    install(mode)
+    try:
+        yield
+    finally:
+        uninstall()
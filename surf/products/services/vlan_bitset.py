@@ -0,0 +1,195 @@
+# Copyright 2019-2023 surf.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""VLAN sets as bitsets, for set algebra over many VLAN ranges.
+
+`VlanRanges` expands every range into its VLANs to normalize it, so a union or difference of the VLAN ranges of
+hundreds of SAPs on a port builds and sorts sets of thousands of ints, over and over. `VlanBitset` keeps the same set
+as a Python int with bit n set for VLAN n: union, intersection and difference are one integer operation, and the
+ranges are found with bit operations instead of per VLAN.
+
+Example::
+
+    used = VlanBitset.union_of(sap.vlanrange for sap in saps)
+    free = VlanBitset.range(2, 4094) - used
+    if not free.issuperset(requested):
+        ...
+    vlan = free.first_free_run(size=1)
+
+`VlanBitset` converts to and from `VlanRanges` and its string format ("4,10-14").
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from orchestrator.utils.vlans import VlanRanges
+
+# The range VlanRanges accepts
+VLAN_MIN = 0
+VLAN_MAX = 4096
+
+
+def _mask(start: int, end: int) -> int:
+    """Bits start up to and including end set."""
+    return ((1 << (end + 1)) - 1) ^ ((1 << start) - 1)
+
+
+def _check(start: int, end: int) -> None:
+    if not VLAN_MIN <= start <= VLAN_MAX or not VLAN_MIN <= end <= VLAN_MAX:
+        raise ValueError(f"{start}-{end} is out of range ({VLAN_MIN}-{VLAN_MAX}).")
+
+
+class VlanBitset:
+    """An immutable set of VLANs, stored as the bits of an int."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0) -> None:
+        self.bits = bits
+
+    @classmethod
+    def range(cls, start: int, end: int) -> VlanBitset:
+        """VLANs start up to and including end."""
+        return cls.from_ranges([(start, end)])
+
+    @classmethod
+    def from_ranges(cls, ranges: Iterable[Any]) -> VlanBitset:
+        """From (start, end) pairs, [start] or [start, end] sequences, or single VLANs, in any order, overlapping.
+
+        Like `VlanRanges`, a range with its start after its end is empty.
+        """
+        bits = 0
+        for item in ranges:
+            if isinstance(item, int):
+                start = end = item
+            elif len(item) == 1:
+                start = end = item[0]
+            elif len(item) == 2:
+                start, end = item
+            else:
+                raise ValueError(f"Expected 1 or 2 element list for range definition. Got {len(item)} element list.")
+            if start <= end:
+                _check(start, end)
+                bits |= _mask(start, end)
+        return cls(bits)
+
+    @classmethod
+    def parse(cls, value: str) -> VlanBitset:
+        """From the `VlanRanges` string format, like "4,10-14" (also with whitespace and overlapping ranges)."""
+        ranges = []
+        for part in value.split(","):
+            if part.strip():
+                try:
+                    ranges.append([int(vlan) for vlan in part.split("-")])
+                except ValueError as exc:
+                    raise ValueError(f"{value} could not be converted to a VlanBitset object.") from exc
+        return cls.from_ranges(ranges)
+
+    @classmethod
+    def of(cls, value: VlanBitset | VlanRanges | str | int | Iterable[Any] | None) -> VlanBitset:
+        """From anything `VlanRanges()` accepts, a `VlanRanges` or a `VlanBitset`."""
+        if value is None:
+            return cls()
+        if isinstance(value, VlanBitset):
+            return value
+        if isinstance(value, VlanRanges):
+            return cls.from_ranges(value.to_list_of_tuples())
+        if isinstance(value, str):
+            return cls.parse(value)
+        if isinstance(value, int):
+            return cls.from_ranges([value])
+        return cls.from_ranges(list(value))
+
+    @classmethod
+    def union_of(cls, values: Iterable[VlanBitset | VlanRanges | str | None]) -> VlanBitset:
+        """The union of many VLAN sets, such as the VLAN ranges of all SAPs on a port."""
+        bits = 0
+        for value in values:
+            bits |= cls.of(value).bits
+        return cls(bits)
+
+    def ranges(self) -> Iterator[tuple[int, int]]:
+        """The (start, end) pairs of consecutive VLANs, in order."""
+        bits = self.bits
+        while bits:
+            start = (bits & -bits).bit_length() - 1
+            shifted = bits >> start
+            # Length of the run of ones at the bottom of shifted
+            length = (shifted ^ (shifted + 1)).bit_length() - 1
+            yield start, start + length - 1
+            bits &= ~_mask(start, start + length - 1)
+
+    def to_vlan_ranges(self) -> VlanRanges:
+        return VlanRanges(list(self.ranges()))
+
+    def first_free_run(self, size: int = 1, within: VlanBitset | None = None) -> int | None:
+        """The first VLAN of the first run of `size` consecutive VLANs in this set (and in `within`), if any.
+
+        Call it on the free VLANs, for example `(VlanBitset.range(2, 4094) - used).first_free_run(4)`.
+        """
+        bits = self.bits if within is None else self.bits & within.bits
+        # Bit n stays set when VLANs n up to n + size - 1 are all in the set
+        run, width = bits, 1
+        while width < size and run:
+            step = min(width, size - width)
+            run &= run >> step
+            width += step
+        return (run & -run).bit_length() - 1 if run else None
+
+    def issubset(self, other: VlanBitset) -> bool:
+        return self.bits & ~other.bits == 0
+
+    def issuperset(self, other: VlanBitset) -> bool:
+        return other.bits & ~self.bits == 0
+
+    def isdisjoint(self, other: VlanBitset) -> bool:
+        return self.bits & other.bits == 0
+
+    def __or__(self, other: VlanBitset) -> VlanBitset:
+        return VlanBitset(self.bits | other.bits)
+
+    def __and__(self, other: VlanBitset) -> VlanBitset:
+        return VlanBitset(self.bits & other.bits)
+
+    def __sub__(self, other: VlanBitset) -> VlanBitset:
+        return VlanBitset(self.bits & ~other.bits)
+
+    def __xor__(self, other: VlanBitset) -> VlanBitset:
+        return VlanBitset(self.bits ^ other.bits)
+
+    def __contains__(self, vlan: object) -> bool:
+        return isinstance(vlan, int) and vlan >= 0 and bool(self.bits >> vlan & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in self.ranges():
+            yield from range(start, end + 1)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return bool(self.bits)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, VlanBitset) and self.bits == other.bits
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __str__(self) -> str:
+        return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in self.ranges())
+
+    def __repr__(self) -> str:
+        return f"VlanBitset({str(self)!r})"
@@ -0,0 +1,85 @@
+from uuid import uuid4
+
+import orchestrator.domain
+import pytest
+from orchestrator.db import (
+    FixedInputTable,
+    ProductBlockTable,
+    ProductTable,
+    SubscriptionInstanceTable,
+    SubscriptionTable,
+)
+from orchestrator.domain import SubscriptionModel
+from orchestrator.domain.base import ProductBlockModel
+
+from products import PRODUCT_TYPE_PATHS, LazySubscriptionModelRegistry
+
+PRODUCT_NAME = "IPv4 Prefix (LIR Allocation)"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = LazySubscriptionModelRegistry({}, PRODUCT_TYPE_PATHS)
+    monkeypatch.setattr(orchestrator.domain, "SUBSCRIPTION_MODEL_REGISTRY", registry)
+    return registry
+
+
+def _subscription():
+    subscription_id = uuid4()
+    product = ProductTable(
+        product_id=uuid4(),
+        name=PRODUCT_NAME,
+        description="IPv4 prefix",
+        product_type="IpPrefix",
+        tag="PREFIX",
+        status="active",
+        fixed_inputs=[FixedInputTable(name="address_family", value="IPv4")],
+    )
+    block = ProductBlockTable(
+        product_block_id=uuid4(), name="Ip Prefix", description="IP prefix", tag="PREFIX", status="active"
+    )
+    instance = SubscriptionInstanceTable(
+        subscription_instance_id=uuid4(), subscription_id=subscription_id, product_block=block, values=[]
+    )
+    return SubscriptionTable(
+        subscription_id=subscription_id,
+        description="IPv4 prefix",
+        status="initial",
+        insync=False,
+        version=1,
+        customer_id=str(uuid4()),
+        product=product,
+        instances=[instance],
+    )
+
+
+def test_lookup_imports_only_the_product_type(registry):
+    assert PRODUCT_NAME in registry
+    assert not registry.is_resolved(PRODUCT_NAME)
+
+    model = registry[PRODUCT_NAME]
+
+    assert model.__name__ == "IpPrefix"
+    assert registry.is_resolved(PRODUCT_NAME)
+    assert not registry.is_resolved("L3 VPN")
+    assert registry.get("no such product") is None
+
+
+def test_resolve_all_imports_every_product_type(registry):
+    registry.resolve_all()
+    assert all(registry.is_resolved(name) for name in PRODUCT_TYPE_PATHS)
+    assert set(registry) == set(PRODUCT_TYPE_PATHS)
+
+
+def test_from_subscription_resolves_lazily_registered_product(registry, monkeypatch):
+    subscription = _subscription()
+    # Reading the subscription and the product block ids needs a database
+    monkeypatch.setattr(SubscriptionModel, "_get_subscription", classmethod(lambda cls, subscription_id: subscription))
+    monkeypatch.setattr(ProductBlockModel, "_fix_pb_data", classmethod(lambda cls: None))
+
+    model = SubscriptionModel.from_subscription(subscription.subscription_id)
+
+    assert type(model).__name__ == "IpPrefixInactive"
+    assert type(model) is registry[PRODUCT_NAME].__base_type__
+    assert model.ip_prefix.subscription_instance_id == subscription.instances[0].subscription_instance_id
+    assert registry.is_resolved(PRODUCT_NAME)
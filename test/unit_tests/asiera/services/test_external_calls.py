@@ -0,0 +1,109 @@
+import re
+import sys
+import types
+
+import pytest
+
+from products.services.external_calls import REGISTRY, CallBudgetExceeded, InstrumentedClient, call_budget
+
+
+class Payload:
+    pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    module = types.ModuleType("fake_netbox")
+
+    def get_vlans(subscription_id):
+        return [subscription_id]
+
+    def get_broken():
+        raise ConnectionError("NetBox is down")
+
+    module.get_vlans = get_vlans
+    module.get_broken = get_broken
+    module.put_vlans = lambda vlans: vlans
+    module.get_payload = Payload
+    module.TIMEOUT = 5
+    monkeypatch.setitem(sys.modules, "fake_netbox", module)
+    REGISTRY.reset()
+    yield InstrumentedClient("netbox", "fake_netbox")
+    REGISTRY.reset()
+
+
+def lookup_twice(client):
+    client.get_vlans(1)
+    client.get_vlans(2)
+
+
+def test_call_budget(client):
+    with call_budget(2) as budget:
+        lookup_twice(client)
+    assert len(budget.calls) == 2
+
+    with pytest.raises(CallBudgetExceeded, match="3 external calls, the budget is 2"):
+        with call_budget(2):
+            lookup_twice(client)
+            client.get_vlans(3)
+
+
+def test_call_budget_raises_at_the_end_when_the_code_path_catches(client):
+    with pytest.raises(CallBudgetExceeded):
+        with call_budget(1):
+            try:
+                lookup_twice(client)
+            except CallBudgetExceeded:
+                pass
+
+
+def test_call_budget_per_system(client):
+    with call_budget(0, system="other"):
+        lookup_twice(client)
+
+
+def test_registry_counts_per_caller_and_errors(client):
+    lookup_twice(client)
+    client.get_vlans(3)
+    with pytest.raises(ConnectionError):
+        client.get_broken()
+
+    stats = REGISTRY.snapshot()
+    caller = f"{__name__}.lookup_twice"
+    assert stats[("netbox", "get_vlans", caller)].count == 2
+    assert stats[("netbox", "get_vlans", f"{__name__}.test_registry_counts_per_caller_and_errors")].count == 1
+    broken = stats[("netbox", "get_broken", f"{__name__}.test_registry_counts_per_caller_and_errors")]
+    assert (broken.count, broken.errors) == (1, 1)
+    assert sum(broken.buckets) == 1
+
+
+def test_render_prometheus_format(client):
+    lookup_twice(client)
+    with pytest.raises(ConnectionError):
+        client.get_broken()
+
+    text = REGISTRY.render()
+    lines = text.splitlines()
+    labels = f'system="netbox",function="get_vlans",caller="{__name__}.lookup_twice"'
+    broken = f'system="netbox",function="get_broken",caller="{__name__}.test_render_prometheus_format"'
+    assert text.endswith("\n")
+    assert "# TYPE external_calls_total counter" in lines
+    assert "# TYPE external_call_duration_seconds histogram" in lines
+    assert f"external_calls_total{{{labels}}} 2" in lines
+    assert f"external_call_errors_total{{{broken}}} 1" in lines
+    assert f'external_call_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"external_call_duration_seconds_count{{{labels}}} 2" in lines
+    for line in lines:
+        assert line.startswith("# ") or re.fullmatch(r"[a-z_]+\{[^}]*\} [0-9.e+-]+", line), line
+
+
+def test_other_attributes_pass_through(client):
+    assert client.put_vlans([1]) == [1]
+    assert client.TIMEOUT == 5
+    assert client.get_payload is Payload
+    assert client.get_vlans.__wrapped__.__name__ == "get_vlans"
+
+    with call_budget(0):
+        client.put_vlans([1])
+        Payload()
+    assert REGISTRY.snapshot() == {}
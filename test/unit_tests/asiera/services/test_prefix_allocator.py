@@ -0,0 +1,113 @@
+import random
+from ipaddress import ip_network
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from products.services import prefix_allocator
+from products.services.prefix_allocator import BEST_FIT, FIRST_FIT, AggregateTrie, PrefixAllocator
+
+
+def _networks(prefixes):
+    return [str(prefix) for prefix in prefixes]
+
+
+def test_first_fit_and_best_fit():
+    trie = AggregateTrie(1, ip_network("10.0.0.0/24"))
+    trie.reserve(ip_network("10.0.0.0/26"))
+    trie.reserve(ip_network("10.0.0.64/28"))
+
+    # Free: 10.0.0.80/28, 10.0.0.96/27, 10.0.0.128/25
+    assert str(trie.find(28, FIRST_FIT)) == "10.0.0.80/28"
+    assert str(trie.find(27, FIRST_FIT)) == "10.0.0.96/27"
+    assert str(trie.find(29, BEST_FIT)) == "10.0.0.80/29"
+    assert str(trie.find(26, BEST_FIT)) == "10.0.0.128/26"
+    assert trie.find(24) is None
+    with pytest.raises(ValueError, match="strategy"):
+        trie.find(28, "worst_fit")
+
+
+def test_reserve_rejects_overlaps_and_prefixes_outside_the_aggregate():
+    trie = AggregateTrie(1, ip_network("10.0.0.0/24"))
+    trie.reserve(ip_network("10.0.0.0/26"))
+    with pytest.raises(ValueError, match="overlaps"):
+        trie.reserve(ip_network("10.0.0.0/27"))
+    with pytest.raises(ValueError, match="overlaps"):
+        trie.reserve(ip_network("10.0.0.0/25"))
+    with pytest.raises(ValueError, match="not part of"):
+        trie.reserve(ip_network("10.0.1.0/26"))
+    assert trie.count == 1
+    assert _networks(trie.free_blocks()) == ["10.0.0.64/26", "10.0.0.128/25"]
+
+
+def test_release_merges_free_blocks():
+    trie = AggregateTrie(1, ip_network("2001:db8::/32"))
+    subscription_id = uuid4()
+    trie.reserve(ip_network("2001:db8::/48"), subscription_id)
+    trie.reserve(ip_network("2001:db8:1::/48"))
+
+    assert trie.release(ip_network("2001:db8::/48")).subscription_id == subscription_id
+    assert trie.release(ip_network("2001:db8::/48")) is None
+    trie.release(ip_network("2001:db8:1::/48"))
+
+    assert _networks(trie.free_blocks()) == ["2001:db8::/32"]
+    assert trie.fragmentation().fragmentation == 0.0
+
+
+def test_allocate_many_is_all_or_none():
+    allocator = PrefixAllocator({1: "10.0.0.0/24", 2: "10.1.0.0/30"})
+    with pytest.raises(ValueError, match="No free /30"):
+        allocator.allocate_many([(1, 25), (2, 31), (2, 30)])
+    assert allocator.fragmentation(1)[0].allocated == 0
+    assert allocator.fragmentation(2)[0].allocated == 0
+
+    assert _networks(allocator.allocate_many([(1, 25), (1, 25)])) == ["10.0.0.0/25", "10.0.0.128/25"]
+    with pytest.raises(ValueError, match="Unknown aggregate"):
+        allocator.allocate(3, 24)
+
+
+@pytest.mark.parametrize("strategy", [FIRST_FIT, BEST_FIT])
+def test_random_allocations_match_brute_force(strategy):
+    rnd = random.Random(strategy)
+    aggregate = ip_network("10.0.0.0/16")
+    trie = AggregateTrie(1, aggregate)
+    allocated = []
+    for _ in range(300):
+        if allocated and rnd.random() < 0.3:
+            trie.release(allocated.pop(rnd.randrange(len(allocated))))
+            continue
+        prefix = trie.find(rnd.randint(20, 28), strategy)
+        if prefix is not None:
+            trie.reserve(prefix)
+            allocated.append(prefix)
+
+        assert not any(a.overlaps(b) for i, a in enumerate(allocated) for b in allocated[i + 1 :])
+        free = list(trie.free_blocks())
+        assert sum(block.num_addresses for block in free) + sum(p.num_addresses for p in allocated) == 2**16
+        assert not any(block.overlaps(prefix) for block in free for prefix in allocated)
+        assert sorted(allocation.prefix for allocation in trie.allocations()) == sorted(allocated)
+    fragmentation = trie.fragmentation()
+    assert fragmentation.allocated == len(allocated)
+    assert fragmentation.largest_free == min(block.prefixlen for block in trie.free_blocks())
+
+
+def test_load_allocations_skips_invalid_rows(monkeypatch):
+    # (subscription_id, subscription_instance_id) of each IP prefix block
+    good, host_bits, bad = ((uuid4(), uuid4()) for _ in range(3))
+    rows = [
+        (*good, "aggregate_block", "1"),
+        (*good, "assigned_ip_prefix", "10.0.0.0/24"),
+        (*host_bits, "aggregate_block", "1"),
+        (*host_bits, "assigned_ip_prefix", "10.0.1.5/24"),
+        (*bad, "aggregate_block", "1"),
+        (*bad, "assigned_ip_prefix", "not a prefix"),
+    ]
+    monkeypatch.setattr(prefix_allocator, "db", SimpleNamespace(session=SimpleNamespace(execute=lambda stmt: rows)))
+
+    allocations = prefix_allocator.load_allocations()
+
+    assert [(allocation.subscription_id, str(allocation.prefix)) for allocation in allocations] == [
+        (good[0], "10.0.0.0/24"),
+        (host_bits[0], "10.0.1.0/24"),
+    ]
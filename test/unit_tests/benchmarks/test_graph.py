@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from benchmarks.graph import VLAN_MAX, VLAN_MIN, GraphSize, SubscriptionGraph
+
+
+class PortGraph(SubscriptionGraph):
+    tree = "test"
+
+    def build_nodes(self):
+        return iter(())
+
+    def build_ports(self):
+        return iter(())
+
+    def build_service(self, index):
+        return iter(())
+
+    def node_of(self, port):
+        return port.node
+
+
+def _port(node):
+    return SimpleNamespace(subscription_instance_id=uuid4(), node=node)
+
+
+def _fill(graph, port):
+    for _ in range(VLAN_MIN, VLAN_MAX + 1):
+        graph.vlans.allocate(port.subscription_instance_id)
+
+
+def test_graph_needs_builders():
+    with pytest.raises(TypeError):
+        SubscriptionGraph(GraphSize())
+
+
+def test_tagged_port_skips_ports_without_free_vlans():
+    graph = PortGraph(GraphSize(services=1))
+    full = [_port(node) for node in range(8)]
+    free = _port(8)
+    graph.shared_ports = [*full, free]
+    for port in full:
+        _fill(graph, port)
+
+    assert all(graph.tagged_port() is free for _ in range(20))
+
+
+def test_tagged_port_prefers_nodes_the_service_does_not_use():
+    graph = PortGraph(GraphSize(services=1))
+    graph.shared_ports = [_port(0), _port(1)]
+
+    nodes = {graph.node_of(graph.tagged_port()), graph.node_of(graph.tagged_port())}
+
+    assert nodes == {0, 1}
+
+
+def test_tagged_port_raises_when_all_vlans_are_taken():
+    graph = PortGraph(GraphSize(services=1))
+    port = _port(0)
+    graph.shared_ports = [port]
+    _fill(graph, port)
+
+    with pytest.raises(ValueError, match="No port with a free VLAN"):
+        graph.tagged_port()
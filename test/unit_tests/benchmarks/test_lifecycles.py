@@ -0,0 +1,42 @@
+import importlib
+
+import pytest
+from orchestrator.domain.base import DomainModel, ProductBlockModel
+from orchestrator.domain.lifecycle import lookup_specialized_type
+from orchestrator.types import SubscriptionLifecycle
+
+from benchmarks.lifecycles import LifecycleTable, _registered_lifecycles, _subclasses, verify
+from benchmarks.trees import TREES
+
+
+@pytest.fixture(scope="module")
+def table():
+    for module in TREES["esnetorch"].modules():
+        importlib.import_module(module)
+    return LifecycleTable.compile()
+
+
+def test_table_matches_lookup_specialized_type(table):
+    assert table.names() == sorted(ProductBlockModel.registry)
+    for name, block in ProductBlockModel.registry.items():
+        for lifecycle in SubscriptionLifecycle:
+            assert table.get(name, lifecycle) is lookup_specialized_type(block, lifecycle)
+
+
+def test_registered_lifecycles_match_lookup_specialized_type(table):
+    """The variants read from orchestrator's registration table are the ones it looks up, for every domain model."""
+    registered = _registered_lifecycles()
+    variants = {
+        (cls.__base_type__, lifecycle): cls for cls, lifecycles in registered.items() for lifecycle in lifecycles
+    }
+    base_types = {cls.__base_type__ for cls in _subclasses(DomainModel) if getattr(cls, "__base_type__", None)}
+    assert {cls.__base_type__ for cls in registered} <= base_types
+
+    for base_type in base_types:
+        for lifecycle in SubscriptionLifecycle:
+            expected = variants.get((base_type, lifecycle)) or variants.get((base_type, None)) or base_type
+            assert lookup_specialized_type(base_type, lifecycle) is expected, (base_type, lifecycle)
+
+
+def test_esnetorch_variants_are_consistent(table):
+    assert verify(table) == []
@@ -0,0 +1,19 @@
+import sys
+
+import pytest
+
+from benchmarks.run import probe
+from benchmarks.trees import SCENARIOS
+
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIOS))
+def test_throughput_scenario_produces_a_result(scenario):
+    # Each probe runs in a fresh interpreter, as in benchmarks.run; the trees need different orchestrator-core versions
+    result = probe(sys.executable, "throughput", scenario, "--min-time", "0", "--rounds", "1")
+
+    if result.get("error", "").startswith(("ImportError", "ModuleNotFoundError")):
+        pytest.skip(f"{SCENARIOS[scenario].tree} does not import with this orchestrator-core: {result['error']}")
+    assert "error" not in result, result["error"]
+    assert result["product_blocks"] > 0
+    assert result["json_bytes"] > 0
+    assert all(result[operation]["ops"] > 0 for operation in ("validate", "dump", "dump_json"))
@@ -0,0 +1,48 @@
+from uuid import uuid4
+
+from esnetorch.products.product_blocks.bfd import BFDTemplateInactive
+from esnetorch.products.product_blocks.nes import NodeEnrollmentBlockInactive
+from esnetorch.products.services.bfd_templates import BFDTemplateRegistry, BFDTemplateSpec
+
+
+def _template(template_name, interval, multiplier):
+    return BFDTemplateInactive.construct(
+        subscription_instance_id=uuid4(), template_name=template_name, interval=interval, multiplier=multiplier
+    )
+
+
+def test_intern_shares_equal_specs():
+    registry = BFDTemplateRegistry()
+    spec = registry.intern("bfd-50ms", 50, 3)
+    assert registry.intern("bfd-50ms", "50", "3") is spec
+    assert registry.get("bfd-50ms", 50, 3) is spec
+    assert registry.get("bfd-50ms", 50, 4) is None
+    assert len(registry) == 1
+
+
+def test_register_block_shares_specs_between_nodes():
+    registry = BFDTemplateRegistry()
+    first, second = uuid4(), uuid4()
+    for node_id in (first, second):
+        block = NodeEnrollmentBlockInactive.construct(
+            bfd_templates=[_template("bfd-50ms", 50, 3), _template("bfd-300ms", 300, 3), _template(None, None, None)]
+        )
+        registry.register_block(node_id, block)
+
+    assert registry.templates_of(first)[0] is registry.templates_of(second)[0]
+    assert len(registry.templates_of(first)) == 2
+    assert registry.nodes_using(BFDTemplateSpec("bfd-50ms", 50, 3)) == {first, second}
+
+
+def test_register_node_replaces_and_forget_node_removes():
+    registry = BFDTemplateRegistry()
+    node_id = uuid4()
+    fast, slow = BFDTemplateSpec("bfd", 50, 3), BFDTemplateSpec("bfd", 300, 3)
+    registry.register_node(node_id, [fast])
+    registry.register_node(node_id, [slow])
+    assert registry.nodes_using(fast) == frozenset()
+    assert registry.nodes_using_name("bfd") == {slow: frozenset({node_id})}
+
+    registry.forget_node(node_id)
+    assert registry.templates_of(node_id) == ()
+    assert registry.nodes_using_name("bfd") == {}
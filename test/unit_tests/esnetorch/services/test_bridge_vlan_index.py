@@ -0,0 +1,105 @@
+from uuid import uuid4
+
+import pytest
+
+from esnetorch.products.services import bridge_vlan_index
+from esnetorch.products.services.bridge_vlan_index import BridgeVlan, BridgeVlanIndex
+
+
+def _bridge(vlan, subscription_id=None, device="sw-1", switch_uplink_id=12):
+    return BridgeVlan(subscription_id or uuid4(), uuid4(), device, switch_uplink_id, vlan)
+
+
+def test_conflict_and_next_free():
+    index = BridgeVlanIndex()
+    bridge = _bridge(100)
+    index.add(bridge)
+    index.add(_bridge(1))
+
+    assert index.conflict("sw-1", 12, 100) == bridge.subscription_instance_id
+    assert index.conflict("sw-1", 12, 101) is None
+    assert index.conflict("sw-1", 13, 100) is None
+    assert index.next_free("sw-1", 12) == 2
+    assert index.next_free("sw-1", 12, 100, 101) == 101
+    assert index.next_free("sw-1", 12, 100, 100) is None
+
+    index.remove(bridge.subscription_instance_id)
+    assert index.is_free("sw-1", 12, 100)
+    assert len(index) == 1
+
+
+def test_add_rejects_taken_and_out_of_range_vlans():
+    index = BridgeVlanIndex()
+    index.add(_bridge(100))
+    with pytest.raises(ValueError, match="already used"):
+        index.add(_bridge(100))
+    with pytest.raises(ValueError, match="not in range"):
+        index.add(_bridge(4095))
+
+
+@pytest.mark.parametrize("vlan", [-1, 0, 4095])
+def test_lookups_reject_out_of_range_vlans(vlan):
+    index = BridgeVlanIndex()
+    with pytest.raises(ValueError, match="not in range"):
+        index.is_free("sw-1", 12, vlan)
+    with pytest.raises(ValueError, match="not in range"):
+        index.conflict("sw-1", 12, vlan)
+
+
+def test_next_free_rejects_empty_range():
+    index = BridgeVlanIndex()
+    with pytest.raises(ValueError, match="is empty"):
+        index.next_free("sw-1", 12, 10, 5)
+    assert index.next_free("sw-1", 12, 10, 10) == 10
+
+
+def test_allocate_takes_lowest_free_vlan_until_none_left():
+    index = BridgeVlanIndex()
+    for vlan in range(1, 4095):
+        if vlan != 7:
+            index.add(_bridge(vlan))
+
+    assert index.allocate(uuid4(), uuid4(), "sw-1", 12) == 7
+    with pytest.raises(ValueError, match="No free VLAN"):
+        index.allocate(uuid4(), uuid4(), "sw-1", 12)
+
+
+def test_refresh_subscription_replaces_entries(monkeypatch):
+    index = BridgeVlanIndex()
+    subscription_id = uuid4()
+    old = _bridge(100, subscription_id)
+    index.add(old)
+    # The same bridge service moved to the VLAN of another of its bridge services, which moved on
+    moved = old._replace(vlan=200)
+    new = _bridge(100, subscription_id)
+    monkeypatch.setattr(bridge_vlan_index, "load_bridge_vlans", lambda subscription_ids: [moved, new])
+
+    index.refresh_subscription(subscription_id)
+
+    assert index.conflict("sw-1", 12, 100) == new.subscription_instance_id
+    assert index.conflict("sw-1", 12, 200) == old.subscription_instance_id
+    assert len(index) == 2
+
+
+@pytest.mark.parametrize("conflicting", ["other subscription", "each other", "out of range"])
+def test_refresh_subscription_leaves_index_unchanged_on_error(monkeypatch, conflicting):
+    index = BridgeVlanIndex()
+    subscription_id = uuid4()
+    old = _bridge(100, subscription_id)
+    other = _bridge(300)
+    index.add(old)
+    index.add(other)
+    entries = {
+        "other subscription": [_bridge(200, subscription_id), _bridge(300, subscription_id)],
+        "each other": [_bridge(200, subscription_id), _bridge(200, subscription_id)],
+        "out of range": [_bridge(200, subscription_id), _bridge(-1, subscription_id)],
+    }[conflicting]
+    monkeypatch.setattr(bridge_vlan_index, "load_bridge_vlans", lambda subscription_ids: entries)
+
+    with pytest.raises(ValueError):
+        index.refresh_subscription(subscription_id)
+
+    assert index.conflict("sw-1", 12, 100) == old.subscription_instance_id
+    assert index.conflict("sw-1", 12, 300) == other.subscription_instance_id
+    assert index.is_free("sw-1", 12, 200)
+    assert len(index) == 2
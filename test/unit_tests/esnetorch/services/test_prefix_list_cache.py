@@ -0,0 +1,148 @@
+from uuid import uuid4
+
+import pytest
+
+from esnetorch.products.product_blocks.prefix_list import PrefixListBlockInactive
+from esnetorch.products.services.prefix_list_cache import (
+    ExpandedPrefixList,
+    LocalPrefixManager,
+    PrefixListCache,
+    merge_ranges,
+    subtract_ranges,
+    to_ranges,
+)
+
+
+@pytest.fixture
+def prefix_manager():
+    return LocalPrefixManager()
+
+
+@pytest.fixture
+def cache(prefix_manager):
+    return PrefixListCache(prefix_manager)
+
+
+@pytest.mark.parametrize(
+    "ranges,expected",
+    [
+        ([], ()),
+        ([(5, 9), (1, 3)], ((1, 3), (5, 9))),
+        ([(1, 3), (4, 9)], ((1, 9),)),
+        ([(1, 10), (2, 3), (8, 12)], ((1, 12),)),
+        ([(1, 1), (1, 1)], ((1, 1),)),
+    ],
+)
+def test_merge_ranges(ranges, expected):
+    assert merge_ranges(ranges) == expected
+
+
+@pytest.mark.parametrize(
+    "ranges,other,expected",
+    [
+        (((1, 10),), (), ((1, 10),)),
+        (((1, 10),), ((1, 10),), ()),
+        (((1, 10),), ((3, 4), (7, 7)), ((1, 2), (5, 6), (8, 10))),
+        (((1, 5), (10, 15)), ((4, 11),), ((1, 3), (12, 15))),
+        (((5, 6),), ((0, 1), (20, 30)), ((5, 6),)),
+        (((1, 3), (5, 7)), ((0, 100),), ()),
+    ],
+)
+def test_subtract_ranges(ranges, other, expected):
+    assert subtract_ranges(ranges, other) == expected
+
+
+def test_to_ranges_merges_per_family():
+    ipv4, ipv6 = to_ranges(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.5/32", "2001:db8::/127", "10.0.1.1/24"])
+    assert ipv4 == ((0x0A000000, 0x0A0001FF),)
+    assert ipv6 == ((0x20010DB8 << 96, (0x20010DB8 << 96) + 1),)
+
+
+def test_expanded_prefix_list_is_content_addressed():
+    first = ExpandedPrefixList.from_ranges(*to_ranges(["10.0.0.0/25", "10.0.0.128/25"]))
+    second = ExpandedPrefixList.from_ranges(*to_ranges(["10.0.0.0/24"]))
+    assert first.digest == second.digest
+    assert first.prefixes == ["10.0.0.0/24"]
+
+
+def test_diff():
+    old = ExpandedPrefixList.from_ranges(*to_ranges(["10.0.0.0/24", "2001:db8::/64"]))
+    new = ExpandedPrefixList.from_ranges(*to_ranges(["10.0.0.0/25", "10.0.2.0/24", "2001:db8::/64"]))
+    diff = old.diff(new)
+    assert diff.added == ["10.0.2.0/24"]
+    assert diff.removed == ["10.0.0.128/25"]
+    assert not old.diff(old)
+
+
+def test_get_fetches_once(cache, prefix_manager):
+    prefix_manager.publish("list-a", ["192.0.2.0/24"])
+    entry = cache.get("list-a")
+    assert cache.get("list-a") is entry
+    assert prefix_manager.fetch_count == 1
+    assert entry.expanded.prefixes == ["192.0.2.0/24"]
+
+
+def test_refresh_revalidates_with_etag(cache, prefix_manager):
+    etag = prefix_manager.publish("list-a", ["192.0.2.0/24"])
+    entry = cache.get("list-a")
+    assert entry.etag == etag
+
+    same, diff = cache.refresh("list-a")
+    assert same is entry
+    assert not diff
+    assert prefix_manager.fetch_count == 2
+
+    prefix_manager.publish("list-a", ["192.0.2.0/25", "198.51.100.0/24"])
+    changed, diff = cache.refresh("list-a")
+    assert changed.etag != etag
+    assert diff.added == ["198.51.100.0/24"]
+    assert diff.removed == ["192.0.2.128/25"]
+
+
+def test_refresh_of_uncached_list_reports_everything_added(cache, prefix_manager):
+    prefix_manager.publish("list-a", ["192.0.2.0/24"])
+    _, diff = cache.refresh("list-a")
+    assert diff.added == ["192.0.2.0/24"]
+    assert diff.removed == []
+
+
+def test_same_content_is_shared(cache, prefix_manager):
+    prefix_manager.publish("list-a", ["192.0.2.0/25", "192.0.2.128/25"])
+    prefix_manager.publish("list-b", ["192.0.2.0/24"])
+    assert cache.get("list-a").expanded is cache.get("list-b").expanded
+    assert len(cache) == 2
+    assert cache.unique_contents == 1
+
+
+def test_contents_are_released(cache, prefix_manager):
+    prefix_manager.publish("list-a", ["192.0.2.0/24"])
+    prefix_manager.publish("list-b", ["192.0.2.0/24"])
+    cache.get("list-a")
+    cache.get("list-b")
+
+    cache.invalidate("list-a")
+    assert cache.unique_contents == 1
+    prefix_manager.publish("list-b", ["198.51.100.0/24"])
+    cache.refresh("list-b")
+    assert cache.unique_contents == 1
+    cache.invalidate("list-b")
+    assert cache.unique_contents == 0
+    assert len(cache) == 0
+
+
+def test_for_block(cache, prefix_manager):
+    prefix_manager.publish("list-a", ["192.0.2.0/24"])
+    nodes = [uuid4(), uuid4()]
+    block = PrefixListBlockInactive.construct(prefix_manager_id="list-a", node_enrollment_subscription_id=nodes)
+    per_node = cache.for_block(block)
+    assert list(per_node) == nodes
+    assert per_node[nodes[0]] is per_node[nodes[1]]
+    assert prefix_manager.fetch_count == 1
+
+
+def test_for_block_without_prefix_manager_id(cache):
+    block = PrefixListBlockInactive.construct(
+        subscription_instance_id=uuid4(), prefix_manager_id=None, node_enrollment_subscription_id=[]
+    )
+    with pytest.raises(ValueError, match="no prefix_manager_id"):
+        cache.for_block(block)
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from surf.products.product_blocks.sn8_aggsp import Sn8AggregatedServicePortBlockProvisioning
+from surf.products.services import aggregated_ports
+from surf.products.services.aggregated_ports import load_member_port_speeds, preload_member_ports
+
+SERVICE_PORTS = {uuid4(): speed for speed in (10000, 10000, 100000, 400000)}
+IRB_PORTS = {uuid4(): 1000}
+PORT_SPEEDS = SERVICE_PORTS | IRB_PORTS
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """The subscription ids of every port speed query; IRB ports have no port speed fixed input."""
+    requested = []
+
+    def execute(stmt):
+        subscription_ids = next(value for value in stmt.compile().params.values() if isinstance(value, list))
+        requested.append(set(subscription_ids))
+        return [
+            (subscription_id, str(SERVICE_PORTS[subscription_id]))
+            for subscription_id in subscription_ids
+            if subscription_id in SERVICE_PORTS
+        ]
+
+    monkeypatch.setattr(aggregated_ports, "db", SimpleNamespace(session=SimpleNamespace(execute=execute)))
+    return requested
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """The subscription ids loaded with `Sn8ServicePort.from_subscription()`."""
+    calls = []
+
+    def from_subscription(cls, subscription_id):
+        calls.append(subscription_id)
+        return SimpleNamespace(get_port_speed=lambda: PORT_SPEEDS[subscription_id])
+
+    monkeypatch.setattr(aggregated_ports.Sn8ServicePort, "from_subscription", classmethod(from_subscription))
+    return calls
+
+
+def _block(*subscription_ids):
+    ports = [SimpleNamespace(owner_subscription_id=subscription_id) for subscription_id in subscription_ids]
+    return Sn8AggregatedServicePortBlockProvisioning.construct(port=ports)
+
+
+def test_load_member_port_speeds_falls_back_for_irb_ports(queries, loaded):
+    assert load_member_port_speeds(list(PORT_SPEEDS)) == PORT_SPEEDS
+    assert queries == [set(PORT_SPEEDS)]
+    assert loaded == list(IRB_PORTS)
+    assert load_member_port_speeds([]) == {}
+    assert len(queries) == 1
+
+
+def test_get_port_speed_equals_the_sum_over_member_subscriptions(queries, loaded):
+    block = _block(*PORT_SPEEDS)
+    old = sum(aggregated_ports.Sn8ServicePort.from_subscription(member).get_port_speed() for member in PORT_SPEEDS)
+    loaded.clear()
+
+    assert block.get_port_speed() == old
+    assert block.get_member_port_speeds() == list(PORT_SPEEDS.values())
+    # The second call is served from the cache on the block
+    assert queries == [set(PORT_SPEEDS)]
+    assert loaded == list(IRB_PORTS)
+
+
+def test_preload_member_ports_queries_once_for_all_blocks(queries, loaded):
+    service_ports = list(SERVICE_PORTS)
+    cached = _block(service_ports[0], service_ports[1])
+    cached._member_port_speeds[service_ports[0]] = 25000
+    blocks = [cached, _block(service_ports[2], service_ports[3]), _block(service_ports[3])]
+
+    preload_member_ports(blocks)
+
+    assert queries == [set(service_ports[1:])]
+    assert loaded == []
+    # A cached speed is kept
+    assert [block.get_member_port_speeds() for block in blocks] == [
+        [25000, 10000],
+        [100000, 400000],
+        [400000],
+    ]
+    assert len(queries) == 1
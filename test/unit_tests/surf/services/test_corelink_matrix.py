@@ -0,0 +1,174 @@
+import math
+import random
+from uuid import UUID
+
+import numpy as np
+import pytest
+
+from surf.products.services.corelink_matrix import Corelink, CorelinkMatrix
+
+NODES = [UUID(int=index) for index in range(1, 9)]
+A, B, C, D = NODES[:4]
+
+
+def _corelink(number, node_a, node_b, isis_metric=10, maintenance_mode=False, port_pairs=1):
+    return Corelink(
+        subscription_id=UUID(int=1000 + number),
+        description=f"corelink {number}",
+        status="active",
+        node_a=node_a,
+        node_b=node_b,
+        isis_metric=isis_metric,
+        maintenance_mode=maintenance_mode,
+        port_pairs=port_pairs,
+        port_speed=100000,
+    )
+
+
+def _square(**kwargs):
+    # A - B - C - D - A, all metric 10
+    return [_corelink(number, NODES[number], NODES[(number + 1) % 4], **kwargs) for number in range(4)]
+
+
+def _load(matrix, link, routing=None):
+    routing = matrix.routing if routing is None else routing
+    return routing.load[matrix.link_index[link.subscription_id]].tolist()
+
+
+def test_equal_cost_paths_split_the_traffic():
+    links = _square()
+    demands = np.zeros((4, 4))
+    demands[0, 2] = 8  # A to C, over B and over D
+    matrix = CorelinkMatrix(links, demands)
+    a, c = matrix.node_index[A], matrix.node_index[C]
+
+    assert matrix.routing.distances[a, c] == 20
+    assert matrix.routing.path_counts[a, c] == 2
+    assert _load(matrix, links[0]) == [4, 0]  # A -> B
+    assert _load(matrix, links[1]) == [4, 0]  # B -> C
+    assert _load(matrix, links[2]) == [0, 4]  # C <- D
+    assert _load(matrix, links[3]) == [0, 4]  # D <- A
+
+
+def test_parallel_corelinks_are_separate_paths():
+    links = [_corelink(0, A, B), _corelink(1, A, B, port_pairs=2), _corelink(2, A, B, isis_metric=20)]
+    matrix = CorelinkMatrix(links)
+    a, b = matrix.node_index[A], matrix.node_index[B]
+
+    assert matrix.routing.path_counts[a, b] == 2
+    assert matrix.metric_matrix()[a, b] == 10
+    assert matrix.capacity_matrix()[a, b] == 400000
+    assert _load(matrix, links[0]) == [0.5, 0.5]
+    assert _load(matrix, links[1]) == [0.5, 0.5]
+    assert _load(matrix, links[2]) == [0, 0]
+    assert matrix.utilization()[links[1].subscription_id] == 0.5 / 200000
+
+
+def test_maintenance_mode_and_simulate():
+    links = _square()
+    links[1] = links[1]._replace(maintenance_mode=True)
+    matrix = CorelinkMatrix(links)
+    a, c = matrix.node_index[A], matrix.node_index[C]
+
+    assert matrix.routing.path_counts[a, c] == 1
+    assert _load(matrix, links[1]) == [0, 0]
+    assert matrix.path(A, C) == [A, D, C]
+
+    # Back in service with a higher metric than the path around: no change in routing
+    impact = matrix.simulate_metric(links[1].subscription_id, 40)
+    assert impact.changed_pairs == []
+    assert impact.shifted == {}
+
+    # Back in service with the same metric: A to C gets a second path
+    impact = matrix.simulate_metric(links[1].subscription_id, 10)
+    assert (A, C) in impact.changed_pairs and (C, A) in impact.changed_pairs
+    assert impact.after.path_counts[a, c] == 2
+    assert impact.shifted[links[1].subscription_id] > 0
+    assert impact.disconnected_pairs == []
+
+    # With B - C in maintenance, taking C - D out cuts off C
+    impact = matrix.simulate({links[2].subscription_id: None})
+    assert set(impact.disconnected_pairs) == {(C, node) for node in (A, B, D)} | {(node, C) for node in (A, B, D)}
+    assert matrix.path(C, A, impact.after) is None
+    # The routing of the matrix itself does not change
+    assert matrix.path(C, A) == [C, D, A]
+
+
+def test_metrics_reject_invalid_changes():
+    matrix = CorelinkMatrix(_square())
+    with pytest.raises(ValueError, match="start at 1"):
+        matrix.simulate_metric(_square()[0].subscription_id, 0)
+    with pytest.raises(ValueError, match="Expected demands of shape"):
+        CorelinkMatrix(_square(), np.zeros((3, 3)))
+
+
+def _random_corelinks(rnd, nodes, count):
+    links = []
+    for index in range(1, len(nodes)):
+        links.append((nodes[index], nodes[rnd.randrange(index)]))
+    while len(links) < count:
+        links.append(tuple(rnd.sample(nodes, 2)))
+    return [
+        _corelink(number, node_a, node_b, isis_metric=rnd.choice([10, 10, 20, 30]), maintenance_mode=rnd.random() < 0.1)
+        for number, (node_a, node_b) in enumerate(links)
+    ]
+
+
+def _brute_force(matrix, metrics):
+    """Distances and path counts by enumerating simple paths, and the load by splitting hop by hop."""
+    n = len(matrix.nodes)
+    arcs = []
+    for index in range(len(matrix)):
+        if math.isfinite(metrics[index]):
+            node_a, node_b = int(matrix._a[index]), int(matrix._b[index])
+            arcs += [(node_a, node_b, metrics[index], index, 0), (node_b, node_a, metrics[index], index, 1)]
+    distances = np.full((n, n), np.inf)
+    path_counts = np.zeros((n, n))
+
+    def walk(source, node, cost, visited):
+        if cost < distances[source, node]:
+            distances[source, node], path_counts[source, node] = cost, 0
+        if cost == distances[source, node]:
+            path_counts[source, node] += 1
+        for near, far, metric, _, _ in arcs:
+            if near == node and far not in visited:
+                walk(source, far, cost + metric, visited | {far})
+
+    for source in range(n):
+        walk(source, source, 0, {source})
+
+    load = np.zeros((len(matrix), 2))
+
+    def send(node, target, traffic):
+        if node == target:
+            return
+        next_hops = [
+            (far, index, direction)
+            for near, far, metric, index, direction in arcs
+            if near == node and distances[node, target] == metric + distances[far, target]
+        ]
+        for far, index, direction in next_hops:
+            load[index, direction] += traffic / len(next_hops)
+            send(far, target, traffic / len(next_hops))
+
+    for source in range(n):
+        for target in range(n):
+            if math.isfinite(distances[source, target]):
+                send(source, target, matrix.demands[source, target])
+    return distances, path_counts, load
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_routing_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    links = _random_corelinks(rnd, NODES[:6], 10)
+    demands = np.array([[0 if a == b else rnd.randint(1, 10) for b in range(6)] for a in range(6)], dtype=float)
+    matrix = CorelinkMatrix(links, demands)
+
+    changed = matrix.metrics({links[0].subscription_id: 5, links[3].subscription_id: None})
+    for metrics in (matrix.routing.metrics, changed):
+        routing = matrix.route(metrics)
+        distances, path_counts, load = _brute_force(matrix, metrics)
+        assert np.array_equal(routing.distances, distances)
+        assert np.array_equal(routing.path_counts, path_counts)
+        assert np.allclose(routing.load, load)
@@ -0,0 +1,74 @@
+from collections import defaultdict
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from surf.products.product_blocks.resource_type_types import SpecificTemplateType, URPFType
+from surf.products.services import l3vpn_sap_view
+from surf.products.services.l3vpn_sap_view import iter_l3vpn_sap_rows
+
+SUBSCRIPTION, CIRCUIT = uuid4(), uuid4()
+SETTINGS = [uuid4(), uuid4(), uuid4()]
+SAP, NODE = uuid4(), uuid4()
+
+RELATIONS = {(CIRCUIT, "saps"): SETTINGS, (SETTINGS[0], "sap"): [SAP], (SETTINGS[1], "sap"): [SAP]}
+VALUES = {
+    CIRCUIT: {"specific_template": "lhcone"},
+    # Everything set
+    SETTINGS[0]: {"asn": "64512", "urpf": "strict", "bfd": "True", "enable_routing": "False"},
+    # Nothing set: the defaults
+    SETTINGS[1]: {},
+    # SETTINGS[2] has no SAP
+    SAP: {"vlanrange": "12,10-11"},
+    NODE: {"nso_device_id": "rt1.ams"},
+}
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    """The statements executed, with the projection helpers stubbed."""
+    executed = []
+
+    def execute(stmt):
+        executed.append(stmt)
+        return SimpleNamespace(partitions=lambda: iter([[(SUBSCRIPTION, "L3VPN LHCONE", CIRCUIT)]]))
+
+    def related(instance_ids, attributes):
+        return defaultdict(list, {key: ids for key, ids in RELATIONS.items() if key[0] in instance_ids})
+
+    def instance_values(instance_ids, resource_types):
+        return defaultdict(dict, {key: VALUES[key] for key in instance_ids if key in VALUES})
+
+    monkeypatch.setattr(l3vpn_sap_view, "db", SimpleNamespace(session=SimpleNamespace(execute=execute)))
+    monkeypatch.setattr(l3vpn_sap_view, "related", related)
+    monkeypatch.setattr(l3vpn_sap_view, "instance_values", instance_values)
+    monkeypatch.setattr(l3vpn_sap_view, "sap_nodes", lambda sap_ids: {sap_id: NODE for sap_id in sap_ids})
+    return executed
+
+
+def test_rows(statements):
+    full, defaults, without_sap = iter_l3vpn_sap_rows()
+
+    assert {row.subscription_id for row in (full, defaults, without_sap)} == {SUBSCRIPTION}
+    assert [row.subscription_instance_id for row in (full, defaults, without_sap)] == SETTINGS
+    assert full.specific_template == SpecificTemplateType.LHCONE
+    assert (full.nso_device_id, full.vlanrange, full.asn) == ("rt1.ams", "10-12", 64512)
+    assert (full.urpf, full.bfd, full.enable_routing) == (URPFType.strict, True, False)
+
+    assert (defaults.nso_device_id, defaults.vlanrange) == ("rt1.ams", "10-12")
+    assert (defaults.asn, defaults.bfd) == (None, None)
+    assert defaults.urpf == URPFType.disabled
+    assert defaults.enable_routing is True
+
+    assert (without_sap.nso_device_id, without_sap.vlanrange) == (None, None)
+    assert without_sap.urpf == URPFType.disabled
+
+
+def test_specific_template_filter(statements):
+    list(iter_l3vpn_sap_rows())
+    list(iter_l3vpn_sap_rows(specific_template=SpecificTemplateType.LHCOPN))
+
+    unfiltered, filtered = (stmt.compile().params for stmt in statements)
+    assert "specific_template" not in unfiltered.values()
+    assert {"specific_template", "lhcopn"} <= set(filtered.values())
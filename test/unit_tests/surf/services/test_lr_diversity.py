@@ -0,0 +1,126 @@
+from collections import defaultdict
+from uuid import uuid4
+
+import pytest
+
+from surf.products.product_types.fixed_input_types import ProtectionType
+from surf.products.services import lr_diversity
+from surf.products.services.lr_diversity import DiversityIndex, DiversityReport, load_sap_elements
+from surf.products.services.projection import Owner
+
+
+def _report(ports, nodes, protection_type=ProtectionType.PROTECTED, subscription_id=None):
+    return DiversityReport(
+        subscription_id=subscription_id or uuid4(),
+        description="LR",
+        protection_type=protection_type,
+        ports=tuple(frozenset(side) for side in ports),
+        nodes=tuple(frozenset(side) for side in nodes),
+    )
+
+
+def test_load_sap_elements_follows_carrier_and_aggregated_ports(monkeypatch):
+    carrier_sap, aggregated_sap, plain_sap, no_port_sap = uuid4(), uuid4(), uuid4(), uuid4()
+    msc, carrier, aggregated, members, plain = uuid4(), uuid4(), uuid4(), [uuid4(), uuid4()], uuid4()
+    nodes = [uuid4(), uuid4()]
+    relations = {
+        (carrier_sap, "port"): [msc],
+        (msc, "port"): [carrier],
+        (carrier, "node"): [nodes[0]],
+        (aggregated_sap, "port"): [aggregated],
+        (aggregated, "port"): members,
+        (members[0], "node"): [nodes[1]],
+        (members[1], "node"): [nodes[1]],
+        (plain_sap, "port"): [plain],
+        (plain, "node"): [nodes[0]],
+    }
+    # Every instance belongs to a subscription of its own
+    subscription_of = {instance_id: uuid4() for instance_id in (msc, carrier, aggregated, *members, plain, *nodes)}
+
+    def related(instance_ids, attributes):
+        return defaultdict(
+            list, {key: ids for key, ids in relations.items() if key[0] in instance_ids and key[1] in attributes}
+        )
+
+    def owners(instance_ids):
+        return {instance_id: Owner(subscription_of[instance_id], "", "active") for instance_id in instance_ids}
+
+    monkeypatch.setattr(lr_diversity, "related", related)
+    monkeypatch.setattr(lr_diversity, "owners", owners)
+
+    elements = load_sap_elements([carrier_sap, aggregated_sap, plain_sap, no_port_sap])
+
+    def subscriptions(*instance_ids):
+        return frozenset(subscription_of[instance_id] for instance_id in instance_ids)
+
+    assert elements[carrier_sap].ports == subscriptions(msc, carrier)
+    assert elements[carrier_sap].nodes == subscriptions(nodes[0])
+    assert elements[aggregated_sap].ports == subscriptions(aggregated, *members)
+    assert elements[aggregated_sap].nodes == subscriptions(nodes[1])
+    assert elements[plain_sap].ports == subscriptions(plain)
+    assert elements[plain_sap].nodes == subscriptions(nodes[0])
+    assert elements[no_port_sap].ports == elements[no_port_sap].nodes == frozenset()
+
+
+@pytest.mark.parametrize(
+    "protection_type, shared_port, shared_node, diverse",
+    [
+        (ProtectionType.PROTECTED, False, False, True),
+        (ProtectionType.PROTECTED, False, True, True),
+        (ProtectionType.PROTECTED, True, True, False),
+        (ProtectionType.REDUNDANT, False, False, True),
+        (ProtectionType.REDUNDANT, False, True, False),
+        (ProtectionType.REDUNDANT, True, True, False),
+    ],
+)
+def test_diverse(protection_type, shared_port, shared_node, diverse):
+    port, node = uuid4(), uuid4()
+    ports = ({uuid4(), port}, {uuid4(), port} if shared_port else {uuid4()})
+    nodes = ({uuid4(), node}, {node} if shared_node else {uuid4()})
+
+    report = _report(ports, nodes, protection_type)
+
+    assert report.diverse is diverse
+    assert report.complete
+    assert report.shared_ports == ({port} if shared_port else set())
+
+
+def test_incomplete_reports_are_violations():
+    index = DiversityIndex()
+    complete = _report(({uuid4()}, {uuid4()}), ({uuid4()}, {uuid4()}))
+    incomplete = _report(({uuid4()}, set()), ({uuid4()}, set()))
+    index.add(complete)
+    index.add(incomplete)
+
+    assert not incomplete.complete
+    assert index.violations() == [incomplete]
+
+
+def test_refresh_subscription_reloads_the_lrs_of_a_changed_port_or_node(monkeypatch):
+    port, node, other_node = uuid4(), uuid4(), uuid4()
+    lrs = [
+        _report(({port}, {uuid4()}), ({node}, {other_node})),
+        # Redundant, and both virtual circuits on the node
+        _report(({uuid4()}, {uuid4()}), ({node, other_node}, {node}), ProtectionType.REDUNDANT),
+        _report(({uuid4()}, {uuid4()}), ({uuid4()}, {other_node})),
+    ]
+    index = DiversityIndex()
+    for report in lrs:
+        index.add(report)
+    # The first LR moved to another port on a node shared by both virtual circuits
+    moved = lrs[0]._replace(ports=(frozenset({uuid4()}), lrs[0].ports[1]), nodes=(frozenset({node}), frozenset({node})))
+    requested = []
+
+    def load(subscription_ids):
+        requested.append(set(subscription_ids))
+        return [moved, lrs[1]]
+
+    monkeypatch.setattr(lr_diversity, "load_diversity_reports", load)
+
+    assert index.refresh_subscription(node) == [moved, lrs[1]]
+    assert requested == [{node, lrs[0].subscription_id, lrs[1].subscription_id}]
+    assert index.get(lrs[0].subscription_id) == moved
+    assert index.using(port) == []
+    assert sorted(index.using(node)) == sorted([lrs[0].subscription_id, lrs[1].subscription_id])
+    assert len(index.using(other_node)) == 2
+    assert index.violations() == [lrs[1]]
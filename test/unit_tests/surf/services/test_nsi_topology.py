@@ -0,0 +1,118 @@
+import json
+from collections import defaultdict
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from surf.products.services import nsi_topology
+from surf.products.services.nsi_topology import NsiTopology, StpEntry, load_stp_entries
+from surf.products.services.projection import Owner
+
+
+def _entry(stp_id="urn:ogf:network:surf.nl:2020:production:stp-1", topology="surf.nl:2020:production", **kwargs):
+    values = {
+        "subscription_id": uuid4(),
+        "tag": "NSISTP",
+        "topology": topology,
+        "stp_id": stp_id,
+        "stp_description": None,
+        "is_alias_in": None,
+        "is_alias_out": None,
+        "bandwidth": 1000,
+        "vlanrange": "100-110",
+        "sap_description": "SAP",
+    }
+    return StpEntry(**(values | kwargs))
+
+
+def test_document_is_rendered_again_only_after_a_change():
+    topology = NsiTopology()
+    entry = _entry()
+    topology.add(entry)
+    document, content_hash = topology.document(), topology.content_hash()
+
+    assert json.loads(document) == {"topologies": [{"id": entry.topology, "bidirectionalPorts": [entry.nml()]}]}
+    topology.add(entry._replace())
+    assert topology._document is document
+    assert topology.content_hash() == content_hash
+
+    topology.add(entry._replace(vlanrange="100-120"))
+    assert topology._document is None
+    assert topology.content_hash() != content_hash
+
+    topology.remove(uuid4())
+    assert topology._document is not None
+    topology.remove(entry.subscription_id)
+    assert topology.document() == '{"topologies":[]}'
+
+
+def test_document_groups_by_topology_and_sorts_by_stp_id():
+    topology = NsiTopology()
+    entries = [_entry("b"), _entry("a"), _entry("c", topology="other.nl:2020:production")]
+    for entry in entries:
+        topology.add(entry)
+
+    document = json.loads(topology.document())
+
+    assert [item["id"] for item in document["topologies"]] == ["other.nl:2020:production", "surf.nl:2020:production"]
+    assert [port["id"] for port in document["topologies"][1]["bidirectionalPorts"]] == ["a", "b"]
+
+
+@pytest.fixture
+def stps(monkeypatch):
+    """Four NSISTP subscriptions: exposed, not exposed, without a SAP and without a topology."""
+    rows = [SimpleNamespace(subscription_id=uuid4(), subscription_instance_id=uuid4(), tag="NSISTP") for _ in range(4)]
+    saps = [uuid4(), uuid4(), None, uuid4()]
+    values = {
+        rows[0].subscription_instance_id: {"topology": "surf.nl", "stp_id": "stp-1", "expose_in_topology": "True"},
+        rows[1].subscription_instance_id: {"topology": "surf.nl", "stp_id": "stp-2", "expose_in_topology": "False"},
+        rows[2].subscription_instance_id: {"topology": "surf.nl", "stp_id": "stp-3", "expose_in_topology": "True"},
+        rows[3].subscription_instance_id: {"stp_id": "stp-4", "expose_in_topology": "True"},
+        **{sap_id: {"vlanrange": "12,10-11"} for sap_id in saps if sap_id},
+    }
+    relations = {(row.subscription_instance_id, "sap"): [sap_id] for row, sap_id in zip(rows, saps) if sap_id}
+    terminated = set()
+
+    def execute(stmt):
+        return SimpleNamespace(all=lambda: [row for row in rows if row.subscription_id not in terminated])
+
+    def related(instance_ids, attributes):
+        return defaultdict(list, {key: ids for key, ids in relations.items() if key[0] in instance_ids})
+
+    def instance_values(instance_ids, resource_types):
+        return defaultdict(dict, {key: values[key] for key in instance_ids if key in values})
+
+    def owners(instance_ids):
+        return {instance_id: Owner(uuid4(), f"SAP {instance_id}", "active") for instance_id in instance_ids}
+
+    monkeypatch.setattr(nsi_topology, "db", SimpleNamespace(session=SimpleNamespace(execute=execute)))
+    monkeypatch.setattr(nsi_topology, "related", related)
+    monkeypatch.setattr(nsi_topology, "instance_values", instance_values)
+    monkeypatch.setattr(nsi_topology, "owners", owners)
+    return SimpleNamespace(rows=rows, saps=saps, terminated=terminated)
+
+
+def test_load_stp_entries_leaves_out_unexposed_stps_and_stps_without_sap(stps):
+    entries = load_stp_entries()
+
+    assert [entry.subscription_id for entry in entries] == [stps.rows[0].subscription_id]
+    assert entries[0].vlanrange == "10-12"
+    assert entries[0].sap_description == f"SAP {stps.saps[0]}"
+    assert entries[0].title == f"NSISTP surf.nl stp-1 SAP {stps.saps[0]} VLAN 10-12"
+
+
+def test_refresh_subscription_removes_a_terminated_stp(stps):
+    topology = NsiTopology.from_db()
+    subscription_id = stps.rows[0].subscription_id
+    content_hash = topology.content_hash()
+    assert topology.get(subscription_id) is not None
+
+    topology.refresh_subscription(subscription_id)
+    assert topology.content_hash() == content_hash
+
+    stps.terminated.add(subscription_id)
+    topology.refresh_subscription(subscription_id)
+    assert topology.get(subscription_id) is None
+    assert len(topology) == 0
+    assert topology.content_hash() != content_hash
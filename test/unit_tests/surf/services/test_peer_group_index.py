@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+from surf.products.services import peer_group_index
+from surf.products.services.peer_group_index import PeerGroupIndex, PeerGroupMember
+
+
+def _member(group_id, group_subscription_id, ip_peer_subscription_id, name="GROUP", asn=64512):
+    return PeerGroupMember(
+        peer_group_instance_id=group_id,
+        peer_group_subscription_id=group_subscription_id,
+        peer_group_name=name,
+        ip_peer_subscription_id=ip_peer_subscription_id,
+        ip_peer_instance_id=uuid4(),
+        peer_name="peer",
+        asn=asn,
+        subscription_instance_id=uuid4(),
+        ipv4_remote_address=None,
+        ipv6_remote_address=None,
+        bgp_session_priority=None,
+    )
+
+
+def test_refresh_ip_peer_subscription_replaces_its_peerings(monkeypatch):
+    index = PeerGroupIndex()
+    group_id, group_subscription_id, ip_peer = uuid4(), uuid4(), uuid4()
+    old = _member(group_id, group_subscription_id, ip_peer)
+    other = _member(group_id, group_subscription_id, uuid4(), asn=64513)
+    index.add(old)
+    index.add(other)
+    new = _member(group_id, group_subscription_id, ip_peer, asn=64514)
+    monkeypatch.setattr(peer_group_index, "load_peer_group_members", lambda subscription_ids: [new])
+
+    index.refresh_subscription(ip_peer)
+
+    assert index.members(group_id) == [other, new]
+
+
+def test_refresh_peer_group_subscription_reloads_its_members(monkeypatch):
+    index = PeerGroupIndex()
+    group_id, group_subscription_id, other_group_id = uuid4(), uuid4(), uuid4()
+    members = [_member(group_id, group_subscription_id, uuid4(), asn=64512 + asn) for asn in range(3)]
+    untouched = _member(other_group_id, uuid4(), uuid4(), name="OTHER")
+    for member in [*members, untouched]:
+        index.add(member)
+    # The group was renamed, and the peering of the last IP peer was removed
+    renamed = [member._replace(peer_group_name="RENAMED") for member in members[:-1]]
+    requested = []
+
+    def load(subscription_ids):
+        requested.append(set(subscription_ids))
+        return renamed
+
+    monkeypatch.setattr(peer_group_index, "load_peer_group_members", load)
+
+    index.refresh_subscription(group_subscription_id)
+
+    assert requested == [{group_subscription_id, *(member.ip_peer_subscription_id for member in members)}]
+    assert index.members(group_id) == renamed
+    assert index.members(other_group_id) == [untouched]
+    assert len(index) == 3
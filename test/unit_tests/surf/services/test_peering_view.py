@@ -0,0 +1,101 @@
+from collections import defaultdict
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from orchestrator.utils.vlans import VlanRanges
+
+from surf.products.product_blocks import peer
+from surf.products.product_blocks.ip_peer import IpPeerBlockProvisioning
+from surf.products.product_blocks.peer import PeerBlockProvisioning
+from surf.products.services import peering_view
+from surf.products.services.projection import Owner
+
+IP_PEER_SUBSCRIPTION, IP_PEER = uuid4(), uuid4()
+PEERS = [uuid4(), uuid4()]
+PORTS = [uuid4(), uuid4()]
+SAPS = [uuid4(), uuid4()]
+GROUP = uuid4()
+
+RELATIONS = {
+    (IP_PEER, "peers"): PEERS,
+    (PEERS[0], "port"): [PORTS[0]],
+    (PEERS[0], "peer_group"): [GROUP],
+    (PEERS[1], "port"): [PORTS[1]],
+    (PORTS[0], "sap"): [SAPS[0]],
+    (PORTS[1], "sap"): [SAPS[1]],
+}
+VALUES = {
+    IP_PEER: {"peer_name": "AMS-IX", "asn": "64512"},
+    PEERS[0]: {"ipv4_remote_address": "192.0.2.1", "ipv6_remote_address": "2001:db8::1", "bfd": "True"},
+    PEERS[1]: {"ipv4_remote_address": "192.0.2.2", "bfd": "False"},
+    PORTS[0]: {"peer_port_name": "ams-ix-1"},
+    SAPS[0]: {"vlanrange": "100-102,7"},
+    SAPS[1]: {"vlanrange": "200"},
+    GROUP: {"peer_group_name": "AMSIX-V4"},
+}
+OWNERS = {
+    instance_id: Owner(uuid4(), description, "active")
+    for instance_id, description in [
+        (PORTS[0], "Port 1"),
+        (PORTS[1], "Port 2"),
+        (SAPS[0], "L2VPN AMS-IX 1 "),
+        (SAPS[1], "L2VPN AMS-IX 2 "),
+    ]
+}
+
+
+@pytest.fixture
+def projection(monkeypatch):
+    row = SimpleNamespace(
+        subscription_id=IP_PEER_SUBSCRIPTION,
+        description="IP peer AMS-IX",
+        status="active",
+        tag="IP_PEER",
+        subscription_instance_id=IP_PEER,
+    )
+
+    def related(instance_ids, attributes):
+        return defaultdict(list, {key: ids for key, ids in RELATIONS.items() if key[0] in instance_ids})
+
+    def instance_values(instance_ids, resource_types):
+        return defaultdict(dict, {instance_id: VALUES[instance_id] for instance_id in set(instance_ids) & set(VALUES)})
+
+    def execute(stmt):
+        return SimpleNamespace(all=lambda: [row])
+
+    monkeypatch.setattr(peering_view, "db", SimpleNamespace(session=SimpleNamespace(execute=execute)))
+    monkeypatch.setattr(peering_view, "related", related)
+    monkeypatch.setattr(peering_view, "instance_values", instance_values)
+    monkeypatch.setattr(peering_view, "owners", lambda ids: {instance_id: OWNERS[instance_id] for instance_id in ids})
+
+
+def test_titles_and_summary(projection):
+    view = peering_view.load_ip_peer_views()[IP_PEER_SUBSCRIPTION]
+
+    assert view.title == "IP_PEER AMS-IX AS64512"
+    assert [peering.title for peering in view.peerings] == ["L2VPN AMS-IX 1 7,100-102", "L2VPN AMS-IX 2 200"]
+    assert view.summary() == (
+        "IP_PEER AMS-IX AS64512 (IP peer AMS-IX, active): 2 peerings\n"
+        "  L2VPN AMS-IX 1 7,100-102 AMSIX-V4 192.0.2.1 2001:db8::1 bfd\n"
+        "  L2VPN AMS-IX 2 200 None 192.0.2.2"
+    )
+    assert view.peerings[0].sap_subscription_id == OWNERS[SAPS[0]].subscription_id
+    assert view.peerings[1].peer_port_name is None
+
+
+def test_titles_match_the_product_blocks(projection, monkeypatch):
+    view = peering_view.load_ip_peer_views()[IP_PEER_SUBSCRIPTION]
+    descriptions = {OWNERS[sap_id].subscription_id: OWNERS[sap_id].description for sap_id in SAPS}
+    monkeypatch.setattr(
+        peer.SubscriptionModel,
+        "from_subscription",
+        classmethod(lambda cls, subscription_id: SimpleNamespace(description=descriptions[subscription_id])),
+    )
+
+    ip_peer_block = IpPeerBlockProvisioning.construct(tag="IP_PEER", peer_name="AMS-IX", asn=64512)
+    assert view.title == ip_peer_block.title
+    for peering, sap_id in zip(view.peerings, SAPS):
+        vlanrange = VlanRanges(VALUES[sap_id]["vlanrange"])
+        sap = SimpleNamespace(owner_subscription_id=OWNERS[sap_id].subscription_id, vlanrange=vlanrange)
+        assert peering.title == PeerBlockProvisioning.construct(port=SimpleNamespace(sap=sap)).title
@@ -0,0 +1,110 @@
+import random
+from ipaddress import ip_network
+from uuid import uuid4
+
+import pytest
+
+from surf.products.services.prefix_index import PrefixEntry, PrefixIndex
+
+
+def _entry(prefix, subscription_id=None):
+    return PrefixEntry(
+        subscription_id=subscription_id or uuid4(),
+        subscription_instance_id=uuid4(),
+        status="active",
+        ipam_prefix_id=0,
+        prefix=ip_network(prefix),
+        customer_aggregate=None,
+        planned=None,
+        parent_subscription_instance_id=None,
+    )
+
+
+def _index(*prefixes):
+    index = PrefixIndex()
+    for prefix in prefixes:
+        index.add(_entry(prefix))
+    return index
+
+
+def _prefixes(entries):
+    return [str(entry.prefix) for entry in entries]
+
+
+def test_hierarchy():
+    index = _index("145.100.0.0/16", "145.100.0.0/20", "145.100.1.0/24", "145.100.64.0/24", "2001:610::/32")
+
+    assert str(index.longest_match("145.100.1.10").prefix) == "145.100.1.0/24"
+    assert str(index.longest_match("145.100.2.10").prefix) == "145.100.0.0/20"
+    assert index.longest_match("10.0.0.1") is None
+    assert _prefixes(index.ancestors("145.100.1.0/24")) == ["145.100.0.0/16", "145.100.0.0/20"]
+    assert str(index.parent("145.100.1.128/25").prefix) == "145.100.1.0/24"
+    assert _prefixes(index.children("145.100.0.0/16")) == ["145.100.0.0/20", "145.100.64.0/24"]
+    assert _prefixes(index.descendants("145.100.0.0/16")) == ["145.100.0.0/20", "145.100.1.0/24", "145.100.64.0/24"]
+    assert str(index.longest_match("2001:610:1::1").prefix) == "2001:610::/32"
+    assert index.get("145.100.0.0/17") is None
+
+
+def test_free_and_first_free():
+    index = _index("10.0.0.0/8", "10.0.0.0/24", "10.0.2.0/23")
+
+    assert [str(network) for network in index.free("10.0.0.0/22")] == ["10.0.1.0/24"]
+    assert str(index.first_free("10.0.0.0/22", 25)) == "10.0.1.0/25"
+    assert index.first_free("10.0.0.0/22", 23) is None
+    assert str(index.first_free("10.0.0.0/8", 16)) == "10.1.0.0/16"
+
+
+def test_add_rejects_prefix_of_other_subscription():
+    index = _index("10.0.0.0/24")
+    with pytest.raises(ValueError, match="already used"):
+        index.add(_entry("10.0.0.0/24"))
+
+
+def test_remove_keeps_the_others():
+    entries = [_entry(prefix) for prefix in ("10.0.0.0/16", "10.0.0.0/24", "10.0.1.0/24", "10.0.0.0/25")]
+    index = PrefixIndex()
+    for entry in entries:
+        index.add(entry)
+
+    index.remove(entries[1].subscription_instance_id)
+
+    assert index.get("10.0.0.0/24") is None
+    assert _prefixes(index.children("10.0.0.0/16")) == ["10.0.0.0/25", "10.0.1.0/24"]
+    assert len(index) == 3
+
+
+@pytest.mark.parametrize("version", [4, 6])
+def test_matches_brute_force(version):
+    rnd = random.Random(version)
+    bits = 32 if version == 4 else 128
+    base = int(ip_network("10.0.0.0/8" if version == 4 else "2001:db8::/32").network_address)
+    top = 8 if version == 4 else 32
+
+    def random_prefix():
+        length = rnd.randint(top, top + 16)
+        value = base | rnd.getrandbits(length - top) << (bits - length)
+        return ip_network((value, length))
+
+    prefixes = list({random_prefix() for _ in range(300)})
+    index = PrefixIndex()
+    entries = {prefix: _entry(prefix) for prefix in prefixes}
+    for entry in entries.values():
+        index.add(entry)
+    # Remove a third again
+    for prefix in prefixes[::3]:
+        index.remove(entries.pop(prefix).subscription_instance_id)
+    assert len(index) == len(entries)
+
+    for query in [random_prefix() for _ in range(200)]:
+        containing = sorted((p for p in entries if query.subnet_of(p)), key=lambda p: p.prefixlen)
+        inside = sorted(
+            (p for p in entries if p.subnet_of(query) and p != query), key=lambda p: (p.network_address, p.prefixlen)
+        )
+        direct = [p for p in inside if not any(p.subnet_of(other) and p != other for other in inside)]
+
+        assert [entry.prefix for entry in index.ancestors(query)] == [p for p in containing if p != query]
+        match = index.longest_match(query)
+        assert (match.prefix if match else None) == (containing[-1] if containing else None)
+        assert [entry.prefix for entry in index.descendants(query)] == inside
+        assert [entry.prefix for entry in index.children(query)] == direct
+        assert (index.get(query) is not None) == (query in entries)
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from surf.products.services import preload
+
+
+def _subscription(*block_names):
+    return SimpleNamespace(
+        product=SimpleNamespace(name="product"),
+        instances=[SimpleNamespace(product_block=SimpleNamespace(name=name)) for name in block_names],
+    )
+
+
+def test_load_fws_rejects_other_subscriptions(monkeypatch):
+    subscriptions = {uuid4(): _subscription("FW", "FW L3 Endpoint"), uuid4(): _subscription("SN8 L2VPN Virtual Circuit")}
+    monkeypatch.setattr(preload, "preload_subscriptions", lambda subscription_ids: subscriptions)
+
+    with pytest.raises(ValueError, match="is not a Fw subscription"):
+        preload.load_fws(subscriptions)
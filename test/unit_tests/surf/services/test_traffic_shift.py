@@ -0,0 +1,66 @@
+from collections import defaultdict
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from surf.products.product_types.fixed_input_types import ProtectionType
+from surf.products.services import traffic_shift
+from surf.products.services.traffic_shift import ServiceDemand, demand_matrix, left_out_circuits
+
+
+def test_left_out_circuits(monkeypatch):
+    primary, protection, internal, plain = uuid4(), uuid4(), uuid4(), uuid4()
+    redundant_first, redundant_second = uuid4(), uuid4()
+    protected_settings, redundant_settings, endpoint = uuid4(), uuid4(), uuid4()
+    uses = {
+        (primary, "vcs"): [protected_settings],
+        (protection, "vcs"): [protected_settings],
+        (redundant_first, "vcs"): [redundant_settings],
+        (redundant_second, "vcs"): [redundant_settings],
+        (internal, "l2vpn_internal"): [endpoint],
+    }
+    vcs = {
+        (protected_settings, "vcs"): [primary, protection],
+        (redundant_settings, "vcs"): [redundant_first, redundant_second],
+    }
+    protection_types = {protected_settings: ProtectionType.PROTECTED, redundant_settings: ProtectionType.REDUNDANT}
+
+    def used_by(instance_ids, attributes):
+        return defaultdict(list, {key: ids for key, ids in uses.items() if key[0] in instance_ids})
+
+    def related(instance_ids, attributes):
+        return defaultdict(list, {key: ids for key, ids in vcs.items() if key[0] in instance_ids})
+
+    monkeypatch.setattr(traffic_shift, "used_by", used_by)
+    monkeypatch.setattr(traffic_shift, "related", related)
+    monkeypatch.setattr(
+        traffic_shift,
+        "load_protection_types",
+        lambda instance_ids: {key: value for key, value in protection_types.items() if key in instance_ids},
+    )
+
+    circuits = [primary, protection, redundant_first, redundant_second, internal, plain]
+    assert left_out_circuits(circuits) == {protection, internal}
+    # Only the protection virtual circuit of a Protected light path is left out, also when asked for on its own
+    assert left_out_circuits([protection]) == {protection}
+    assert left_out_circuits([primary]) == set()
+    # Both virtual circuits of a Redundant light path carry traffic
+    assert left_out_circuits([redundant_second]) == set()
+
+
+def test_demand_matrix_spreads_the_speed_over_the_endpoints():
+    nodes = [UUID(int=index) for index in range(1, 5)]
+    services = [
+        ServiceDemand(uuid4(), "light path", 10, (nodes[0], nodes[1])),
+        ServiceDemand(uuid4(), "l2vpn", 30, (nodes[0], nodes[1], nodes[2])),
+        # One node, and a node without corelinks
+        ServiceDemand(uuid4(), "local", 100, (nodes[3],)),
+        ServiceDemand(uuid4(), "elsewhere", 100, (nodes[3], UUID(int=99))),
+    ]
+
+    demands = demand_matrix(services, nodes)
+
+    expected = np.zeros((4, 4))
+    expected[0, 1] = expected[1, 0] = 10 + 15
+    expected[0, 2] = expected[2, 0] = expected[1, 2] = expected[2, 1] = 15
+    assert np.array_equal(demands, expected)
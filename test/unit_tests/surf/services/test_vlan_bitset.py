@@ -0,0 +1,57 @@
+import random
+
+import pytest
+from orchestrator.utils.vlans import VlanRanges
+
+from surf.products.services.vlan_bitset import VlanBitset
+
+
+@pytest.mark.parametrize("value", ["", "4", "4,10-14", " 3, 4, 6-9, 4, 8 - 10", "0-4096", "14-10"])
+def test_parse_matches_vlan_ranges(value):
+    bitset = VlanBitset.parse(value)
+    assert str(bitset) == str(VlanRanges(value))
+    assert bitset.to_vlan_ranges() == VlanRanges(value)
+    assert VlanBitset.of(VlanRanges(value)) == bitset
+
+
+@pytest.mark.parametrize("value", ["4,x", "1-2-3", "4097", "-1"])
+def test_parse_rejects_what_vlan_ranges_rejects(value):
+    with pytest.raises(ValueError):
+        VlanRanges(value)
+    with pytest.raises(ValueError):
+        VlanBitset.parse(value)
+
+
+def test_parse_error_keeps_its_cause():
+    with pytest.raises(ValueError) as exc_info:
+        VlanBitset.parse("4,x")
+    assert isinstance(exc_info.value.__cause__, ValueError)
+
+
+def test_set_operations_match_vlan_ranges():
+    rnd = random.Random(0)
+    for _ in range(50):
+        first, second = (
+            ",".join(f"{start}-{start + rnd.randint(0, 40)}" for start in rnd.sample(range(1, 4000), 5))
+            for _ in range(2)
+        )
+        a, b = VlanBitset.parse(first), VlanBitset.parse(second)
+        ranges_a, ranges_b = VlanRanges(first), VlanRanges(second)
+        assert str(a | b) == str(ranges_a | ranges_b)
+        assert str(a & b) == str(ranges_a & ranges_b)
+        assert str(a - b) == str(ranges_a - ranges_b)
+        assert str(a ^ b) == str(ranges_a ^ ranges_b)
+        assert a.isdisjoint(b) == ranges_a.isdisjoint(ranges_b)
+        assert len(a) == len(ranges_a)
+        assert list(a) == list(ranges_a)
+
+
+def test_union_of_and_first_free_run():
+    used = VlanBitset.union_of(["2-10", VlanRanges("12-20"), None, VlanBitset.parse("23")])
+    free = VlanBitset.range(2, 4094) - used
+
+    assert free.first_free_run() == 11
+    assert free.first_free_run(2) == 21
+    assert free.first_free_run(3) == 24
+    assert free.first_free_run(3, within=VlanBitset.range(100, 101)) is None
+    assert 11 in free and 12 not in free and -1 not in free